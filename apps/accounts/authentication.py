@@ -0,0 +1,128 @@
+"""
+Cached JWT user resolution shared by the HTTP and WebSocket auth paths.
+
+The user behind an access token is cached for a short time under its
+``user_id`` and ``jti``. Deactivating or deleting a user writes a revocation
+marker that is read in the same round trip as the entry, so every cached
+entry of that user stops being used at once.
+"""
+import logging
+
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.core.constants import (
+    CACHE_KEY_TOKEN_USER,
+    CACHE_KEY_TOKEN_USER_REVOKED,
+    CACHE_TIMEOUT_TOKEN_USER,
+)
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+def _token_user_keys(validated_token):
+    """
+    Get the entry and revocation keys of a token, or None if it has no jti.
+    """
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    if user_id is None or jti is None:
+        return None
+
+    return (
+        CACHE_KEY_TOKEN_USER.format(user_id=user_id, jti=jti),
+        CACHE_KEY_TOKEN_USER_REVOKED.format(user_id=user_id),
+    )
+
+
+def get_cached_token_user(validated_token):
+    """
+    Get the cached user of a validated token.
+
+    Returns:
+        User instance, or None on a miss or after the user was revoked
+    """
+    keys = _token_user_keys(validated_token)
+    if keys is None:
+        return None
+
+    key, revoked_key = keys
+    values = cache.get_many([key, revoked_key])
+    if revoked_key in values:
+        return None
+    return values.get(key)
+
+
+def cache_token_user(validated_token, user):
+    """
+    Cache the active user of a validated token.
+    """
+    keys = _token_user_keys(validated_token)
+    if keys is None or not user.is_active:
+        return
+
+    cache.set(keys[0], user, CACHE_TIMEOUT_TOKEN_USER)
+
+
+def revoke_token_users(user_id):
+    """
+    Stop using every cached token entry of a user.
+
+    The marker outlives the entries it supersedes, after which a fresh
+    lookup caches the user again.
+
+    Args:
+        user_id: ID of the user
+    """
+    cache.set(CACHE_KEY_TOKEN_USER_REVOKED.format(user_id=user_id), True, CACHE_TIMEOUT_TOKEN_USER)
+
+
+def _get_active_user(user_id):
+    """
+    Get an active user by ID from the database.
+    """
+    return User.objects.filter(id=user_id, is_active=True).first()
+
+
+async def aget_token_user(validated_token):
+    """
+    Resolve the active user of a validated token from async code.
+
+    The database is only reached on a cache miss.
+
+    Returns:
+        User instance or None if not found or inactive
+    """
+    keys = _token_user_keys(validated_token)
+    if keys is not None:
+        key, revoked_key = keys
+        values = await cache.aget_many([key, revoked_key])
+        if revoked_key not in values and key in values:
+            return values[key]
+
+    user = await database_sync_to_async(_get_active_user)(validated_token[api_settings.USER_ID_CLAIM])
+    if user is not None and keys is not None:
+        await cache.aset(keys[0], user, CACHE_TIMEOUT_TOKEN_USER)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that caches the user of each access token.
+    """
+
+    def get_user(self, validated_token):
+        """
+        Get the user of a validated token, from the cache when possible.
+        """
+        user = get_cached_token_user(validated_token)
+        if user is not None:
+            return user
+
+        user = super().get_user(validated_token)
+        cache_token_user(validated_token, user)
+        return user
@@ -1,9 +1,10 @@
 """
 Signals for the accounts app.
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .authentication import revoke_token_users
 from .models import Profile, User
 
 
@@ -26,4 +27,35 @@ def save_user_profile(sender, instance, **kwargs):
     else:
         # Create profile if it doesn't exist
         Profile.objects.create(user=instance)
-        
\ No newline at end of file
+        
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user_tokens(sender, instance, created, **kwargs):
+    """
+    Stop serving cached token users once a user changes.
+
+    Cached users carry their name, email, permissions and active flag, so any
+    save of an existing user makes them stale.
+    """
+    if not created:
+        revoke_token_users(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def revoke_changed_profile_tokens(sender, instance, created, **kwargs):
+    """
+    Stop serving cached token users once their profile changes.
+
+    Cached users keep the profile they were loaded with.
+    """
+    if not created:
+        revoke_token_users(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    """
+    Stop serving cached token users once a user is deleted.
+    """
+    revoke_token_users(instance.pk)
@@ -1,12 +1,22 @@
 """
 Pagination classes for DZ Bus Tracker API.
 """
+import json
+import uuid
+from base64 import b64decode, b64encode
+
+from django.db.models import F
+from django.db.models.fields.tuple_lookups import Tuple, TupleGreaterThan, TupleLessThan
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import (
-    PageNumberPagination,
-    LimitOffsetPagination,
+    BasePagination,
     CursorPagination,
+    LimitOffsetPagination,
+    PageNumberPagination,
 )
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -112,4 +122,164 @@ class StandardLimitOffsetPagination(LimitOffsetPagination):
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data,
-        })
\ No newline at end of file
+        })
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination on ``(created_at, id)``, newest first.
+
+    Each page is selected with a row comparison against the last row of the
+    previous one, so any page costs the same index range scan as the first
+    and no ``COUNT(*)`` runs unless ``include_count=true`` is passed. The
+    ``id`` tiebreaker keeps rows sharing a timestamp from being skipped.
+
+    Accepts ``limit`` as an alias for ``page_size`` for older clients.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    page_size_alias_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'include_count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return the rows of the requested page.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('true', '1', 'yes'):
+            self.count = queryset.count()
+
+        if position is not None:
+            lookup = TupleGreaterThan if reverse else TupleLessThan
+            queryset = queryset.filter(lookup(Tuple(F('created_at'), F('id')), position))
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_previous = has_more
+            self.has_next = bool(rows)
+        else:
+            self.has_previous = position is not None and bool(rows)
+            self.has_next = has_more
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        """
+        Get the page size from ``page_size`` or ``limit``.
+        """
+        for param in (self.page_size_query_param, self.page_size_alias_query_param):
+            try:
+                page_size = int(request.query_params[param])
+            except (KeyError, ValueError):
+                continue
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        return self.page_size
+
+    def decode_cursor(self, request):
+        """
+        Decode the cursor query parameter.
+
+        Returns:
+            Tuple of (reverse, (created_at, id)), or (False, None) without a cursor
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            created_at = parse_datetime(data['c'])
+            if created_at is None:
+                raise ValueError(data['c'])
+            return bool(data.get('r')), (created_at, uuid.UUID(data['i']))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse=False):
+        """
+        Build the URL pointing past (or before) a row.
+        """
+        data = {'c': instance.created_at.isoformat(), 'i': str(instance.id)}
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        """
+        Return a paginated response, with ``count`` only when requested.
+        """
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the exact total number of results.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
@@ -3,14 +3,94 @@ Base serializers for DZ Bus Tracker API.
 """
 from rest_framework import serializers
 
+EXPAND_PREFIX = 'expand_'
+EXPAND_TRUE_VALUES = ('true', '1', 'yes')
+
+
+def get_expanded_fields(request):
+    """
+    Get the names requested with ``expand_<name>=true``.
+
+    The query string is parsed once per request and kept on it.
+
+    Args:
+        request: DRF request or None
+
+    Returns:
+        Frozenset of expanded names (without the ``expand_`` prefix)
+    """
+    if request is None:
+        return frozenset()
+
+    expanded = getattr(request, '_expanded_fields', None)
+    if expanded is None:
+        expanded = frozenset(
+            key[len(EXPAND_PREFIX):]
+            for key, value in request.query_params.items()
+            if key.startswith(EXPAND_PREFIX) and value.lower() in EXPAND_TRUE_VALUES
+        )
+        request._expanded_fields = expanded
+
+    return expanded
+
 
 class BaseSerializer(serializers.ModelSerializer):
     """
     Base serializer with common functionality.
+
+    Serializers declare the relations they read so views can load them
+    up front:
+
+    - ``select_related_fields`` / ``prefetch_related_fields`` are needed for
+      every row.
+    - ``expansions`` maps an ``expand_<name>`` parameter to a dict with
+      ``select_related`` and/or ``prefetch_related`` lookups needed only when
+      it is set. Prefetch lookups may be callables returning ``Prefetch``
+      objects, so each request gets a fresh queryset.
     """
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    expansions = {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None):
+        """
+        Add the select/prefetch lookups this serializer needs for a request.
+
+        Args:
+            queryset: Queryset of the serializer's model
+            request: Current request, used for ``expand_*`` parameters
+
+        Returns:
+            Queryset with the related lookups applied
+        """
+        select_related = list(cls.select_related_fields)
+        prefetch_related = list(cls.prefetch_related_fields)
+
+        expanded = get_expanded_fields(request)
+        for name, lookups in cls.expansions.items():
+            if name in expanded:
+                select_related.extend(lookups.get('select_related', ()))
+                prefetch_related.extend(lookups.get('prefetch_related', ()))
+
+        if select_related:
+            queryset = queryset.select_related(*dict.fromkeys(select_related))
+        if prefetch_related:
+            queryset = queryset.prefetch_related(
+                *[lookup() if callable(lookup) else lookup for lookup in prefetch_related]
+            )
+
+        return queryset
+
+    def is_expanded(self, name):
+        """
+        Check whether ``expand_<name>`` is set on the current request.
+        """
+        return name in get_expanded_fields(self.context.get('request'))
+
     def validate(self, attrs):
         """
         Common validation logic for all serializers.
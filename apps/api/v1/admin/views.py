@@ -7,19 +7,21 @@ Endpoints:
   GET /api/v1/admin/stats/ridership/    ?line=&date_from=&date_to=
   GET /api/v1/admin/stats/lines/        summary stats per line
   GET /api/v1/admin/stats/stops/busiest/  top-N busiest stops
+
+Statistics are read from the daily tracking rollups (``apps.tracking.rollups``);
+days that are not rolled up yet are aggregated from the raw tables.
 """
+from collections import defaultdict
 from datetime import date, timedelta
 
-from django.db.models import Avg, Count, F, Sum, Q
-from django.db.models.functions import TruncDate
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from apps.core.permissions import IsAdmin
-from apps.tracking.models import Trip, LocationUpdate, WaitingCountReport
 from apps.lines.models import Line, Stop
+from apps.tracking.rollups import get_stop_rollups, get_trip_rollups, total_trip_rollups
 
 
 class RidershipStatsView(APIView):
@@ -35,7 +37,7 @@ class RidershipStatsView(APIView):
 
     def get(self, request):
         # --- Parse date range ---
-        today = timezone.now().date()
+        today = timezone.localdate()
         date_from_str = request.query_params.get('date_from')
         date_to_str = request.query_params.get('date_to')
 
@@ -54,35 +56,29 @@ class RidershipStatsView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        trips_qs = Trip.objects.filter(
-            start_time__date__gte=date_from,
-            start_time__date__lte=date_to,
-        )
-
         line_id = request.query_params.get('line')
-        if line_id:
-            trips_qs = trips_qs.filter(line_id=line_id)
+        by_date = total_trip_rollups(
+            get_trip_rollups(date_from, date_to, line_id=line_id),
+            key=lambda row: row.date,
+        )
 
         # Daily ridership: proxy is max_passengers per trip, summed per day
-        daily = (
-            trips_qs
-            .annotate(trip_date=TruncDate('start_time'))
-            .values('trip_date')
-            .annotate(
-                total_trips=Count('id'),
-                total_passengers=Sum('max_passengers'),
-                avg_occupancy=Avg(
-                    F('max_passengers') * 1.0
-                ),
-            )
-            .order_by('trip_date')
-        )
+        daily = [
+            {
+                'trip_date': trip_date,
+                'total_trips': totals['trip_count'],
+                'total_passengers': totals['total_passengers'],
+                'avg_occupancy': totals['total_passengers'] / totals['trip_count'],
+            }
+            for trip_date, totals in sorted(by_date.items())
+            if totals['trip_count']
+        ]
 
         return Response({
             'date_from': date_from.isoformat(),
             'date_to': date_to.isoformat(),
             'line': line_id,
-            'daily': list(daily),
+            'daily': daily,
         })
 
 
@@ -90,15 +86,15 @@ class LineStatsView(APIView):
     """
     GET /api/v1/admin/stats/lines/
 
-    Returns per-line summary: trip count, average occupancy, average trip
-    duration (minutes), total passengers.
+    Returns per-line summary of completed trips, read from the daily trip
+    rollups: trip count, average occupancy, average speed, total passengers.
     """
     permission_classes = [IsAdmin]
 
     def get(self, request):
         date_from_str = request.query_params.get('date_from')
         date_to_str = request.query_params.get('date_to')
-        today = timezone.now().date()
+        today = timezone.localdate()
 
         try:
             date_from = date.fromisoformat(date_from_str) if date_from_str else today - timedelta(days=30)
@@ -109,29 +105,35 @@ class LineStatsView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        trips_qs = Trip.objects.filter(
-            start_time__date__gte=date_from,
-            start_time__date__lte=date_to,
-            is_completed=True,
-        ).select_related('line')
-
-        stats = (
-            trips_qs
-            .values('line__id', 'line__name', 'line__code')
-            .annotate(
-                total_trips=Count('id'),
-                total_passengers=Sum('max_passengers'),
-                avg_passengers=Avg('max_passengers'),
-                avg_speed_kmh=Avg('average_speed'),
-                total_distance_km=Sum('distance'),
-            )
-            .order_by('-total_trips')
+        by_line = total_trip_rollups(
+            get_trip_rollups(date_from, date_to),
+            key=lambda row: row.line_id,
+        )
+        lines = Line.objects.in_bulk(list(by_line))
+
+        stats = sorted(
+            (
+                {
+                    'line__id': line_id,
+                    'line__name': lines[line_id].name,
+                    'line__code': lines[line_id].code,
+                    'total_trips': totals['completed_trip_count'],
+                    'total_passengers': totals['completed_passengers'],
+                    'avg_passengers': totals['completed_passengers'] / totals['completed_trip_count'],
+                    'avg_speed_kmh': totals['completed_average_speed'],
+                    'total_distance_km': totals['completed_distance'],
+                }
+                for line_id, totals in by_line.items()
+                if totals['completed_trip_count'] and line_id in lines
+            ),
+            key=lambda line: line['total_trips'],
+            reverse=True,
         )
 
         return Response({
             'date_from': date_from.isoformat(),
             'date_to': date_to.isoformat(),
-            'lines': list(stats),
+            'lines': stats,
         })
 
 
@@ -143,12 +145,13 @@ class BusiestStopsView(APIView):
       top_n  (int, default 20) – number of stops to return
       date_from / date_to – same as ridership
 
-    Ranking by waiting-count reports submitted at each stop in the period.
+    Ranking by waiting-count reports submitted at each stop in the period,
+    read from the daily stop rollups.
     """
     permission_classes = [IsAdmin]
 
     def get(self, request):
-        today = timezone.now().date()
+        today = timezone.localdate()
         date_from_str = request.query_params.get('date_from')
         date_to_str = request.query_params.get('date_to')
         top_n_str = request.query_params.get('top_n', '20')
@@ -163,26 +166,31 @@ class BusiestStopsView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        reports_qs = WaitingCountReport.objects.filter(
-            created_at__date__gte=date_from,
-            created_at__date__lte=date_to,
-            stop__isnull=False,
-        )
-
-        top_stops = (
-            reports_qs
-            .values('stop__id', 'stop__name', 'stop__latitude', 'stop__longitude')
-            .annotate(
-                report_count=Count('id'),
-                avg_waiting=Avg('reported_count'),
-                total_waiting=Sum('reported_count'),
-            )
-            .order_by('-report_count')[:top_n]
-        )
+        by_stop = defaultdict(lambda: {'report_count': 0, 'total_waiting': 0})
+        for row in get_stop_rollups(date_from, date_to):
+            by_stop[row.stop_id]['report_count'] += row.report_count
+            by_stop[row.stop_id]['total_waiting'] += row.total_reported
+
+        ranked = sorted(by_stop.items(), key=lambda item: item[1]['report_count'], reverse=True)[:top_n]
+        stops = Stop.objects.in_bulk([stop_id for stop_id, _ in ranked])
+
+        top_stops = [
+            {
+                'stop__id': stop_id,
+                'stop__name': stops[stop_id].name,
+                'stop__latitude': stops[stop_id].latitude,
+                'stop__longitude': stops[stop_id].longitude,
+                'report_count': totals['report_count'],
+                'avg_waiting': totals['total_waiting'] / totals['report_count'],
+                'total_waiting': totals['total_waiting'],
+            }
+            for stop_id, totals in ranked
+            if stop_id in stops
+        ]
 
         return Response({
             'date_from': date_from.isoformat(),
             'date_to': date_to.isoformat(),
             'top_n': top_n,
-            'stops': list(top_stops),
+            'stops': top_stops,
         })
@@ -15,6 +15,10 @@ class BusSerializer(BaseSerializer):
     """
     driver_details = serializers.SerializerMethodField(read_only=True)
 
+    expansions = {
+        'driver': {'select_related': ('driver__user',)},
+    }
+
     class Meta:
         model = Bus
         fields = [
@@ -30,11 +34,8 @@ class BusSerializer(BaseSerializer):
         """
         Get driver details if expand_driver is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_driver', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return DriverSerializer(obj.driver).data
+        if self.is_expanded('driver'):
+            return DriverSerializer(obj.driver).data
         return None
 
 
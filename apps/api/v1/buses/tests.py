@@ -539,4 +539,42 @@ class BusesAPIIntegrationTestCase(BusesAPITestCase):
             reverse('bus-detail', kwargs={'pk': self.bus.pk}),
             {'description': 'Updated by owner'}
         )
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class NearbyBusesTestCase(BusesAPITestCase):
+    """Test cases for the nearby buses search."""
+    
+    def setUp(self):
+        """Record a current position for the test bus."""
+        super().setUp()
+        from apps.tracking.models import LocationUpdate
+        
+        LocationUpdate.objects.create(
+            bus=self.bus,
+            latitude=Decimal('36.7530'),
+            longitude=Decimal('3.0420')
+        )
+    
+    def test_get_nearby_buses_filters_by_radius(self):
+        """Test that only buses within the radius are returned, with position."""
+        from apps.buses.selectors import get_nearby_buses
+        
+        buses = get_nearby_buses(36.7528, 3.0424, radius_km=1)
+        self.assertEqual([bus.id for bus in buses], [self.bus.id])
+        self.assertLess(buses[0].distance, 0.1)
+        self.assertEqual(buses[0].current_location['latitude'], 36.753)
+        
+        self.assertEqual(get_nearby_buses(35.6971, -0.6308, radius_km=1), [])
+    
+    def test_nearby_endpoint(self):
+        """Test the nearby buses endpoint."""
+        self.authenticate(self.passenger_user)
+        
+        url = reverse('bus-nearby')
+        response = self.client.get(url, {'latitude': '36.7528', 'longitude': '3.0424'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertIn('location', response.data['results'][0])
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
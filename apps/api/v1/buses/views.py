@@ -8,7 +8,9 @@ from rest_framework.response import Response
 
 from apps.api.viewsets import BaseModelViewSet
 from apps.buses.models import Bus
+from apps.buses.selectors import get_nearby_buses
 from apps.buses.services import BusService
+from apps.core.mixins.views import NonAtomicReadsMixin
 from apps.core.permissions import IsAdmin, IsApprovedDriver, IsDriverOrAdmin
 
 from .filters import BusFilter
@@ -20,7 +22,7 @@ from .serializers import (
 )
 
 
-class BusViewSet(BaseModelViewSet):
+class BusViewSet(NonAtomicReadsMixin, BaseModelViewSet):
     """
     API endpoint for buses.
     """
@@ -68,6 +70,39 @@ class BusViewSet(BaseModelViewSet):
             return BusApproveSerializer
         return BusSerializer
 
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Get active buses near a location, nearest first.
+        """
+        latitude = request.query_params.get('latitude')
+        longitude = request.query_params.get('longitude')
+        radius = request.query_params.get('radius', 2.0)  # Default 2km
+        limit = request.query_params.get('limit', '50')
+
+        if not latitude or not longitude:
+            return Response(
+                {'detail': 'Latitude and longitude are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        buses = get_nearby_buses(
+            latitude=float(latitude),
+            longitude=float(longitude),
+            radius_km=float(radius),
+            limit=min(int(limit), 200) if limit.isdigit() else 50
+        )
+
+        results = BusSerializer(buses, many=True, context={'request': request}).data
+        for bus, data in zip(buses, results):
+            data['distance'] = bus.distance
+            data['location'] = bus.current_location
+
+        return Response({
+            'count': len(results),
+            'results': results,
+        })
+
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """
@@ -171,7 +206,7 @@ class BusViewSet(BaseModelViewSet):
             return Response({'detail': 'Tracking started'})
 
 
-class BusLocationViewSet(viewsets.ReadOnlyModelViewSet):
+class BusLocationViewSet(NonAtomicReadsMixin, viewsets.ReadOnlyModelViewSet):
     """Read-only view of bus location updates."""
     permission_classes = [IsAuthenticated]
 
@@ -52,6 +52,9 @@ class DriverSerializer(BaseSerializer):
     user_details = serializers.SerializerMethodField(read_only=True)
     full_name = serializers.SerializerMethodField(read_only=True)
 
+    # full_name reads the user for every row
+    select_related_fields = ('user',)
+
     class Meta:
         model = Driver
         fields = [
@@ -72,8 +75,7 @@ class DriverSerializer(BaseSerializer):
         """
         Get user details if expand_user is True.
         """
-        request = self.context.get('request')
-        if request and request.query_params.get('expand_user', '').lower() in ['true', '1', 'yes']:
+        if self.is_expanded('user'):
             return UserSerializer(obj.user).data
         return None
 
@@ -1,6 +1,7 @@
 """
 Serializers for the lines API.
 """
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from apps.api.serializers import BaseSerializer
@@ -22,6 +23,29 @@ class StopSerializer(BaseSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class NearbyStopSerializer(serializers.Serializer):
+    """
+    Read-only serializer for nearby stop results.
+
+    Same fields as ``StopSerializer`` plus ``distance`` (km), without model
+    field introspection so large result pages serialize in one cheap pass.
+    """
+    id = serializers.UUIDField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    latitude = serializers.DecimalField(max_digits=10, decimal_places=7, read_only=True)
+    longitude = serializers.DecimalField(max_digits=10, decimal_places=7, read_only=True)
+    address = serializers.CharField(read_only=True)
+    wilaya = serializers.CharField(read_only=True)
+    commune = serializers.CharField(read_only=True)
+    is_active = serializers.BooleanField(read_only=True)
+    description = serializers.CharField(read_only=True)
+    features = serializers.JSONField(read_only=True)
+    photo = serializers.ImageField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+    distance = serializers.FloatField(read_only=True)
+
+
 class StopCreateSerializer(BaseSerializer):
     """
     Serializer for creating stops.
@@ -52,6 +76,10 @@ class LineStopSerializer(BaseSerializer):
     """
     stop_details = serializers.SerializerMethodField(read_only=True)
 
+    expansions = {
+        'stop': {'select_related': ('stop',)},
+    }
+
     class Meta:
         model = LineStop
         fields = [
@@ -66,11 +94,8 @@ class LineStopSerializer(BaseSerializer):
         """
         Get stop details if expand_stop is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_stop', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return StopSerializer(obj.stop).data
+        if self.is_expanded('stop'):
+            return StopSerializer(obj.stop).data
         return None
 
 
@@ -118,6 +143,21 @@ class LineSerializer(BaseSerializer):
     stops = serializers.SerializerMethodField(read_only=True)
     schedules = serializers.SerializerMethodField(read_only=True)
 
+    expansions = {
+        'stops': {'prefetch_related': (
+            lambda: Prefetch(
+                'line_stops',
+                queryset=LineStop.objects.select_related('stop').order_by('order'),
+            ),
+        )},
+        'schedules': {'prefetch_related': (
+            lambda: Prefetch(
+                'schedules',
+                queryset=Schedule.objects.order_by('day_of_week', 'start_time'),
+            ),
+        )},
+    }
+
     class Meta:
         model = Line
         fields = [
@@ -132,16 +172,14 @@ class LineSerializer(BaseSerializer):
         """
         Get stops for this line if expand_stops is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_stops', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                line_stops = obj.line_stops.all().order_by('order')
-                return LineStopSerializer(
-                    line_stops,
-                    many=True,
-                    context=self.context
-                ).data
+        if self.is_expanded('stops'):
+            # Sort in Python so prefetched rows are reused
+            line_stops = sorted(obj.line_stops.all(), key=lambda line_stop: line_stop.order)
+            return LineStopSerializer(
+                line_stops,
+                many=True,
+                context=self.context
+            ).data
         return None
 
     @extend_schema_field(list)
@@ -149,12 +187,13 @@ class LineSerializer(BaseSerializer):
         """
         Get schedules for this line if expand_schedules is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_schedules', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                schedules = obj.schedules.all().order_by('day_of_week', 'start_time')
-                return ScheduleSerializer(schedules, many=True).data
+        if self.is_expanded('schedules'):
+            # Sort in Python so prefetched rows are reused
+            schedules = sorted(
+                obj.schedules.all(),
+                key=lambda schedule: (schedule.day_of_week, schedule.start_time)
+            )
+            return ScheduleSerializer(schedules, many=True).data
         return None
 
 
@@ -7,8 +7,10 @@ from decimal import Decimal
 from io import BytesIO
 from PIL import Image
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.urls import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -784,4 +786,304 @@ class LinesAPIIntegrationTestCase(LinesAPITestCase):
         # Cannot create/modify anything
         for url in [line_url, stop_url, schedule_url]:
             response = self.client.post(url, {})
-            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class TimetableTestCase(LinesAPITestCase):
+    """Test cases for compiled timetables."""
+    
+    def test_compile_timetable_offsets_stops(self):
+        """Test that departures at later stops are offset by travel time."""
+        from apps.lines.services import TimetableService
+        
+        timetable = TimetableService.compile_timetable(self.line.id)
+        monday = timetable['days']['0']
+        
+        self.assertEqual(timetable['offsets'], [0, 300, 540])
+        self.assertEqual(len(monday[str(self.stop1.id)]), 65)
+        self.assertEqual(monday[str(self.stop2.id)][0], 6 * 3600 + 300)
+        self.assertEqual(monday[str(self.stop3.id)][-1], 22 * 3600 + 540)
+    
+    def test_next_departures(self):
+        """Test next-departure lookup within the day and across days."""
+        from datetime import datetime
+        from django.utils import timezone
+        from apps.lines.services import TimetableService
+        
+        monday_morning = timezone.make_aware(datetime(2024, 1, 1, 7, 2))
+        departures = TimetableService.get_next_departures(
+            self.line.id, self.stop2.id, after=monday_morning
+        )
+        self.assertEqual(
+            [timezone.localtime(d).strftime('%H:%M') for d in departures],
+            ['07:05', '07:20', '07:35']
+        )
+        
+        monday_night = timezone.make_aware(datetime(2024, 1, 1, 23, 0))
+        departures = TimetableService.get_next_departures(
+            self.line.id, self.stop2.id, after=monday_night, limit=1
+        )
+        self.assertEqual(
+            timezone.localtime(departures[0]),
+            timezone.make_aware(datetime(2024, 1, 8, 6, 5))
+        )
+    
+    def test_schedule_edit_invalidates_timetable(self):
+        """Test that editing a schedule through the API recompiles the timetable."""
+        from django.test import override_settings
+        from apps.lines.services import TimetableService
+        
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            monday = TimetableService.get_timetable(self.line.id)['days']['0']
+            self.assertEqual(len(monday[str(self.stop1.id)]), 65)
+            
+            self.authenticate(self.admin_user)
+            url = reverse('schedule-detail', kwargs={'pk': self.schedule.pk})
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(url, {'frequency_minutes': 30})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            
+            monday = TimetableService.get_timetable(self.line.id)['days']['0']
+            self.assertEqual(len(monday[str(self.stop1.id)]), 33)
+
+    def test_moving_stop_invalidates_timetable(self):
+        """Test that changing a stop's coordinates drops its lines' compiled timetables."""
+        from django.core.cache import cache
+        from django.test import override_settings
+        from apps.lines.services import StopService, TimetableService
+
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            TimetableService.get_timetable(self.line.id)
+            key = TimetableService.get_cache_key(self.line.id)
+            self.assertIsNotNone(cache.get(key))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                StopService.update_stop(self.stop2.id, latitude=36.7600)
+
+            self.assertIsNone(cache.get(key))
+
+    def test_next_departures_endpoint(self):
+        """Test the next departures endpoint."""
+        self.authenticate(self.passenger_user)
+        
+        url = reverse('line-next-departures', kwargs={'pk': self.line.id})
+        response = self.client.get(url, {'stop_id': str(self.stop3.id), 'limit': '2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(response.data['departures']), 2)
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NearbyStopsTestCase(LinesAPITestCase):
+    """Test cases for the nearby stops search."""
+    
+    def test_get_nearby_stops_filters_and_limits(self):
+        """Test that only stops within the radius are returned, nearest first."""
+        from apps.lines.selectors import get_nearby_stops
+        
+        with self.assertNumQueries(1):
+            stops = get_nearby_stops(36.7528, 3.0424, radius_km=1.5)
+        self.assertEqual([stop.id for stop in stops], [self.stop1.id, self.stop2.id])
+        
+        stops = get_nearby_stops(36.7528, 3.0424, radius_km=5, limit=1)
+        self.assertEqual([stop.id for stop in stops], [self.stop1.id])
+    
+    def test_get_nearby_stops_uses_postgis_when_enabled(self):
+        """Test that the PostGIS path keeps the KNN order from the database."""
+        from unittest.mock import patch
+        from django.test import override_settings
+        from apps.lines.selectors import get_nearby_stops
+        
+        rows = [(self.stop2.id, 0.2), (self.stop1.id, 0.9)]
+        with override_settings(USE_POSTGIS=True), \
+                patch('apps.lines.selectors.nearest_within', return_value=rows) as mock_nearest:
+            stops = get_nearby_stops(36.7600, 3.0500, radius_km=1, limit=5)
+        
+        mock_nearest.assert_called_once()
+        self.assertEqual([stop.id for stop in stops], [self.stop2.id, self.stop1.id])
+        self.assertEqual(stops[0].distance, 0.2)
+    
+    def test_nearby_endpoint(self):
+        """Test the nearby endpoint returns distances."""
+        self.authenticate(self.passenger_user)
+        
+        url = reverse('stop-nearby')
+        response = self.client.get(url, {'latitude': '36.7600', 'longitude': '3.0500', 'radius': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], str(self.stop2.id))
+        self.assertIn('distance', response.data['results'][0])
+    
+    def test_line_stop_coordinates_are_floats(self):
+        """Test that the hot-path coordinates are ordered floats matching the geodesic."""
+        from apps.core.utils.geo import calculate_distance, haversine_distance
+        from apps.lines.selectors import get_line_stop_coordinates
+        
+        with self.assertNumQueries(1):
+            coordinates = get_line_stop_coordinates(self.line.id)
+        
+        self.assertEqual([row[0] for row in coordinates], [self.stop1.id, self.stop2.id, self.stop3.id])
+        self.assertIsInstance(coordinates[0][1], float)
+        
+        (_, lat1, lon1), (_, lat2, lon2) = coordinates[:2]
+        self.assertAlmostEqual(
+            haversine_distance(lat1, lon1, lat2, lon2),
+            calculate_distance(lat1, lon1, lat2, lon2),
+            delta=0.01
+        )
+
+
+class LineTopologyTestCase(LinesAPITestCase):
+    """Test cases for the cached line topology."""
+    
+    def setUp(self):
+        super().setUp()
+        from apps.lines.topology import clear_local_topologies
+        clear_local_topologies()
+        self.addCleanup(clear_local_topologies)
+    
+    def test_topology_serves_line_selectors(self):
+        """Test that the selectors answer from the topology in route order."""
+        from apps.lines.selectors import get_next_stops, get_previous_stops, get_stop_distance
+        
+        with self.assertNumQueries(1):
+            distance = get_stop_distance(self.line.id, self.stop3.id, self.stop1.id)
+        self.assertEqual(distance, 4300.0)
+        
+        self.assertEqual(
+            [stop.id for stop in get_next_stops(self.line.id, self.stop1.id)],
+            [self.stop2.id, self.stop3.id]
+        )
+        self.assertEqual(
+            [stop.id for stop in get_previous_stops(self.line.id, self.stop3.id)],
+            [self.stop2.id, self.stop1.id]
+        )
+    
+    def test_topology_is_cached_until_bumped(self):
+        """Test that a topology is reused until a line mutation bumps its version."""
+        from django.test import override_settings
+        from apps.lines.services import LineService
+        from apps.lines.topology import get_line_topology
+        
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'topology'}}
+        with override_settings(CACHES=caches):
+            first = get_line_topology(self.line.id)
+            with self.assertNumQueries(0):
+                self.assertIs(get_line_topology(self.line.id), first)
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                LineService.remove_stop_from_line(self.line.id, self.stop2.id)
+            
+            topology = get_line_topology(self.line.id)
+        
+        self.assertNotEqual(topology.version, first.version)
+        self.assertEqual(list(topology.stop_ids), [self.stop1.id, self.stop3.id])
+
+
+class ResponseCacheTestCase(LinesAPITestCase):
+    """Test cases for cached line and stop responses."""
+    
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'responses'}}
+    
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import caches
+        from django.test import override_settings
+        
+        settings_override = override_settings(CACHES=self.caches)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(lambda: caches['default'].clear())
+    
+    def test_etag_and_not_modified(self):
+        """Test that a matching If-None-Match returns 304 from the cache."""
+        self.authenticate(self.passenger_user)
+        url = reverse('line-list')
+        
+        response = self.client.get(url + '?is_active=true&search=')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        
+        response = self.client.get(url + '?is_active=true', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_blank_parameters_share_cache_key(self):
+        """Test that blank query parameters are dropped from the cache key."""
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from apps.api.v1.lines.views import LineViewSet
+        
+        factory = APIRequestFactory()
+        view = LineViewSet(action='list')
+        
+        def key(query):
+            return view.get_response_cache_key(Request(factory.get(reverse('line-list') + query)))
+        
+        self.assertIsNotNone(key('?is_active=true'))
+        self.assertEqual(key('?is_active=true&search='), key('?is_active=true'))
+        self.assertNotEqual(key('?is_active=true&search=bus'), key('?is_active=true'))
+    
+    def test_service_write_bumps_version(self):
+        """Test that a committed write makes the next read miss the cache."""
+        from apps.lines.services import StopService
+        
+        self.authenticate(self.passenger_user)
+        url = reverse('stop-list')
+        
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            StopService.update_stop(self.stop1.id, name='Central Station East')
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Central Station East', [stop['name'] for stop in response.data['results']])
+
+
+class ExpansionQueryCountTestCase(LinesAPITestCase):
+    """Query-count regression tests for expand_* parameters."""
+    
+    def count_queries(self, url, params):
+        """Count the queries of a successful GET."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries.captured_queries)
+    
+    def add_lines(self):
+        """Add lines that share the existing stops and schedule windows."""
+        for index in range(3):
+            line = Line.objects.create(name=f'Line {index}', code=f'EX-{index}')
+            for order, stop in enumerate([self.stop1, self.stop2, self.stop3]):
+                LineStop.objects.create(line=line, stop=stop, order=order)
+            Schedule.objects.create(
+                line=line, day_of_week=1, start_time=time(6, 0),
+                end_time=time(20, 0), frequency_minutes=20
+            )
+    
+    def test_line_list_expansions(self):
+        """Test that expanded stops and schedules are prefetched for the page."""
+        self.authenticate(self.passenger_user)
+        url = reverse('line-list')
+        params = {'expand_stops': 'true', 'expand_stop': 'true', 'expand_schedules': 'true'}
+        
+        before = self.count_queries(url, params)
+        self.add_lines()
+        self.assertEqual(self.count_queries(url, params), before)
+        
+        response = self.client.get(url, params)
+        line = next(item for item in response.data['results'] if item['id'] == str(self.line.id))
+        self.assertEqual([item['order'] for item in line['stops']], [1, 2, 3])
+        self.assertEqual(line['stops'][0]['stop_details']['name'], 'Central Station')
+    
+    def test_line_stops_expansion(self):
+        """Test that the stops action selects the expanded stops."""
+        self.authenticate(self.passenger_user)
+        url = reverse('line-stops', kwargs={'pk': self.line.pk})
+        
+        before = self.count_queries(url, {'expand_stop': 'true'})
+        stop = Stop.objects.create(name='Extra', latitude=Decimal('36.7000'), longitude=Decimal('3.0000'))
+        LineStop.objects.create(line=self.line, stop=stop, order=4)
+        self.assertEqual(self.count_queries(url, {'expand_stop': 'true'}), before)
@@ -7,9 +7,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from apps.api.viewsets import BaseModelViewSet
+from apps.core.mixins.views import CacheMixin, NonAtomicReadsMixin
 from apps.core.permissions import IsAdmin, IsAdminOrReadOnly
 from apps.lines.models import Line, LineStop, Schedule, ServiceDisruption, Stop
-from apps.lines.services import LineService, ScheduleService, StopService
+from apps.lines.services import LineService, ScheduleService, StopService, TimetableService
 
 from .filters import LineFilter, ScheduleFilter, StopFilter
 from .serializers import (
@@ -18,6 +19,7 @@ from .serializers import (
     LineSerializer,
     LineStopSerializer,
     LineUpdateSerializer,
+    NearbyStopSerializer,
     RemoveStopFromLineSerializer,
     ScheduleCreateSerializer,
     ScheduleSerializer,
@@ -30,7 +32,7 @@ from .serializers import (
 )
 
 
-class StopViewSet(BaseModelViewSet):
+class StopViewSet(NonAtomicReadsMixin, CacheMixin, BaseModelViewSet):
     """
     API endpoint for stops.
     """
@@ -84,6 +86,7 @@ class StopViewSet(BaseModelViewSet):
         latitude = request.query_params.get('latitude')
         longitude = request.query_params.get('longitude')
         radius = request.query_params.get('radius', 0.5)  # Default 500m
+        limit = request.query_params.get('limit', '100')
 
         if not latitude or not longitude:
             return Response(
@@ -91,42 +94,32 @@ class StopViewSet(BaseModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get nearby stops
+        # Get nearby stops, already sorted by distance
         from apps.lines.selectors import get_nearby_stops
         stops = get_nearby_stops(
             latitude=float(latitude),
             longitude=float(longitude),
-            radius_km=float(radius)
+            radius_km=float(radius),
+            limit=min(int(limit), 500) if limit.isdigit() else 100
         )
 
-        # Sort by distance
-        sorted_stops = sorted(stops, key=lambda x: getattr(x, 'distance', float('inf')))
-
         # Apply pagination
-        page = self.paginate_queryset(sorted_stops)
+        page = self.paginate_queryset(stops)
         if page is not None:
-            response_data = []
-            for stop in page:
-                stop_data = StopSerializer(stop, context={'request': request}).data
-                stop_data['distance'] = getattr(stop, 'distance', None)
-                response_data.append(stop_data)
-            return self.get_paginated_response(response_data)
+            serializer = NearbyStopSerializer(page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
 
         # Build response data with paginated envelope (always)
-        response_data = []
-        for stop in sorted_stops:
-            stop_data = StopSerializer(stop, context={'request': request}).data
-            stop_data['distance'] = getattr(stop, 'distance', None)
-            response_data.append(stop_data)
+        serializer = NearbyStopSerializer(stops, many=True, context={'request': request})
         return Response({
-            'count': len(response_data),
+            'count': len(stops),
             'next': None,
             'previous': None,
-            'results': response_data,
+            'results': serializer.data,
         })
 
 
-class LineViewSet(BaseModelViewSet):
+class LineViewSet(NonAtomicReadsMixin, CacheMixin, BaseModelViewSet):
     """
     API endpoint for lines.
     """
@@ -134,12 +127,14 @@ class LineViewSet(BaseModelViewSet):
     serializer_class = LineSerializer
     filterset_class = LineFilter
     service_class = LineService
+    # Expanded lines embed their stops and schedules
+    cache_models = (Line, Stop, Schedule)
 
     def get_permissions(self):
         """
         Get permissions based on action.
         """
-        if self.action in ['list', 'retrieve', 'stops', 'schedules', 'journey']:
+        if self.action in ['list', 'retrieve', 'stops', 'schedules', 'journey', 'timetable', 'next_departures']:
             return [IsAuthenticated()]
         return [IsAdminOrReadOnly()]
 
@@ -169,7 +164,10 @@ class LineViewSet(BaseModelViewSet):
         line = self.get_object()
 
         # Get stops in order
-        line_stops = line.line_stops.all().order_by('order')
+        line_stops = self.setup_eager_loading(
+            line.line_stops.all().order_by('order'),
+            LineStopSerializer
+        )
 
         # Apply pagination
         page = self.paginate_queryset(line_stops)
@@ -262,6 +260,41 @@ class LineViewSet(BaseModelViewSet):
         serializer = ScheduleSerializer(schedules, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def timetable(self, request, pk=None):
+        """
+        Get the compiled timetable for this line.
+        """
+        line = self.get_object()
+        return Response(TimetableService.get_timetable(line.id))
+
+    @action(detail=True, methods=['get'])
+    def next_departures(self, request, pk=None):
+        """
+        Get the next scheduled departures of this line from a stop.
+        """
+        line = self.get_object()
+        stop_id = request.query_params.get('stop_id')
+        limit = request.query_params.get('limit', '3')
+
+        if not stop_id:
+            return Response(
+                {'detail': 'stop_id is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        departures = TimetableService.get_next_departures(
+            line.id,
+            stop_id,
+            limit=min(int(limit), 20) if limit.isdigit() else 3
+        )
+
+        return Response({
+            'line_id': str(line.id),
+            'stop_id': stop_id,
+            'departures': [departure.isoformat() for departure in departures],
+        })
+
     @action(detail=True, methods=['post'])
     def add_schedule(self, request, pk=None):
         """
@@ -357,7 +390,7 @@ class LineViewSet(BaseModelViewSet):
         })
 
 
-class ScheduleViewSet(BaseModelViewSet):
+class ScheduleViewSet(CacheMixin, BaseModelViewSet):
     """
     API endpoint for schedules.
     """
@@ -392,8 +425,32 @@ class ScheduleViewSet(BaseModelViewSet):
         # Order by day of week and start time
         return queryset.order_by('day_of_week', 'start_time')
 
+    def perform_create(self, serializer):
+        """
+        Create a schedule and drop its line's compiled timetable.
+        """
+        super().perform_create(serializer)
+        TimetableService.invalidate(serializer.instance.line_id)
+
+    def perform_update(self, serializer):
+        """
+        Update a schedule and drop the compiled timetables of its old and new line.
+        """
+        old_line_id = serializer.instance.line_id
+        super().perform_update(serializer)
+        for line_id in {old_line_id, serializer.instance.line_id}:
+            TimetableService.invalidate(line_id)
+
+    def perform_destroy(self, instance):
+        """
+        Delete a schedule and drop its line's compiled timetable.
+        """
+        line_id = instance.line_id
+        super().perform_destroy(instance)
+        TimetableService.invalidate(line_id)
+
 
-class ServiceDisruptionViewSet(BaseModelViewSet):
+class ServiceDisruptionViewSet(CacheMixin, BaseModelViewSet):
     """
     API endpoint for service disruptions on bus lines.
 
@@ -6,6 +6,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from apps.api.pagination import KeysetPagination
 from apps.api.viewsets import BaseModelViewSet
 from apps.core.permissions import IsAdmin, IsOwnerOrReadOnly
 from apps.notifications.models import DeviceToken, Notification
@@ -30,6 +31,7 @@ class NotificationViewSet(BaseModelViewSet):
     serializer_class = NotificationSerializer
     filterset_class = NotificationFilter
     service_class = NotificationService
+    pagination_class = KeysetPagination
 
     def get_permissions(self):
         """
@@ -1,15 +1,23 @@
 """
 Active buses view for real-time tracking.
 """
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
 from apps.tracking.models import BusLine
+from apps.tracking.selectors import get_fleet_snapshot
 from apps.buses.models import Bus
 from apps.api.v1.buses.serializers import BusSerializer
 
 
+@transaction.non_atomic_requests
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def active_buses(request):
@@ -92,4 +100,62 @@ def active_buses(request):
     return Response({
         'count': len(bus_data),
         'buses': bus_data,
-    })
\ No newline at end of file
+    })
+
+
+def _parse_since(value):
+    """
+    Parse ``since`` as epoch seconds or an ISO 8601 datetime.
+    """
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        pass
+
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+@transaction.non_atomic_requests
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def fleet_snapshot(request):
+    """
+    Get the position and load of every tracking bus, column-oriented.
+
+    Built for map clients that poll: each column is a list with one entry
+    per bus, and passing the previous response's ``timestamp`` as ``since``
+    returns only the buses that changed, plus the IDs of buses that stopped
+    tracking in ``removed``.
+
+    Query parameters:
+    - line_id: Only buses on this line
+    - since: Epoch seconds or ISO 8601 datetime of the last poll
+    """
+    since = request.query_params.get('since')
+    if since:
+        since = _parse_since(since)
+        if since is None:
+            return Response(
+                {'detail': 'Invalid since value'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    else:
+        since = None
+
+    # Taken before querying so nothing committed meanwhile is skipped next poll
+    now = timezone.now()
+    snapshot = get_fleet_snapshot(
+        line_id=request.query_params.get('line_id'),
+        since=since,
+    )
+
+    return Response({
+        'timestamp': now.timestamp(),
+        **snapshot,
+    })
@@ -0,0 +1,115 @@
+"""
+Async live-tracking read endpoints.
+
+These serve the hottest polling reads straight from the cached live state
+through the async Redis client. They are plain async Django views rather
+than DRF views, so they run on the ASGI event loop without a thread hop,
+and are marked non-atomic since they never touch the database.
+"""
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from apps.accounts.authentication import CachedJWTAuthentication, aget_token_user
+from apps.tracking.live_state import aget_active_buses, aget_live_state, aget_stop_arrivals
+
+
+async def _aget_request_user(request):
+    """
+    Resolve the user of the request's JWT, or None.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    return await aget_token_user(validated_token)
+
+
+def _unauthorized():
+    return JsonResponse(
+        {'detail': 'Authentication credentials were not provided.'},
+        status=status.HTTP_401_UNAUTHORIZED
+    )
+
+
+def _unavailable():
+    return JsonResponse(
+        {'detail': 'Live state is unavailable'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@transaction.non_atomic_requests
+@require_GET
+async def live_active_buses(request):
+    """
+    Get the live state of every tracking bus.
+
+    Query parameters:
+    - line_id: Only buses on this line
+    """
+    buses = await aget_active_buses(line_id=request.GET.get('line_id'))
+    if buses is None:
+        return _unavailable()
+
+    return JsonResponse({
+        'count': len(buses),
+        'buses': buses,
+        'timestamp': timezone.now().isoformat(),
+    })
+
+
+@transaction.non_atomic_requests
+@require_GET
+async def live_bus_location(request, bus_id):
+    """
+    Get the latest cached position and occupancy of a bus.
+    """
+    if await _aget_request_user(request) is None:
+        return _unauthorized()
+
+    state = (await aget_live_state(bus_ids=[bus_id])).get(str(bus_id))
+    if state is None or state['position'] is None:
+        return JsonResponse(
+            {'detail': 'No live location for this bus'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    return JsonResponse({
+        'bus_id': state['bus_id'],
+        'location': state['position'],
+        'occupancy': state['occupancy'],
+    })
+
+
+@transaction.non_atomic_requests
+@require_GET
+async def live_stop_arrivals(request, stop_id):
+    """
+    Get the buses heading to a stop, soonest first.
+
+    Query parameters:
+    - line_id: Only buses on this line
+    """
+    if await _aget_request_user(request) is None:
+        return _unauthorized()
+
+    arrivals = await aget_stop_arrivals(stop_id, line_id=request.GET.get('line_id'))
+    if arrivals is None:
+        return _unavailable()
+
+    return JsonResponse({
+        'stop_id': str(stop_id),
+        'count': len(arrivals),
+        'arrivals': arrivals,
+        'timestamp': timezone.now().isoformat(),
+    })
@@ -34,6 +34,11 @@ class BusLineSerializer(BaseSerializer):
     bus_details = serializers.SerializerMethodField(read_only=True)
     line_details = serializers.SerializerMethodField(read_only=True)
 
+    expansions = {
+        'bus': {'select_related': ('bus',)},
+        'line': {'select_related': ('line',)},
+    }
+
     class Meta:
         model = BusLine
         fields = [
@@ -48,11 +53,8 @@ class BusLineSerializer(BaseSerializer):
         """
         Get bus details if expand_bus is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_bus', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return BusSerializer(obj.bus).data
+        if self.is_expanded('bus'):
+            return BusSerializer(obj.bus).data
         return None
 
     @extend_schema_field(dict)
@@ -60,11 +62,8 @@ class BusLineSerializer(BaseSerializer):
         """
         Get line details if expand_line is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_line', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return LineSerializer(obj.line).data
+        if self.is_expanded('line'):
+            return LineSerializer(obj.line).data
         return None
 
 
@@ -141,6 +140,10 @@ class WaitingPassengersSerializer(BaseSerializer):
     """
     stop_details = serializers.SerializerMethodField(read_only=True)
 
+    expansions = {
+        'stop': {'select_related': ('stop',)},
+    }
+
     class Meta:
         model = WaitingPassengers
         fields = [
@@ -154,11 +157,8 @@ class WaitingPassengersSerializer(BaseSerializer):
         """
         Get stop details if expand_stop is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_stop', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return StopSerializer(obj.stop).data
+        if self.is_expanded('stop'):
+            return StopSerializer(obj.stop).data
         return None
 
 
@@ -179,6 +179,13 @@ class TripSerializer(BaseSerializer):
     driver_details = serializers.SerializerMethodField(read_only=True)
     line_details = serializers.SerializerMethodField(read_only=True)
 
+    expansions = {
+        'bus': {'select_related': ('bus',)},
+        # DriverSerializer reads the user for its full name
+        'driver': {'select_related': ('driver__user',)},
+        'line': {'select_related': ('line',)},
+    }
+
     class Meta:
         model = Trip
         fields = [
@@ -198,11 +205,8 @@ class TripSerializer(BaseSerializer):
         """
         Get bus details if expand_bus is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_bus', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return BusSerializer(obj.bus).data
+        if self.is_expanded('bus'):
+            return BusSerializer(obj.bus).data
         return None
 
     @extend_schema_field(dict)
@@ -210,11 +214,8 @@ class TripSerializer(BaseSerializer):
         """
         Get driver details if expand_driver is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_driver', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return DriverSerializer(obj.driver).data
+        if self.is_expanded('driver'):
+            return DriverSerializer(obj.driver).data
         return None
 
     @extend_schema_field(dict)
@@ -222,11 +223,8 @@ class TripSerializer(BaseSerializer):
         """
         Get line details if expand_line is True.
         """
-        request = self.context.get('request')
-        if request:
-            expand = request.query_params.get('expand_line', False)
-            if expand and expand.lower() in ['true', '1', 'yes']:
-                return LineSerializer(obj.line).data
+        if self.is_expanded('line'):
+            return LineSerializer(obj.line).data
         return None
 
 
@@ -335,6 +333,12 @@ class BusWaitingListSerializer(BaseSerializer):
     user_details = serializers.SerializerMethodField(read_only=True)
     waiting_duration = serializers.SerializerMethodField(read_only=True)
 
+    select_related_fields = ('user',)
+    expansions = {
+        'bus': {'select_related': ('bus',)},
+        'stop': {'select_related': ('stop',)},
+    }
+
     class Meta:
         model = BusWaitingList
         fields = [
@@ -348,16 +352,14 @@ class BusWaitingListSerializer(BaseSerializer):
     @extend_schema_field(dict)
     def get_bus_details(self, obj):
         """Get bus details if expand_bus is True."""
-        expand = self.context.get('request').query_params.get('expand_bus', False) if self.context.get('request') else False
-        if expand and expand.lower() in ['true', '1', 'yes']:
+        if self.is_expanded('bus'):
             return BusSerializer(obj.bus).data
         return None
 
     @extend_schema_field(dict)
     def get_stop_details(self, obj):
         """Get stop details if expand_stop is True."""
-        expand = self.context.get('request').query_params.get('expand_stop', False) if self.context.get('request') else False
-        if expand and expand.lower() in ['true', '1', 'yes']:
+        if self.is_expanded('stop'):
             return StopSerializer(obj.stop).data
         return None
 
@@ -423,6 +425,12 @@ class WaitingCountReportSerializer(BaseSerializer):
     bus_details = serializers.SerializerMethodField(read_only=True)
     distance_from_stop = serializers.SerializerMethodField(read_only=True)
 
+    # Reporter details and the distance are computed for every row
+    select_related_fields = ('reporter__reputation_score', 'stop')
+    expansions = {
+        'bus': {'select_related': ('bus',)},
+    }
+
     class Meta:
         model = WaitingCountReport
         fields = [
@@ -451,16 +459,14 @@ class WaitingCountReportSerializer(BaseSerializer):
     @extend_schema_field(dict)
     def get_stop_details(self, obj):
         """Get stop details if expand_stop is True."""
-        expand = self.context.get('request').query_params.get('expand_stop', False) if self.context.get('request') else False
-        if expand and expand.lower() in ['true', '1', 'yes']:
+        if self.is_expanded('stop'):
             return StopSerializer(obj.stop).data
         return None
 
     @extend_schema_field(dict)
     def get_bus_details(self, obj):
         """Get bus details if expand_bus is True."""
-        expand = self.context.get('request').query_params.get('expand_bus', False) if self.context.get('request') else False
-        if expand and expand.lower() in ['true', '1', 'yes']:
+        if self.is_expanded('bus'):
             return BusSerializer(obj.bus).data if obj.bus else None
         return None
 
@@ -1,25 +1,34 @@
 """
 Tests for tracking API endpoints.
 """
+import asyncio
 import uuid
 from datetime import datetime, time
 from decimal import Decimal
-from django.urls import reverse
-from django.test import TestCase
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.urls import resolve, reverse
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 from apps.accounts.models import User, Profile
 from apps.buses.models import Bus
 from apps.drivers.models import Driver
 from apps.lines.models import Line, Stop
 from apps.tracking.models import (
-    BusLine, LocationUpdate, PassengerCount, 
+    BusLine, BusWaitingList, LocationUpdate, PassengerCount, 
     WaitingPassengers, Trip, Anomaly
 )
+from apps.tracking.services import LocationUpdateService
+from apps.accounts.authentication import cache_token_user
 from apps.core.constants import (
+    CACHE_KEY_BUS_LOCATION,
     USER_TYPE_DRIVER, USER_TYPE_PASSENGER, 
     DRIVER_STATUS_APPROVED, BUS_STATUS_ACTIVE,
     BUS_TRACKING_STATUS_IDLE, BUS_TRACKING_STATUS_ACTIVE
@@ -310,6 +319,24 @@ class LocationUpdateViewSetTestCase(TrackingAPITestCase):
             latitude=Decimal('36.7550')
         ).exists())
     
+    def test_create_location_update_publishes_on_commit(self):
+        """Test that caching and broadcasting wait for the transaction to commit."""
+        self.authenticate(self.driver_user)
+        url = reverse('locationupdate-list')
+        data = {'bus': self.bus.pk, 'latitude': '36.7550', 'longitude': '3.0450'}
+        
+        with mock.patch.object(LocationUpdateService, '_publish_location') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(url, data)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            publish.assert_not_called()
+            
+            for callback in callbacks:
+                callback()
+        
+        self.assertEqual(publish.call_count, 1)
+        self.assertEqual(publish.call_args.args[0]['bus_id'], str(self.bus.pk))
+    
     def test_create_location_update_as_passenger(self):
         """Test creating location update as passenger."""
         self.authenticate(self.passenger_user)
@@ -357,6 +384,48 @@ class LocationUpdateViewSetTestCase(TrackingAPITestCase):
         for location in response.data['results']:
             self.assertEqual(location['line'], str(self.line.pk))
 
+    def test_list_location_updates_keyset_pages(self):
+        """Test walking location updates with cursors, including timestamp ties."""
+        created_at = timezone.now()
+        for index in range(4):
+            LocationUpdate.objects.create(
+                bus=self.bus,
+                latitude=Decimal('36.7528'),
+                longitude=Decimal('3.0424') + Decimal(index) / 1000,
+                line=self.line
+            )
+        LocationUpdate.objects.filter(bus=self.bus).update(created_at=created_at)
+        expected = {str(pk) for pk in LocationUpdate.objects.filter(bus=self.bus).values_list('id', flat=True)}
+
+        self.authenticate(self.passenger_user)
+        response = self.client.get(
+            reverse('locationupdate-list'),
+            {'bus': self.bus.pk, 'page_size': 2, 'include_count': 'true'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertIsNone(response.data['previous'])
+
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), expected)
+
+        # The previous link leads back to the page before the last one
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], seen[2:4])
+
+    def test_list_location_updates_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        self.authenticate(self.passenger_user)
+        response = self.client.get(reverse('locationupdate-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class PassengerCountViewSetTestCase(TrackingAPITestCase):
     """Test cases for PassengerCountViewSet."""
@@ -822,4 +891,236 @@ class TrackingAPIIntegrationTestCase(TrackingAPITestCase):
         response = self.client.get(anomaly_url, {'resolved': 'true'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         resolved_ids = [a['id'] for a in response.data['results']]
-        self.assertIn(anomaly_id, resolved_ids)
\ No newline at end of file
+        self.assertIn(anomaly_id, resolved_ids)
+
+
+class ExpansionQueryCountTestCase(TrackingAPITestCase):
+    """Query-count regression tests for expand_* parameters."""
+    
+    def add_trip(self, index):
+        """Create a trip with its own driver and bus."""
+        user = User.objects.create_user(
+            email=f'driver{index}@test.com',
+            password='testpass123',
+            first_name='Driver',
+            last_name=str(index),
+            user_type=USER_TYPE_DRIVER
+        )
+        driver = Driver.objects.create(
+            user=user,
+            phone_number=f'+21355500{index:04d}',
+            id_card_number=f'ID{index}',
+            id_card_photo='test.jpg',
+            driver_license_number=f'DL{index}',
+            driver_license_photo='test.jpg',
+            status=DRIVER_STATUS_APPROVED,
+            years_of_experience=2
+        )
+        bus = Bus.objects.create(
+            license_plate=f'EXP{index}DZ',
+            driver=driver,
+            model='Sprinter',
+            manufacturer='Mercedes-Benz',
+            year=2021,
+            capacity=25,
+            status=BUS_STATUS_ACTIVE,
+            is_approved=True
+        )
+        BusLine.objects.create(bus=bus, line=self.line, tracking_status=BUS_TRACKING_STATUS_IDLE)
+        return Trip.objects.create(bus=bus, driver=driver, line=self.line, start_time=timezone.now())
+    
+    def count_queries(self, url, params):
+        """Count the queries of a successful GET."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries.captured_queries)
+    
+    def assertQueriesConstant(self, url, params, add_rows):
+        """Assert the query count does not grow with the number of rows."""
+        before = self.count_queries(url, params)
+        add_rows()
+        self.assertEqual(self.count_queries(url, params), before)
+    
+    def test_trip_list_expansions(self):
+        """Test that expanded trips load buses, drivers and lines with the page."""
+        self.authenticate(self.admin_user)
+        self.assertQueriesConstant(
+            reverse('trip-list'),
+            {'expand_bus': 'true', 'expand_driver': 'true', 'expand_line': 'true'},
+            lambda: [self.add_trip(index) for index in range(3)]
+        )
+    
+    def test_bus_line_list_expansions(self):
+        """Test that expanded bus-line assignments do not query per row."""
+        self.authenticate(self.admin_user)
+        self.assertQueriesConstant(
+            reverse('busline-list'),
+            {'expand_bus': 'true', 'expand_line': 'true'},
+            lambda: [self.add_trip(index) for index in range(3)]
+        )
+    
+    def test_bus_waiting_list_expansions(self):
+        """Test that expanded waiting-list entries do not query per row."""
+        def add_entries():
+            for index in range(3):
+                user = User.objects.create_user(email=f'waiting{index}@test.com', password='testpass123')
+                BusWaitingList.objects.create(bus=self.bus, stop=self.stop2, user=user)
+        
+        BusWaitingList.objects.create(bus=self.bus, stop=self.stop1, user=self.passenger_user)
+        self.authenticate(self.admin_user)
+        self.assertQueriesConstant(
+            reverse('buswaitinglist-list'),
+            {'expand_bus': 'true', 'expand_stop': 'true'},
+            add_entries
+        )
+
+
+class FleetSnapshotTestCase(TrackingAPITestCase):
+    """Test cases for the fleet snapshot endpoint."""
+    
+    def setUp(self):
+        super().setUp()
+        BusLine.objects.filter(pk=self.bus_line.pk).update(
+            tracking_status=BUS_TRACKING_STATUS_ACTIVE,
+            start_time=timezone.now() - timezone.timedelta(hours=1)
+        )
+        self.url = reverse('fleet-snapshot')
+    
+    def test_snapshot_columns(self):
+        """Test that each bus is one entry in every column."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        
+        columns = response.data['columns']
+        self.assertEqual(columns['bus_id'], [str(self.bus.id)])
+        self.assertEqual(columns['line_code'], [self.line.code])
+        self.assertEqual(columns['latitude'], [36.7528])
+        self.assertEqual(columns['nearest_stop_id'], [str(self.stop1.id)])
+        self.assertEqual(columns['passenger_count'], [15])
+        self.assertEqual(columns['occupancy_rate'], [0.6])
+        self.assertEqual(columns['driver_name'], ['Test Driver'])
+    
+    def test_snapshot_query_count_is_constant(self):
+        """Test that more buses do not mean more queries."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        before = len(queries.captured_queries)
+        
+        for index in range(3):
+            bus = Bus.objects.create(
+                license_plate=f'FLT{index}DZ',
+                driver=self.driver,
+                model='Sprinter',
+                manufacturer='Mercedes-Benz',
+                year=2021,
+                capacity=25,
+                status=BUS_STATUS_ACTIVE,
+                is_approved=True
+            )
+            BusLine.objects.create(
+                bus=bus, line=self.line,
+                tracking_status=BUS_TRACKING_STATUS_ACTIVE,
+                start_time=timezone.now()
+            )
+            LocationUpdate.objects.create(bus=bus, latitude=Decimal('36.75'), longitude=Decimal('3.05'))
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(len(queries.captured_queries), before)
+    
+    def test_snapshot_since(self):
+        """Test that polling with since returns only changed and removed buses."""
+        timestamp = self.client.get(self.url).data['timestamp']
+        
+        response = self.client.get(self.url, {'since': timestamp})
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['removed'], [])
+        
+        LocationUpdate.objects.create(bus=self.bus, latitude=Decimal('36.7600'), longitude=Decimal('3.0500'))
+        response = self.client.get(self.url, {'since': timestamp})
+        self.assertEqual(response.data['columns']['latitude'], [36.76])
+        
+        self.bus_line.refresh_from_db()
+        self.bus_line.tracking_status = BUS_TRACKING_STATUS_IDLE
+        self.bus_line.save()
+        response = self.client.get(self.url, {'since': timestamp})
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['removed'], [str(self.bus.id)])
+    
+    def test_snapshot_invalid_since(self):
+        """Test that an unparseable since is rejected."""
+        response = self.client.get(self.url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LiveTrackingViewTestCase(SimpleTestCase):
+    """Test the async live-tracking read endpoints."""
+    
+    def setUp(self):
+        """Set up a cached token user and bus location."""
+        from django.core.cache import cache
+        
+        cache.clear()
+        user = User(id=uuid.uuid4(), email='live@test.com', is_active=True)
+        token = AccessToken.for_user(user)
+        cache_token_user(token, user)
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Bearer {token}'}
+        
+        self.bus_id = str(uuid.uuid4())
+        cache.set(CACHE_KEY_BUS_LOCATION.format(bus_id=self.bus_id), {
+            'bus_id': self.bus_id,
+            'latitude': 36.75,
+            'longitude': 3.05,
+            'speed': 30.0,
+            'heading': 90.0,
+            'timestamp': timezone.now().isoformat(),
+        })
+    
+    def get(self, url, authenticated=True):
+        return async_to_sync(self.client.get)(url, headers=self.headers if authenticated else None)
+    
+    def test_views_skip_request_transactions(self):
+        """Test that the live views are async and exempt from ATOMIC_REQUESTS."""
+        from apps.api.v1.tracking import live_views
+        
+        for view in (live_views.live_active_buses, live_views.live_bus_location, live_views.live_stop_arrivals):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+            self.assertEqual(view._non_atomic_requests, {'default'})
+    
+    def test_bus_location(self):
+        """Test that the location is read from the cached live state."""
+        response = self.get(reverse('live-bus-location', kwargs={'bus_id': self.bus_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['location']['latitude'], 36.75)
+        
+        response = self.get(reverse('live-bus-location', kwargs={'bus_id': uuid.uuid4()}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_bus_location_requires_token(self):
+        """Test that anonymous requests are rejected."""
+        response = self.get(reverse('live-bus-location', kwargs={'bus_id': self.bus_id}), authenticated=False)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_redis_only_views_unavailable_without_redis(self):
+        """Test that index-backed reads report 503 on a non-Redis cache."""
+        response = self.get(reverse('live-active-buses'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        response = self.get(reverse('live-stop-arrivals', kwargs={'stop_id': uuid.uuid4()}))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class NonAtomicReadsTestCase(SimpleTestCase):
+    """Test which views are exempt from ATOMIC_REQUESTS."""
+    
+    def test_read_views_are_non_atomic(self):
+        """Test that hot read paths are exempt while other views keep the request transaction."""
+        for name in ('locationupdate-list', 'busline-list', 'trip-list', 'active-buses', 'fleet-snapshot'):
+            self.assertEqual(resolve(reverse(name)).func._non_atomic_requests, {'default'}, name)
+        
+        self.assertFalse(hasattr(resolve(reverse('anomaly-list')).func, '_non_atomic_requests'))
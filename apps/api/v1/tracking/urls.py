@@ -22,7 +22,8 @@ from .views import (
     WaitingPassengersViewSet,
 )
 from .views.route_views import RouteTrackingViewSet, RouteSegmentViewSet
-from .active_buses_view import active_buses
+from .active_buses_view import active_buses, fleet_snapshot
+from .live_views import live_active_buses, live_bus_location, live_stop_arrivals
 
 router = DefaultRouter()
 router.register(r'bus-lines', BusLineViewSet)
@@ -52,6 +53,12 @@ router.register(r'user-premium-features', UserPremiumFeatureViewSet, basename='u
 urlpatterns = [
     # Active buses endpoint
     path('active-buses/', active_buses, name='active-buses'),
+    path('fleet-snapshot/', fleet_snapshot, name='fleet-snapshot'),
+
+    # Async reads of the cached live state
+    path('live/active-buses/', live_active_buses, name='live-active-buses'),
+    path('live/buses/<str:bus_id>/location/', live_bus_location, name='live-bus-location'),
+    path('live/stops/<str:stop_id>/arrivals/', live_stop_arrivals, name='live-stop-arrivals'),
     
     # Router URLs
     path('', include(router.urls)),
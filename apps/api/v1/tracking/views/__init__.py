@@ -9,7 +9,9 @@ from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiResponse
 from drf_spectacular.types import OpenApiTypes
 
+from apps.api.pagination import KeysetPagination
 from apps.api.viewsets import BaseModelViewSet, ReadOnlyModelViewSet
+from apps.core.mixins.views import NonAtomicReadsMixin
 from apps.core.permissions import IsAdmin, IsApprovedDriver, IsDriverOrAdmin
 from apps.tracking.models import (
     Anomaly,
@@ -33,6 +35,7 @@ from apps.tracking.services import (
     LocationUpdateService,
     PassengerCountService,
     ReputationService,
+    StopCrowdService,
     TripService,
     VirtualCurrencyService,
     WaitingListService,
@@ -43,6 +46,7 @@ from apps.tracking.services.driver_services import (
     DriverPerformanceService,
     PremiumFeatureService,
 )
+from apps.tracking.services.leaderboard_service import LeaderboardService
 
 from ..filters import (
     AnomalyFilter,
@@ -90,7 +94,7 @@ from ..serializers import (
 )
 
 
-class BusLineViewSet(BaseModelViewSet):
+class BusLineViewSet(NonAtomicReadsMixin, BaseModelViewSet):
     """
     API endpoint for bus-line assignments.
     """
@@ -236,7 +240,7 @@ class BusLineViewSet(BaseModelViewSet):
         return Response(response_serializer.data)
 
 
-class LocationUpdateViewSet(BaseModelViewSet):
+class LocationUpdateViewSet(NonAtomicReadsMixin, BaseModelViewSet):
     """
     API endpoint for location updates.
     """
@@ -244,6 +248,7 @@ class LocationUpdateViewSet(BaseModelViewSet):
     serializer_class = LocationUpdateSerializer
     filterset_class = LocationUpdateFilter
     service_class = LocationUpdateService
+    pagination_class = KeysetPagination
 
     def get_permissions(self):
         """
@@ -286,14 +291,9 @@ class LocationUpdateViewSet(BaseModelViewSet):
         if trip_id:
             queryset = queryset.filter(trip_id=trip_id)
 
-        # Limit to recent updates if requested
-        limit = self.request.query_params.get('limit')
-        if limit and limit.isdigit():
-            queryset = queryset.order_by('-created_at')[:int(limit)]
-        else:
-            queryset = queryset.order_by('-created_at')
-
-        return queryset
+        # Newest first; KeysetPagination pages on (created_at, id) and
+        # accepts ``limit`` as the page size
+        return queryset.order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         """
@@ -386,7 +386,7 @@ class LocationUpdateViewSet(BaseModelViewSet):
         return Response({'eta': eta.isoformat()})
 
 
-class PassengerCountViewSet(BaseModelViewSet):
+class PassengerCountViewSet(NonAtomicReadsMixin, BaseModelViewSet):
     """
     API endpoint for passenger counts.
     """
@@ -553,7 +553,7 @@ class WaitingPassengersViewSet(BaseModelViewSet):
             user_id=self.request.user.id
         )
 
-class TripViewSet(BaseModelViewSet):
+class TripViewSet(NonAtomicReadsMixin, BaseModelViewSet):
     """
     API endpoint for trips.
     """
@@ -707,7 +707,7 @@ class TripViewSet(BaseModelViewSet):
         serializer = self.get_serializer(trip)
         return Response(serializer.data)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def history(self, request):
         """
         Get trip history for the authenticated user.
@@ -718,15 +718,15 @@ class TripViewSet(BaseModelViewSet):
         - Admins: Can see all trips
         
         Query parameters:
-        - limit: Number of results to return (default: 20, max: 100)
-        - offset: Number of results to skip for pagination
+        - cursor: Opaque cursor from the previous/next link
+        - page_size (or limit): Number of results to return (default: 20, max: 100)
+        - include_count: Include the exact total (true/false)
         - is_completed: Filter by completion status (true/false)
         - start_date: Filter trips after this date (YYYY-MM-DD)
         - end_date: Filter trips before this date (YYYY-MM-DD)
         - line_id: Filter by specific line
-        - ordering: Order results by field (e.g., '-start_time' for newest first)
         
-        Returns paginated trip history with trip details.
+        Returns trip history newest first, keyset-paginated on (created_at, id).
         """
         # Get queryset based on user type
         queryset = self.get_queryset()
@@ -746,27 +746,10 @@ class TripViewSet(BaseModelViewSet):
                 # For now, return empty queryset for passengers
                 queryset = queryset.none()
         
-        # Apply ordering (newest first by default)
-        ordering = request.query_params.get('ordering', '-start_time')
-        queryset = queryset.order_by(ordering)
-        
-        # Handle limit parameter
-        limit = request.query_params.get('limit', '20')
-        try:
-            limit = min(int(limit), 100)  # Max 100 results
-        except (ValueError, TypeError):
-            limit = 20
-        
-        # Apply pagination
+        # Keyset pagination: deep pages cost the same as the first one
         page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        # If no pagination, apply limit manually
-        queryset = queryset[:limit]
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 class AnomalyViewSet(BaseModelViewSet):
     """
@@ -1024,7 +1007,7 @@ class WaitingCountReportViewSet(BaseModelViewSet):
     
     def get_permissions(self):
         """Get permissions based on action."""
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'crowd']:
             return [IsAuthenticated()]
         if self.action == 'create':
             return [IsAuthenticated()]
@@ -1104,6 +1087,28 @@ class WaitingCountReportViewSet(BaseModelViewSet):
         response_serializer = WaitingCountReportSerializer(verified_report, context={'request': request})
         return Response(response_serializer.data)
 
+    @extend_schema(
+        summary="Get crowd estimates for stops",
+        description="Time-decayed crowd estimates for every stop with recent reports or waiting lists, in one call",
+        parameters=[
+            OpenApiParameter(
+                name='stop_ids',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Comma-separated stop IDs to restrict the result to'
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT}
+    )
+    @action(detail=False, methods=['get'])
+    def crowd(self, request):
+        """Get crowd estimates keyed by stop ID."""
+        stop_ids = request.query_params.get('stop_ids')
+        if stop_ids:
+            stop_ids = [stop_id for stop_id in stop_ids.split(',') if stop_id]
+        
+        return Response(StopCrowdService.get_all(stop_ids or None))
+
 
 class ReputationScoreViewSet(ReadOnlyModelViewSet):
     """
@@ -1176,21 +1181,14 @@ class VirtualCurrencyViewSet(ReadOnlyModelViewSet):
         serializer = self.get_serializer(currency)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def transactions(self, request):
         """Get current user's currency transactions."""
-        transactions = CurrencyTransaction.objects.filter(
-            user=request.user
-        ).order_by('-created_at')
+        transactions = CurrencyTransaction.objects.filter(user=request.user)
         
-        # Apply pagination
         page = self.paginate_queryset(transactions)
-        if page is not None:
-            serializer = CurrencyTransactionSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = CurrencyTransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        serializer = CurrencyTransactionSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def leaderboard(self, request):
@@ -1204,6 +1202,17 @@ class VirtualCurrencyViewSet(ReadOnlyModelViewSet):
             'leaderboard': leaderboard
         })
 
+    @action(detail=False, methods=['get'])
+    def my_rank(self, request):
+        """Get current user's position on the virtual currency leaderboard."""
+        period = request.query_params.get('period', 'weekly')
+
+        rank = VirtualCurrencyService.get_user_rank(str(request.user.id), period=period)
+        return Response({
+            'period': period,
+            **rank
+        })
+
     @action(detail=False, methods=['post'], permission_classes=[IsAdmin])
     def adjust(self, request):
         """Admin-only: award or deduct coins from a user's balance."""
@@ -1264,19 +1273,15 @@ class MyCurrencyViewSet(ReadOnlyModelViewSet):
         currency = VirtualCurrencyService.get_or_create_currency(str(request.user.id))
         return Response(VirtualCurrencySerializer(currency).data)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def transactions(self, request):
         """Get current user's transaction history."""
-        txns = CurrencyTransaction.objects.filter(
-            user=request.user
-        ).order_by('-created_at')
+        txns = CurrencyTransaction.objects.filter(user=request.user)
 
         page = self.paginate_queryset(txns)
-        if page is not None:
-            return self.get_paginated_response(
-                CurrencyTransactionSerializer(page, many=True).data
-            )
-        return Response(CurrencyTransactionSerializer(txns, many=True).data)
+        return self.get_paginated_response(
+            CurrencyTransactionSerializer(page, many=True).data
+        )
 
 
 @extend_schema_view(
@@ -2182,14 +2187,13 @@ class DriverCurrencyViewSet(ReadOnlyModelViewSet):
         description="""
         **Virtual Currency Wealth Leaderboard**
         
-        Get the top drivers ranked by virtual currency balance. This leaderboard
-        showcases the most successful drivers in the gamification system and
-        motivates healthy competition.
+        Get the top drivers ranked by virtual currency earned during the period.
+        This leaderboard showcases the most successful drivers in the gamification
+        system and motivates healthy competition.
         
         **Ranking Methodology**:
-        - Primary: Current virtual currency balance
-        - Secondary: Lifetime earnings (for ties)
-        - Filters: Only active drivers included
+        - Primary: Coins earned in the current calendar week/month (or all time)
+        - Filters: Only drivers included
         
         **Leaderboard Features**:
         - Real-time rankings
@@ -2235,6 +2239,7 @@ class DriverCurrencyViewSet(ReadOnlyModelViewSet):
                         {
                             "rank": 1,
                             "user_name": "Ahmed Benaissa",
+                            "earned": 1320,
                             "balance": 2450,
                             "lifetime_earned": 8750
                         },
@@ -2262,21 +2267,24 @@ class DriverCurrencyViewSet(ReadOnlyModelViewSet):
         period = request.query_params.get('period', 'monthly')
         limit = int(request.query_params.get('limit', 10))
         
-        # Get only drivers in leaderboard
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        
-        currencies = VirtualCurrency.objects.filter(
-            user__user_type='driver'
-        ).select_related('user').order_by('-balance')[:limit]
+        entries = LeaderboardService.get_top(
+            LeaderboardService.BOARD_DRIVER_CURRENCY, period, limit
+        )
+        users = LeaderboardService.hydrate(entries)
         
         leaderboard = []
-        for rank, currency in enumerate(currencies, 1):
+        for entry in entries:
+            user = users.get(entry['user_id'])
+            if user is None:
+                continue
+            
+            currency = getattr(user, 'virtual_currency', None)
             leaderboard.append({
-                'rank': rank,
-                'user_name': currency.user.get_full_name() or currency.user.email,
-                'balance': currency.balance,
-                'lifetime_earned': currency.lifetime_earned,
+                'rank': entry['rank'],
+                'user_name': user.get_full_name() or user.email,
+                'earned': entry['score'],
+                'balance': currency.balance if currency else 0,
+                'lifetime_earned': currency.lifetime_earned if currency else 0,
             })
         
         return Response({
@@ -8,6 +8,7 @@ from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
 from apps.api.viewsets import BaseModelViewSet
+from apps.core.mixins.views import NonAtomicReadsMixin
 from apps.tracking.services.route_service import RouteService
 from apps.tracking.models import RouteSegment
 from ..serializers.route_serializers import (
@@ -19,7 +20,7 @@ from ..serializers.route_serializers import (
 )
 
 
-class RouteTrackingViewSet(viewsets.ViewSet):
+class RouteTrackingViewSet(NonAtomicReadsMixin, viewsets.ViewSet):
     """
     ViewSet for enhanced route tracking features.
     """
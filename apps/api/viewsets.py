@@ -50,6 +50,15 @@ class BaseModelViewSet(
         if hasattr(self, 'filter_queryset_by_request'):
             queryset = self.filter_queryset_by_request(queryset)
 
+        return self.setup_eager_loading(queryset)
+
+    def setup_eager_loading(self, queryset, serializer_class=None):
+        """
+        Load the relations the serializer reads for this request up front.
+        """
+        serializer_class = serializer_class or self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset, self.request)
         return queryset
 
     def create(self, request, *args, **kwargs):
@@ -1,11 +1,18 @@
 """
 Selector functions for the buses app.
 """
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection
 from django.db.models import F, Q
+from django.utils import timezone
 import logging
 
-from apps.core.constants import BUS_STATUS_ACTIVE
+from apps.core.constants import BUS_STATUS_ACTIVE, CACHE_TIMEOUT_BUS_POSITION
 from apps.core.selectors import get_object_or_404
+from apps.core.utils.cache import search_bus_positions
+from apps.core.utils.geo import calculate_distance
+from apps.core.utils.spatial import geography_sql, point_sql, postgis_enabled
 
 from .models import Bus
 
@@ -125,20 +132,94 @@ def get_buses_by_line(line_id):
     )
 
 
-def get_nearby_buses(latitude, longitude, radius_km=2.0):
+def get_nearby_buses(latitude, longitude, radius_km=2.0, limit=None):
     """
-    Get buses near a location.
+    Get active buses near a location.
+
+    Uses the Redis GEO index of current positions, falling back to each bus's
+    latest location update when Redis is not available.
 
     Args:
         latitude: Latitude
         longitude: Longitude
         radius_km: Radius in kilometers
+        limit: Optional maximum number of buses to return
 
     Returns:
-        Queryset of bus IDs
+        List of buses sorted by distance, each with ``distance`` (km) and
+        ``current_location`` attributes
     """
-    # This is a simplified implementation that doesn't do actual geospatial queries
-    # In production, you would use PostGIS or another geospatial database
+    positions = search_bus_positions(latitude, longitude, radius_km)
+    if positions is None:
+        positions = _get_recent_positions_within(latitude, longitude, radius_km)
+
+    buses = get_active_buses().filter(id__in=[bus_id for bus_id, *_ in positions]).in_bulk()
+    buses = {str(bus_id): bus for bus_id, bus in buses.items()}
+
+    nearby_buses = []
+    for bus_id, distance, lat, lon, seen_at in positions:
+        bus = buses.get(bus_id)
+        if bus is None:
+            continue
+
+        bus.distance = distance
+        bus.current_location = {
+            'latitude': float(lat),
+            'longitude': float(lon),
+            'timestamp': datetime.fromtimestamp(seen_at, tz=dt_timezone.utc).isoformat(),
+        }
+        nearby_buses.append(bus)
+
+        if limit is not None and len(nearby_buses) >= limit:
+            break
+
+    return nearby_buses
+
+
+def _get_recent_positions_within(latitude, longitude, radius_km):
+    """
+    Get the latest recent position of each bus within a radius from the database.
+    """
+    from apps.tracking.models import LocationUpdate
+
+    since = timezone.now() - timedelta(seconds=CACHE_TIMEOUT_BUS_POSITION)
+
+    if postgis_enabled():
+        geography = geography_sql("tracking_locationupdate")
+        point = point_sql()
+        center = [float(longitude), float(latitude)]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT bus_id, distance, latitude, longitude, created_at
+                FROM (
+                    SELECT DISTINCT ON (bus_id) bus_id, latitude, longitude, created_at,
+                           ST_Distance({geography}, {point}) / 1000.0 AS distance,
+                           ST_DWithin({geography}, {point}, %s) AS inside
+                    FROM tracking_locationupdate
+                    WHERE created_at >= %s
+                    ORDER BY bus_id, created_at DESC
+                ) latest
+                WHERE inside
+                ORDER BY distance
+            """, center + center + [radius_km * 1000, since])
+
+            return [
+                (str(bus_id), distance, lat, lon, created_at.timestamp())
+                for bus_id, distance, lat, lon, created_at in cursor.fetchall()
+            ]
+
+    latest = LocationUpdate.objects.filter(
+        created_at__gte=since
+    ).order_by('bus_id', '-created_at').distinct('bus_id').values_list(
+        'bus_id', 'latitude', 'longitude', 'created_at'
+    )
+
+    positions = []
+    for bus_id, lat, lon, created_at in latest:
+        distance = calculate_distance(latitude, longitude, lat, lon)
+        if distance is not None and distance <= radius_km:
+            positions.append((str(bus_id), distance, lat, lon, created_at.timestamp()))
 
-    # For now, just get all active buses
-    return get_active_buses()
+    positions.sort(key=lambda position: position[1])
+    return positions
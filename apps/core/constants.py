@@ -130,6 +130,19 @@ CACHE_KEY_BUS_PASSENGERS = "bus:passengers:{bus_id}"
 CACHE_KEY_STOP_WAITING = "stop:waiting:{stop_id}"
 CACHE_KEY_LINE_BUSES = "line:buses:{line_id}"
 CACHE_KEY_DRIVER_RATING = "driver:rating:{driver_id}"
+CACHE_KEY_LINE_TIMETABLE = "line:timetable:{line_id}"
+CACHE_KEY_LINE_TOPOLOGY = "line:topology:{line_id}:{version}"
+CACHE_KEY_LINE_TOPOLOGY_VERSION = "line:topology:version:{line_id}"
+CACHE_KEY_BUS_POSITIONS = "bus:positions"
+CACHE_KEY_BUS_POSITIONS_SEEN = "bus:positions:seen"
+CACHE_KEY_MODEL_VERSION = "version:{model}"
+CACHE_KEY_API_RESPONSE = "api:response:{view}:{digest}"
+CACHE_KEY_TOKEN_USER = "auth:user:{user_id}:{jti}"
+CACHE_KEY_TOKEN_USER_REVOKED = "auth:user:revoked:{user_id}"
+CACHE_KEY_WS_SESSION = "ws:session:{session_id}"
+CACHE_KEY_LIVE_BUS = "live:bus:{bus_id}"
+CACHE_KEY_LIVE_LINE = "live:line:{line_id}:{field}"
+CACHE_KEY_LIVE_STOP_ETAS = "live:stop:{stop_id}:etas"
 
 # Cache timeouts (in seconds)
 CACHE_TIMEOUT_BUS_LOCATION = 60  # 1 minute
@@ -137,3 +150,10 @@ CACHE_TIMEOUT_BUS_PASSENGERS = 300  # 5 minutes
 CACHE_TIMEOUT_STOP_WAITING = 300  # 5 minutes
 CACHE_TIMEOUT_LINE_BUSES = 300  # 5 minutes
 CACHE_TIMEOUT_DRIVER_RATING = 3600  # 1 hour
+CACHE_TIMEOUT_LINE_TIMETABLE = 86400  # 1 day, invalidated on schedule/route changes
+CACHE_TIMEOUT_LINE_TOPOLOGY = 86400  # 1 day, superseded by version bumps on route changes
+CACHE_TIMEOUT_BUS_POSITION = 300  # 5 minutes without updates drops a bus from nearby searches
+CACHE_TIMEOUT_API_RESPONSE = 900  # 15 minutes, superseded by model version bumps
+CACHE_TIMEOUT_TOKEN_USER = 60  # 1 minute, revoked on deactivation
+CACHE_TIMEOUT_WS_SESSION = 300  # 5 minutes to resume a dropped WebSocket session
+CACHE_TIMEOUT_LIVE_STATE = 300  # 5 minutes, refreshed by every live update
@@ -0,0 +1,33 @@
+"""
+Management command to create (or drop) the PostGIS geography indexes.
+
+The tracking migration creates them when USE_POSTGIS is already enabled; run
+this after turning the setting on for an existing database.
+
+Usage:
+    USE_POSTGIS=true python manage.py setup_postgis
+    python manage.py setup_postgis --drop
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.core.utils.spatial import create_spatial_indexes, drop_spatial_indexes
+
+
+class Command(BaseCommand):
+    help = 'Create the PostGIS geography GiST indexes used by spatial selectors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', help='Drop the indexes instead')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('PostGIS indexes require a PostgreSQL database')
+
+        if options['drop']:
+            drop_spatial_indexes()
+            self.stdout.write(self.style.SUCCESS('Dropped PostGIS geography indexes'))
+            return
+
+        create_spatial_indexes()
+        self.stdout.write(self.style.SUCCESS('Created PostGIS geography indexes'))
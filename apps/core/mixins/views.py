@@ -1,20 +1,45 @@
 """
 View mixins for reuse across the application.
 """
+import hashlib
+import json
+
 from django.conf import settings
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie, vary_on_headers
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.utils.translation import get_language
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
 import logging
 
+from apps.core.constants import CACHE_KEY_API_RESPONSE, CACHE_TIMEOUT_API_RESPONSE
+from apps.core.utils.cache import bump_model_versions, get_model_versions
+
 logger = logging.getLogger(__name__)
 
 
 class CacheMixin:
     """
-    Mixin to add caching to Django views.
+    Mixin to cache list and retrieve responses of a viewset.
+
+    Cache keys are built from the view, the normalized query parameters and
+    the version counters of ``cache_models``. Writes made through the viewset
+    bump the version of its own model, and services bump the versions of the
+    models they change, so a cached response is never served after a write
+    has committed. Responses carry an ETag; a matching ``If-None-Match``
+    gets a 304 without touching the database.
+
+    Authentication and permissions still run on every request, so responses
+    must not depend on the requesting user.
     """
-    cache_timeout = 60 * 15  # 15 minutes
+    cache_timeout = CACHE_TIMEOUT_API_RESPONSE
+    # Models whose data appears in the responses; defaults to the queryset model
+    cache_models = ()
+    cached_actions = ('list', 'retrieve')
 
     def get_cache_timeout(self):
         """
@@ -22,14 +47,119 @@ class CacheMixin:
         """
         return self.cache_timeout
 
-    @method_decorator(cache_page(cache_timeout))
-    @method_decorator(vary_on_cookie)
-    @method_decorator(vary_on_headers("Accept-Language"))
-    def dispatch(self, *args, **kwargs):
+    def get_cache_models(self):
+        """
+        Return the models whose versions key the cached responses.
+        """
+        return self.cache_models or (self.queryset.model,)
+
+    def get_response_cache_key(self, request):
+        """
+        Build the cache key for a request, or None if it cannot be cached.
+        """
+        versions = get_model_versions(*self.get_cache_models())
+        if None in versions:
+            return None
+
+        # Blank parameters filter nothing, so they share the key of the bare request
+        params = sorted(
+            (key, values)
+            for key, values in (
+                (key, sorted(value for value in request.query_params.getlist(key) if value != ''))
+                for key in request.query_params
+            )
+            if values
+        )
+        payload = json.dumps(
+            [
+                request.get_host(),
+                request.path,
+                self.action,
+                params,
+                get_language(),
+                versions,
+            ],
+            default=str,
+        )
+        return CACHE_KEY_API_RESPONSE.format(
+            view=self.__class__.__name__,
+            digest=hashlib.md5(payload.encode()).hexdigest(),
+        )
+
+    def get_cached_response(self, request, handler, *args, **kwargs):
+        """
+        Serve a response from the cache, calling the handler on a miss.
+        """
+        key = self.get_response_cache_key(request)
+        entry = cache.get(key) if key else None
+
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            # Store plain JSON types; serializer return lists are not picklable
+            body = json.dumps(response.data, cls=DjangoJSONEncoder)
+            entry = {
+                'data': json.loads(body),
+                'etag': hashlib.md5(body.encode()).hexdigest(),
+            }
+            if key:
+                cache.set(key, entry, self.get_cache_timeout())
+        else:
+            response = Response(entry['data'])
+
+        etag = f'"{entry["etag"]}"'
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cached_actions:
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cached_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(request, super().retrieve, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """
+        Bump the view's model version after a successful write.
+        """
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            bump_model_versions(self.get_cache_models()[0])
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class NonAtomicReadsMixin:
+    """
+    Mixin to serve safe-method requests outside the per-request transaction.
+
+    The view is exempt from ATOMIC_REQUESTS and opens that transaction itself
+    for unsafe methods, so reads run in autocommit while writes stay atomic.
+    """
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
         """
-        Cache the response.
+        Exempt the view function from ATOMIC_REQUESTS.
         """
-        return super().dispatch(*args, **kwargs)
+        return transaction.non_atomic_requests(super().as_view(*args, **initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Dispatch unsafe methods inside a transaction.
+        """
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
 
 
 class APILogMixin:
@@ -1,30 +1,86 @@
 """
 Cache utilities for DZ Bus Tracker.
 """
+import asyncio
 import functools
 import hashlib
 import json
 import logging
+import time
+import weakref
 from datetime import timedelta
 
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 
 from apps.core.constants import (
     CACHE_KEY_BUS_LOCATION,
     CACHE_KEY_BUS_PASSENGERS,
+    CACHE_KEY_BUS_POSITIONS,
+    CACHE_KEY_BUS_POSITIONS_SEEN,
     CACHE_KEY_DRIVER_RATING,
     CACHE_KEY_LINE_BUSES,
+    CACHE_KEY_LIVE_BUS,
+    CACHE_KEY_LIVE_LINE,
+    CACHE_KEY_LIVE_STOP_ETAS,
+    CACHE_KEY_MODEL_VERSION,
     CACHE_KEY_STOP_WAITING,
     CACHE_TIMEOUT_BUS_LOCATION,
     CACHE_TIMEOUT_BUS_PASSENGERS,
+    CACHE_TIMEOUT_BUS_POSITION,
     CACHE_TIMEOUT_DRIVER_RATING,
     CACHE_TIMEOUT_LINE_BUSES,
+    CACHE_TIMEOUT_LIVE_STATE,
     CACHE_TIMEOUT_STOP_WAITING,
 )
 
 logger = logging.getLogger(__name__)
 
+# Async Redis clients per event loop, then per cache alias
+_async_redis_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis_client(alias="default"):
+    """
+    Get the raw Redis client behind a django-redis cache.
+
+    Returns None when the cache alias is not backed by django-redis (e.g. the
+    dummy/locmem caches used in tests), so callers can fall back to the database.
+    """
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection(alias)
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def get_async_redis_client(alias="default"):
+    """
+    Get an asyncio Redis client for the server behind a django-redis cache.
+
+    Clients are kept per event loop, since their connections are bound to
+    the loop that opened them. Returns None when the cache alias is not
+    backed by django-redis.
+    """
+    config = settings.CACHES.get(alias, {})
+    if not config.get("BACKEND", "").startswith("django_redis."):
+        return None
+
+    clients = _async_redis_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(alias)
+    if client is None:
+        import redis.asyncio
+
+        location = config["LOCATION"]
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        client = redis.asyncio.Redis.from_url(location, decode_responses=True)
+        clients[alias] = client
+    return client
+
 
 def cache_key_with_params(prefix, **kwargs):
     """
@@ -97,6 +153,55 @@ def invalidate_cache(prefix, **kwargs):
             logger.warning(f"Cache backend does not support delete_pattern for {prefix}:*")
 
 
+def get_model_versions(*models):
+    """
+    Get the cache version counters of models.
+
+    Counters start from the clock, so a lost counter never repeats a version
+    that is still referenced by cached entries.
+
+    Args:
+        *models: Model classes
+
+    Returns:
+        List of versions in the order given; None where the cache backend
+        does not keep values
+    """
+    keys = [CACHE_KEY_MODEL_VERSION.format(model=model._meta.label_lower) for model in models]
+    versions = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        initial = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, initial, None)
+        versions.update(cache.get_many(missing))
+
+    return [versions.get(key) for key in keys]
+
+
+def bump_model_versions(*models):
+    """
+    Bump the cache version counters of models once the transaction commits.
+
+    Every cache entry keyed on an older version is superseded at once.
+
+    Args:
+        *models: Model classes
+    """
+    def bump():
+        for model in models:
+            key = CACHE_KEY_MODEL_VERSION.format(model=model._meta.label_lower)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, int(time.time() * 1000), None)
+            except Exception as e:
+                logger.warning(f"Failed to bump cache version for {model._meta.label}: {e}")
+
+    transaction.on_commit(bump)
+
+
 def cache_bus_location(bus_id, location_data, timeout=CACHE_TIMEOUT_BUS_LOCATION):
     """
     Cache bus location data.
@@ -114,6 +219,109 @@ def get_cached_bus_location(bus_id):
     return cache.get(cache_key)
 
 
+def cache_bus_position(bus_id, latitude, longitude):
+    """
+    Add a bus's current position to the Redis GEO index used for radius searches.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.geoadd(CACHE_KEY_BUS_POSITIONS, (float(longitude), float(latitude), str(bus_id)))
+        pipe.zadd(CACHE_KEY_BUS_POSITIONS_SEEN, {str(bus_id): time.time()})
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to index position for bus {bus_id}: {e}")
+
+
+def cache_live_state(bus_id, line_id=None, **fields):
+    """
+    Store parts of a bus's live state for WebSocket snapshots and live reads.
+
+    Each field (``position``, ``occupancy``, ``etas``) is kept as JSON in the
+    bus's hash and, when the bus runs on a line, in the line's hash for that
+    field keyed by bus, so a whole line is read back with one HGETALL per field.
+    ETAs are also indexed per stop for the live arrivals endpoint.
+    """
+    client = get_redis_client()
+    if client is None or not fields:
+        return
+
+    values = {field: json.dumps(value, default=str) for field, value in fields.items()}
+    try:
+        pipe = client.pipeline(transaction=False)
+        bus_key = CACHE_KEY_LIVE_BUS.format(bus_id=bus_id)
+        pipe.hset(bus_key, mapping=values)
+        pipe.expire(bus_key, CACHE_TIMEOUT_LIVE_STATE)
+        if line_id:
+            for field, value in values.items():
+                line_key = CACHE_KEY_LIVE_LINE.format(line_id=line_id, field=field)
+                pipe.hset(line_key, str(bus_id), value)
+                pipe.expire(line_key, CACHE_TIMEOUT_LIVE_STATE)
+        for stop_id, eta in fields.get("etas", {}).items():
+            stop_key = CACHE_KEY_LIVE_STOP_ETAS.format(stop_id=stop_id)
+            pipe.hset(stop_key, str(bus_id), json.dumps({"eta": eta, "line_id": str(line_id) if line_id else None}))
+            pipe.expire(stop_key, CACHE_TIMEOUT_LIVE_STATE)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to cache live state for bus {bus_id}: {e}")
+
+
+def search_bus_positions(latitude, longitude, radius_km, max_age=CACHE_TIMEOUT_BUS_POSITION):
+    """
+    Find buses within a radius using the Redis GEO index.
+
+    Buses that have not reported for ``max_age`` seconds are dropped from the
+    index as they are encountered.
+
+    Returns:
+        List of ``(bus_id, distance_km, latitude, longitude, seen_at)`` sorted by
+        distance, or None if Redis is not available
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    try:
+        results = client.geosearch(
+            CACHE_KEY_BUS_POSITIONS,
+            longitude=float(longitude),
+            latitude=float(latitude),
+            radius=radius_km,
+            unit="km",
+            withdist=True,
+            withcoord=True,
+            sort="ASC",
+        )
+        if not results:
+            return []
+
+        members = [member for member, _, _ in results]
+        seen = client.zmscore(CACHE_KEY_BUS_POSITIONS_SEEN, members)
+        cutoff = time.time() - max_age
+
+        positions = []
+        stale = []
+        for (member, distance, (lon, lat)), seen_at in zip(results, seen):
+            if seen_at is None or seen_at < cutoff:
+                stale.append(member)
+                continue
+            positions.append((member.decode(), float(distance), lat, lon, seen_at))
+
+        if stale:
+            pipe = client.pipeline(transaction=False)
+            pipe.zrem(CACHE_KEY_BUS_POSITIONS, *stale)
+            pipe.zrem(CACHE_KEY_BUS_POSITIONS_SEEN, *stale)
+            pipe.execute()
+
+        return positions
+    except Exception as e:
+        logger.warning(f"Falling back from GEO search: {e}")
+        return None
+
+
 def cache_bus_passengers(bus_id, count, timeout=CACHE_TIMEOUT_BUS_PASSENGERS):
     """
     Cache bus passenger count.
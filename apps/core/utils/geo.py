@@ -33,6 +33,25 @@ def calculate_distance(lat1, lon1, lat2, lon2):
         return None
 
 
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great-circle distance between two points in kilometers.
+
+    For native float coordinates on hot paths (per ping, per stop). Within
+    0.5% of ``calculate_distance`` and much cheaper than a geodesic.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
 def calculate_speed(lat1, lon1, time1, lat2, lon2, time2):
     """
     Calculate speed between two location updates in km/h.
@@ -175,6 +194,32 @@ def get_traffic_factor(hour_of_day, day_of_week):
         return weekday_peaks.get(hour_of_day, 1.0)
 
 
+def get_bounding_box(latitude, longitude, radius_km):
+    """
+    Get a latitude/longitude box that contains a circle.
+
+    Used to narrow candidates with an indexed range filter before computing
+    exact distances.
+
+    Args:
+        latitude: Latitude of the center
+        longitude: Longitude of the center
+        radius_km: Radius in kilometers
+
+    Returns:
+        Tuple of (min_lat, max_lat, min_lon, max_lon)
+    """
+    lat = float(latitude)
+    lon = float(longitude)
+
+    # One degree of latitude is ~111.32 km; longitude shrinks with cos(lat)
+    lat_delta = radius_km / 111.32
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    lon_delta = radius_km / (111.32 * cos_lat)
+
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
 def is_location_in_algeria(latitude, longitude):
     """
     Check if a location is within Algeria's boundaries.
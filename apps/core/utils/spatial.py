@@ -0,0 +1,126 @@
+"""
+Optional PostGIS support for radius and nearest-neighbour queries.
+
+Coordinates stay in their ``DecimalField`` columns. When ``USE_POSTGIS`` is
+enabled, each table gets a GiST index on the geography expression built from
+those columns, and the helpers here query that same expression with
+``ST_DWithin`` and KNN ``<->`` ordering. This needs neither GDAL nor
+``django.contrib.gis``, and the Decimal fallback keeps working wherever the
+setting is off.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+# table -> (latitude column, longitude column)
+SPATIAL_COLUMNS = {
+    "lines_stop": ("latitude", "longitude"),
+    "tracking_locationupdate": ("latitude", "longitude"),
+    "tracking_anomaly": ("location_latitude", "location_longitude"),
+    "tracking_waitingcountreport": ("reporter_latitude", "reporter_longitude"),
+}
+
+
+def postgis_enabled(using=None):
+    """
+    Check whether spatial queries should use PostGIS.
+    """
+    conn = using or connection
+    return getattr(settings, "USE_POSTGIS", False) and conn.vendor == "postgresql"
+
+
+def geography_sql(table):
+    """
+    Get the geography expression for a table's coordinate columns.
+
+    The expression must match the indexed one exactly for the planner to use
+    the GiST index.
+    """
+    lat_column, lon_column = SPATIAL_COLUMNS[table]
+    return (
+        f"(ST_SetSRID(ST_MakePoint({table}.{lon_column}::float8, "
+        f"{table}.{lat_column}::float8), 4326)::geography)"
+    )
+
+
+def point_sql():
+    """
+    Get a geography point placeholder taking (longitude, latitude) params.
+    """
+    return "(ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography)"
+
+
+def get_index_name(table):
+    return f"{table}_geog_gist"
+
+
+def create_spatial_indexes(conn=None):
+    """
+    Enable the postgis extension and create the geography GiST indexes.
+    """
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+        for table in SPATIAL_COLUMNS:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {get_index_name(table)} "
+                f"ON {table} USING gist ({geography_sql(table)})"
+            )
+    logger.info("Created PostGIS geography indexes")
+
+
+def drop_spatial_indexes(conn=None):
+    """
+    Drop the geography GiST indexes.
+    """
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        for table in SPATIAL_COLUMNS:
+            cursor.execute(f"DROP INDEX IF EXISTS {get_index_name(table)}")
+
+
+def nearest_within(table, latitude, longitude, radius_km, limit=None, where="", params=None):
+    """
+    Get rows within a radius, nearest first, using the geography index.
+
+    Args:
+        table: Table name from ``SPATIAL_COLUMNS``
+        latitude: Latitude of the center
+        longitude: Longitude of the center
+        radius_km: Radius in kilometers
+        limit: Optional maximum number of rows
+        where: Extra SQL condition on ``table``
+        params: Parameters for ``where``
+
+    Returns:
+        List of (id, distance_km) tuples
+    """
+    geography = geography_sql(table)
+    point = point_sql()
+    center = [float(longitude), float(latitude)]
+
+    sql = (
+        f"SELECT {table}.id, ST_Distance({geography}, {point}) / 1000.0 "
+        f"FROM {table} "
+        f"WHERE ST_DWithin({geography}, {point}, %s)"
+    )
+    sql_params = center + center + [radius_km * 1000]
+
+    if where:
+        sql += f" AND ({where})"
+        sql_params += list(params or [])
+
+    sql += f" ORDER BY {geography} <-> {point}"
+    sql_params += center
+
+    if limit is not None:
+        sql += " LIMIT %s"
+        sql_params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, sql_params)
+        return cursor.fetchall()
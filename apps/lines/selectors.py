@@ -2,12 +2,15 @@
 Selector functions for the lines app.
 """
 from django.db.models import Count, F, Q
+import heapq
 import logging
 
 from apps.core.selectors import get_object_or_404
-from apps.core.utils.geo import calculate_distance
+from apps.core.utils.geo import calculate_distance, get_bounding_box
+from apps.core.utils.spatial import nearest_within, postgis_enabled
 
 from .models import Line, LineStop, Schedule, Stop
+from .topology import get_line_topology
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +54,14 @@ def get_stop_by_id(stop_id):
     return get_object_or_404(Stop, id=stop_id)
 
 
+def _get_stops_in_order(stop_ids):
+    """
+    Load stops keeping the order of the given IDs.
+    """
+    stops = Stop.objects.in_bulk(stop_ids)
+    return [stops[stop_id] for stop_id in stop_ids if stop_id in stops]
+
+
 def get_stops_by_line(line_id):
     """
     Get stops for a line in order.
@@ -59,10 +70,26 @@ def get_stops_by_line(line_id):
         line_id: ID of the line
 
     Returns:
-        Queryset of stops
+        List of stops in route order
+    """
+    return _get_stops_in_order(get_line_topology(line_id).stop_ids)
+
+
+def get_line_stop_coordinates(line_id):
     """
-    line_stops = LineStop.objects.filter(line_id=line_id).order_by('order')
-    return Stop.objects.filter(id__in=line_stops.values_list('stop_id', flat=True))
+    Get the ordered stop coordinates of a line as native floats.
+
+    Args:
+        line_id: ID of the line
+
+    Returns:
+        List of (stop_id, latitude, longitude) tuples in route order
+    """
+    topology = get_line_topology(line_id)
+    return [
+        (stop_id, lat, lon)
+        for stop_id, (lat, lon) in zip(topology.stop_ids, topology.coordinates)
+    ]
 
 
 def get_line_stop(line_id, stop_id):
@@ -113,7 +140,7 @@ def get_active_stops():
     return Stop.objects.filter(is_active=True)
 
 
-def get_nearby_stops(latitude, longitude, radius_km=0.5):
+def get_nearby_stops(latitude, longitude, radius_km=0.5, limit=None):
     """
     Get stops near a location.
 
@@ -121,22 +148,28 @@ def get_nearby_stops(latitude, longitude, radius_km=0.5):
         latitude: Latitude of the location
         longitude: Longitude of the location
         radius_km: Radius in kilometers
+        limit: Optional maximum number of stops to return
 
     Returns:
-        Queryset of nearby stops
+        List of nearby stops sorted by distance, each with a ``distance`` attribute
     """
     try:
-        # This is a simplified approach without spatial database
-        # In production, you would use PostGIS for better performance
-
         # Convert latitude/longitude to float
         lat = float(latitude)
         lon = float(longitude)
 
-        # Get all active stops
-        stops = Stop.objects.filter(is_active=True)
+        if postgis_enabled():
+            return _get_nearby_stops_postgis(lat, lon, radius_km, limit)
+
+        # Narrow candidates with the (latitude, longitude) index
+        min_lat, max_lat, min_lon, max_lon = get_bounding_box(lat, lon, radius_km)
+        stops = Stop.objects.filter(
+            is_active=True,
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lon, max_lon),
+        )
 
-        # Filter stops by distance (naive approach)
+        # Exact distances only for stops inside the box
         nearby_stops = []
         for stop in stops:
             distance = calculate_distance(
@@ -146,6 +179,9 @@ def get_nearby_stops(latitude, longitude, radius_km=0.5):
                 stop.distance = distance
                 nearby_stops.append(stop)
 
+        if limit is not None:
+            return heapq.nsmallest(limit, nearby_stops, key=lambda x: x.distance)
+
         # Sort by distance
         nearby_stops.sort(key=lambda x: x.distance)
 
@@ -156,6 +192,25 @@ def get_nearby_stops(latitude, longitude, radius_km=0.5):
         return []
 
 
+def _get_nearby_stops_postgis(latitude, longitude, radius_km, limit=None):
+    """
+    Get nearby stops with ST_DWithin and KNN ordering on the geography index.
+    """
+    rows = nearest_within(
+        "lines_stop", latitude, longitude, radius_km,
+        limit=limit, where="lines_stop.is_active"
+    )
+    stops = Stop.objects.in_bulk([stop_id for stop_id, _ in rows])
+
+    nearby_stops = []
+    for stop_id, distance in rows:
+        stop = stops[stop_id]
+        stop.distance = distance
+        nearby_stops.append(stop)
+
+    return nearby_stops
+
+
 def search_lines(query):
     """
     Search for lines by name or code.
@@ -217,29 +272,14 @@ def get_next_stops(line_id, current_stop_id):
         current_stop_id: ID of the current stop
 
     Returns:
-        Queryset of next stops
+        List of next stops in route order
     """
     try:
-        # Get current stop order
-        current_order = LineStop.objects.get(
-            line_id=line_id,
-            stop_id=current_stop_id
-        ).order
-
-        # Get next stops
-        next_line_stops = LineStop.objects.filter(
-            line_id=line_id,
-            order__gt=current_order
-        ).order_by('order')
-
-        # Get stop IDs
-        stop_ids = next_line_stops.values_list('stop_id', flat=True)
-
-        return Stop.objects.filter(id__in=stop_ids)
+        return _get_stops_in_order(get_line_topology(line_id).stops_after(current_stop_id))
 
     except Exception as e:
         logger.error(f"Error getting next stops: {e}")
-        return Stop.objects.none()
+        return []
 
 
 def get_previous_stops(line_id, current_stop_id):
@@ -251,29 +291,14 @@ def get_previous_stops(line_id, current_stop_id):
         current_stop_id: ID of the current stop
 
     Returns:
-        Queryset of previous stops
+        List of previous stops, nearest first
     """
     try:
-        # Get current stop order
-        current_order = LineStop.objects.get(
-            line_id=line_id,
-            stop_id=current_stop_id
-        ).order
-
-        # Get previous stops
-        prev_line_stops = LineStop.objects.filter(
-            line_id=line_id,
-            order__lt=current_order
-        ).order_by('-order')
-
-        # Get stop IDs
-        stop_ids = prev_line_stops.values_list('stop_id', flat=True)
-
-        return Stop.objects.filter(id__in=stop_ids)
+        return _get_stops_in_order(get_line_topology(line_id).stops_before(current_stop_id))
 
     except Exception as e:
         logger.error(f"Error getting previous stops: {e}")
-        return Stop.objects.none()
+        return []
 
 
 def get_busiest_stops(limit=10):
@@ -314,39 +339,10 @@ def get_stop_distance(line_id, from_stop_id, to_stop_id):
         to_stop_id: ID of the ending stop
 
     Returns:
-        Distance in meters
+        Distance in meters, or None if a stop is not on the line
     """
     try:
-        # Get stop orders
-        from_order = LineStop.objects.get(
-            line_id=line_id,
-            stop_id=from_stop_id
-        ).order
-
-        to_order = LineStop.objects.get(
-            line_id=line_id,
-            stop_id=to_stop_id
-        ).order
-
-        # Ensure from_order < to_order
-        if from_order > to_order:
-            from_order, to_order = to_order, from_order
-
-        # Get line stops between from and to (inclusive)
-        line_stops = LineStop.objects.filter(
-            line_id=line_id,
-            order__gte=from_order,
-            order__lte=to_order
-        ).order_by('order')
-
-        # Calculate total distance
-        total_distance = 0
-        for i in range(1, len(line_stops)):
-            distance = line_stops[i].distance_from_previous
-            if distance:
-                total_distance += distance
-
-        return total_distance
+        return get_line_topology(line_id).distance_between(from_stop_id, to_stop_id)
 
     except Exception as e:
         logger.error(f"Error calculating stop distance: {e}")
@@ -2,16 +2,23 @@
 Service functions for the lines app.
 """
 import logging
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
 from django.db import transaction
 from django.db.models import F
 from django.utils import timezone
 
+from apps.core.constants import CACHE_KEY_LINE_TIMETABLE, CACHE_TIMEOUT_LINE_TIMETABLE
 from apps.core.exceptions import ValidationError
 from apps.core.services import BaseService, create_object, update_object
+from apps.core.utils.cache import bump_model_versions
 from apps.core.utils.geo import calculate_distance
 
 from .models import Line, LineStop, Schedule, Stop
 from .selectors import get_line_by_id, get_stop_by_id
+from .topology import bump_line_topology, get_line_topology
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +63,7 @@ class StopService(BaseService):
             }
 
             stop = create_object(Stop, stop_data)
+            bump_model_versions(Stop)
 
             logger.info(f"Created new stop: {stop.name}")
             return stop
@@ -81,6 +89,11 @@ class StopService(BaseService):
 
         try:
             update_object(stop, data)
+            bump_model_versions(Stop)
+            if "latitude" in data or "longitude" in data:
+                for line_id in LineStop.objects.filter(stop=stop).values_list("line_id", flat=True):
+                    TimetableService.invalidate(line_id)
+                    bump_line_topology(line_id)
             logger.info(f"Updated stop: {stop.name}")
             return stop
 
@@ -105,6 +118,7 @@ class StopService(BaseService):
         try:
             stop.is_active = False
             stop.save(update_fields=["is_active", "updated_at"])
+            bump_model_versions(Stop)
 
             logger.info(f"Deactivated stop: {stop.name}")
             return stop
@@ -149,6 +163,7 @@ class LineService(BaseService):
             }
 
             line = create_object(Line, line_data)
+            bump_model_versions(Line)
 
             logger.info(f"Created new line: {line.code} - {line.name}")
             return line
@@ -177,6 +192,8 @@ class LineService(BaseService):
 
         try:
             update_object(line, data)
+            bump_line_topology(line.id)
+            bump_model_versions(Line)
             logger.info(f"Updated line: {line.code} - {line.name}")
             return line
 
@@ -201,6 +218,8 @@ class LineService(BaseService):
         try:
             line.is_active = False
             line.save(update_fields=["is_active", "updated_at"])
+            bump_line_topology(line.id)
+            bump_model_versions(Line)
 
             logger.info(f"Deactivated line: {line.code} - {line.name}")
             return line
@@ -265,6 +284,9 @@ class LineService(BaseService):
                     pass
 
             line_stop = create_object(LineStop, line_stop_data)
+            TimetableService.invalidate(line.id)
+            bump_line_topology(line.id)
+            bump_model_versions(Line)
 
             logger.info(f"Added stop {stop.name} to line {line.code} at position {order}")
             return line_stop
@@ -307,6 +329,9 @@ class LineService(BaseService):
             ).update(
                 order=F("order") - 1
             )
+            TimetableService.invalidate(line.id)
+            bump_line_topology(line.id)
+            bump_model_versions(Line)
 
             logger.info(f"Removed stop {stop.name} from line {line.code}")
             return True
@@ -375,6 +400,9 @@ class LineService(BaseService):
             # Update the stop order
             line_stop.order = new_order
             line_stop.save(update_fields=["order", "updated_at"])
+            TimetableService.invalidate(line.id)
+            bump_line_topology(line.id)
+            bump_model_versions(Line)
 
             logger.info(
                 f"Updated order of stop {stop.name} in line {line.code} "
@@ -446,6 +474,8 @@ class ScheduleService(BaseService):
             }
 
             schedule = create_object(Schedule, schedule_data)
+            TimetableService.invalidate(line.id)
+            bump_model_versions(Schedule)
 
             logger.info(f"Created new schedule for line {line.code} on day {day_of_week}")
             return schedule
@@ -494,6 +524,8 @@ class ScheduleService(BaseService):
                     raise ValidationError("This schedule would overlap with an existing schedule.")
 
             update_object(schedule, data)
+            TimetableService.invalidate(schedule.line_id)
+            bump_model_versions(Schedule)
             logger.info(f"Updated schedule for line {schedule.line.code} on day {schedule.day_of_week}")
             return schedule
 
@@ -522,6 +554,8 @@ class ScheduleService(BaseService):
 
             # Delete schedule
             schedule.delete()
+            TimetableService.invalidate(schedule.line_id)
+            bump_model_versions(Schedule)
 
             logger.info(f"Deleted schedule for line {schedule.line.code} on day {schedule.day_of_week}")
             return True
@@ -534,6 +568,168 @@ class ScheduleService(BaseService):
             raise ValidationError(str(e))
 
 
+class TimetableService(BaseService):
+    """
+    Service for compiled line timetables.
+
+    Schedules only store (day, start, end, frequency) windows. The compiler
+    expands them into sorted departure times per service day and stop, in
+    seconds since midnight, so a next-departure lookup is a binary search.
+    Times at later stops are offset by the cumulative travel time along the
+    route and may run past 86400 on the same service day.
+    """
+
+    # Used to turn route distance into travel time when no measured time exists
+    AVERAGE_SPEED_KMH = 25.0
+
+    @classmethod
+    def get_cache_key(cls, line_id):
+        return CACHE_KEY_LINE_TIMETABLE.format(line_id=line_id)
+
+    @classmethod
+    def invalidate(cls, line_id):
+        """
+        Drop a line's compiled timetable once the surrounding transaction commits.
+
+        Args:
+            line_id: ID of the line
+        """
+        key = cls.get_cache_key(line_id)
+        transaction.on_commit(lambda: cache.delete(key))
+
+    @classmethod
+    def get_timetable(cls, line_id):
+        """
+        Get a line's compiled timetable, compiling it on a cache miss.
+
+        Args:
+            line_id: ID of the line
+
+        Returns:
+            Timetable dictionary (see ``compile_timetable``)
+        """
+        key = cls.get_cache_key(line_id)
+        timetable = cache.get(key)
+
+        if timetable is None:
+            timetable = cls.compile_timetable(line_id)
+            cache.set(key, timetable, CACHE_TIMEOUT_LINE_TIMETABLE)
+
+        return timetable
+
+    @classmethod
+    def get_stop_offsets(cls, line_id):
+        """
+        Get the travel time from the first stop to each stop of a line.
+
+        Measured ``average_time_from_previous`` is used when present, otherwise
+        the route distance from the line topology at the average bus speed.
+
+        Args:
+            line_id: ID of the line
+
+        Returns:
+            List of ``(stop_id, offset_seconds)`` in route order
+        """
+        topology = get_line_topology(line_id)
+        meters_per_second = cls.AVERAGE_SPEED_KMH * 1000 / 3600
+
+        offsets = []
+        elapsed = 0.0
+
+        for index, stop_id in enumerate(topology.stop_ids):
+            if index:
+                if topology.times_from_previous[index]:
+                    elapsed += topology.times_from_previous[index]
+                else:
+                    meters = topology.cumulative_distances[index] - topology.cumulative_distances[index - 1]
+                    elapsed += meters / meters_per_second
+
+            offsets.append((str(stop_id), int(round(elapsed))))
+
+        return offsets
+
+    @classmethod
+    def compile_timetable(cls, line_id):
+        """
+        Expand a line's active schedules into departure arrays.
+
+        Args:
+            line_id: ID of the line
+
+        Returns:
+            Dictionary with the ordered ``stops`` and their ``offsets``, and
+            ``days`` mapping day of week (as a string) to stop ID to a sorted
+            list of departure seconds since midnight
+        """
+        offsets = cls.get_stop_offsets(line_id)
+        schedules = Schedule.objects.filter(line_id=line_id, is_active=True).order_by('day_of_week', 'start_time')
+
+        origin_departures = {}
+        for schedule in schedules:
+            start = schedule.start_time.hour * 3600 + schedule.start_time.minute * 60 + schedule.start_time.second
+            end = schedule.end_time.hour * 3600 + schedule.end_time.minute * 60 + schedule.end_time.second
+            step = schedule.frequency_minutes * 60
+            origin_departures.setdefault(schedule.day_of_week, set()).update(range(start, end + 1, step))
+
+        days = {}
+        for day_of_week, departures in origin_departures.items():
+            departures = sorted(departures)
+            days[str(day_of_week)] = {
+                stop_id: [departure + offset for departure in departures]
+                for stop_id, offset in offsets
+            }
+
+        return {
+            'line_id': str(line_id),
+            'compiled_at': timezone.now().isoformat(),
+            'stops': [stop_id for stop_id, _ in offsets],
+            'offsets': [offset for _, offset in offsets],
+            'days': days,
+        }
+
+    @classmethod
+    def get_next_departures(cls, line_id, stop_id, after=None, limit=3):
+        """
+        Get the next scheduled departures of a line from a stop.
+
+        Args:
+            line_id: ID of the line
+            stop_id: ID of the stop
+            after: Datetime to search from (defaults to now)
+            limit: Maximum number of departures to return
+
+        Returns:
+            Sorted list of timezone-aware datetimes
+        """
+        timetable = cls.get_timetable(line_id)
+        stop_id = str(stop_id)
+        local = timezone.localtime(after or timezone.now())
+        seconds = local.hour * 3600 + local.minute * 60 + local.second
+
+        departures = []
+        # Start from yesterday's service day, whose late trips can run past midnight
+        for day_offset in range(-1, 8):
+            service_date = local.date() + timedelta(days=day_offset)
+            stop_departures = timetable['days'].get(str(service_date.weekday()), {}).get(stop_id)
+            if not stop_departures:
+                continue
+
+            index = bisect_left(stop_departures, seconds - day_offset * 86400)
+            midnight = timezone.make_aware(datetime.combine(service_date, time.min))
+            departures.extend(
+                midnight + timedelta(seconds=value)
+                for value in stop_departures[index:index + limit]
+            )
+
+            # Later service days cannot beat a departure before their midnight
+            if day_offset >= 0 and len(departures) >= limit:
+                if sorted(departures)[limit - 1] < midnight + timedelta(days=1):
+                    break
+
+        return sorted(departures)[:limit]
+
+
 class JourneyService(BaseService):
     """
     Service for journey planning between stops.
@@ -605,18 +801,14 @@ class JourneyService(BaseService):
 
         # One-transfer routes
         seen_pairs = set()
+        transfers = []
         for from_ls in from_line_stops:
             from_line_id = from_ls.line_id
             if from_line_id in direct_line_ids:
                 continue
 
             # Stops on the first line that come after the boarding stop
-            transfer_stop_ids = list(
-                LineStop.objects.filter(
-                    line_id=from_line_id,
-                    order__gt=from_ls.order,
-                ).values_list('stop_id', flat=True)
-            )
+            transfer_stop_ids = set(get_line_topology(from_line_id).stops_after(from_stop_id))
 
             if not transfer_stop_ids:
                 continue
@@ -633,56 +825,64 @@ class JourneyService(BaseService):
                 # Find the earliest transfer stop on the second line
                 # that is also on the first line after from_stop
                 # and comes before the alighting stop on the second line
-                transfer_on_to_line = LineStop.objects.filter(
-                    line_id=to_line_id,
-                    stop_id__in=transfer_stop_ids,
-                    order__lt=to_ls.order,
-                ).order_by('order').first()
+                to_topology = get_line_topology(to_line_id)
+                to_index = to_topology.index_of(to_stop_id)
+                transfer_stop_id = next(
+                    (
+                        stop_id for stop_id in to_topology.stop_ids[:to_index or 0]
+                        if stop_id in transfer_stop_ids
+                    ),
+                    None
+                )
 
-                if transfer_on_to_line:
+                if transfer_stop_id:
                     seen_pairs.add(pair_key)
-                    from_line = from_ls.line
-                    to_line = to_ls.line
-                    transfer_stop = transfer_on_to_line.stop
-
-                    results.append({
-                        'route_type': 'one_transfer',
-                        'first_leg': {
-                            'line': {
-                                'id': str(from_line.id),
-                                'code': from_line.code,
-                                'name': from_line.name,
-                            },
-                            'board_at': {
-                                'id': str(from_ls.stop.id),
-                                'name': from_ls.stop.name,
-                            },
-                            'alight_at': {
-                                'id': str(transfer_stop.id),
-                                'name': transfer_stop.name,
-                            },
-                        },
-                        'transfer_at': {
-                            'id': str(transfer_stop.id),
-                            'name': transfer_stop.name,
-                        },
-                        'second_leg': {
-                            'line': {
-                                'id': str(to_line.id),
-                                'code': to_line.code,
-                                'name': to_line.name,
-                            },
-                            'board_at': {
-                                'id': str(transfer_stop.id),
-                                'name': transfer_stop.name,
-                            },
-                            'alight_at': {
-                                'id': str(to_ls.stop.id),
-                                'name': to_ls.stop.name,
-                            },
-                        },
-                        'eta_minutes': cls._get_eta_minutes(str(from_ls.line_id), from_stop_id),
-                    })
+                    transfers.append((from_ls, to_ls, transfer_stop_id))
+
+        transfer_stops = Stop.objects.in_bulk({stop_id for _, _, stop_id in transfers})
+        for from_ls, to_ls, transfer_stop_id in transfers:
+            from_line = from_ls.line
+            to_line = to_ls.line
+            transfer_stop = transfer_stops[transfer_stop_id]
+
+            results.append({
+                'route_type': 'one_transfer',
+                'first_leg': {
+                    'line': {
+                        'id': str(from_line.id),
+                        'code': from_line.code,
+                        'name': from_line.name,
+                    },
+                    'board_at': {
+                        'id': str(from_ls.stop.id),
+                        'name': from_ls.stop.name,
+                    },
+                    'alight_at': {
+                        'id': str(transfer_stop.id),
+                        'name': transfer_stop.name,
+                    },
+                },
+                'transfer_at': {
+                    'id': str(transfer_stop.id),
+                    'name': transfer_stop.name,
+                },
+                'second_leg': {
+                    'line': {
+                        'id': str(to_line.id),
+                        'code': to_line.code,
+                        'name': to_line.name,
+                    },
+                    'board_at': {
+                        'id': str(transfer_stop.id),
+                        'name': transfer_stop.name,
+                    },
+                    'alight_at': {
+                        'id': str(to_ls.stop.id),
+                        'name': to_ls.stop.name,
+                    },
+                },
+                'eta_minutes': cls._get_eta_minutes(str(from_ls.line_id), from_stop_id),
+            })
 
         return results[:10]
 
@@ -711,22 +911,16 @@ class JourneyService(BaseService):
                 trip_id=active_trip.id
             ).order_by('-created_at').first()
 
-            if not latest_location or not latest_location.nearest_stop:
+            if not latest_location or not latest_location.nearest_stop_id:
                 return None
 
-            try:
-                bus_stop_order = LineStop.objects.get(
-                    line_id=line_id,
-                    stop=latest_location.nearest_stop,
-                ).order
-                target_stop_order = LineStop.objects.get(
-                    line_id=line_id,
-                    stop_id=stop_id,
-                ).order
-            except LineStop.DoesNotExist:
+            topology = get_line_topology(line_id)
+            bus_index = topology.index_of(latest_location.nearest_stop_id)
+            target_index = topology.index_of(stop_id)
+            if bus_index is None or target_index is None:
                 return None
 
-            stops_away = target_stop_order - bus_stop_order
+            stops_away = topology.orders[target_index] - topology.orders[bus_index]
             if stops_away <= 0:
                 return None
 
@@ -0,0 +1,246 @@
+"""
+Cached route topology for lines.
+
+A ``LineTopology`` holds everything about a line's stop sequence that the
+selectors and services keep recomputing: ordered stop IDs, float coordinates,
+order and stop lookups, and cumulative distances. Topologies are versioned per
+line; ``LineService`` bumps the version whenever the route changes, which
+retires both the Redis copy and every process-local copy at once.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from apps.core.constants import (
+    CACHE_KEY_LINE_TOPOLOGY,
+    CACHE_KEY_LINE_TOPOLOGY_VERSION,
+    CACHE_TIMEOUT_LINE_TOPOLOGY,
+)
+from apps.core.utils.geo import haversine_distance
+
+from .models import LineStop
+
+logger = logging.getLogger(__name__)
+
+
+# Topologies kept in each process; a line has a few dozen stops at most
+LOCAL_CACHE_SIZE = 256
+
+_local_cache = OrderedDict()
+_local_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class LineTopology:
+    """
+    Ordered stop sequence of a line.
+
+    ``cumulative_distances`` are meters from the first stop, using the stored
+    ``distance_from_previous`` and the straight-line distance where it is
+    missing. ``times_from_previous`` holds the measured travel times (or None).
+    """
+
+    line_id: str
+    version: Optional[int]
+    stop_ids: Tuple = ()
+    orders: Tuple[int, ...] = ()
+    coordinates: Tuple[Tuple[float, float], ...] = ()
+    cumulative_distances: Tuple[float, ...] = ()
+    times_from_previous: Tuple[Optional[int], ...] = ()
+    stop_index: Dict[str, int] = field(default_factory=dict)
+    order_index: Dict[int, int] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, line_id, version=None):
+        """
+        Build a line's topology with one query.
+
+        Args:
+            line_id: ID of the line
+            version: Version the topology is stored under
+
+        Returns:
+            LineTopology
+        """
+        rows = LineStop.objects.filter(line_id=line_id).order_by('order').values_list(
+            'stop_id',
+            'order',
+            'distance_from_previous',
+            'average_time_from_previous',
+            Cast('stop__latitude', FloatField()),
+            Cast('stop__longitude', FloatField()),
+        )
+
+        stop_ids, orders, coordinates, distances, times = [], [], [], [], []
+        total = 0.0
+
+        for stop_id, order, distance_from_previous, time_from_previous, lat, lon in rows:
+            if coordinates:
+                if distance_from_previous is not None:
+                    total += float(distance_from_previous)
+                else:
+                    total += haversine_distance(*coordinates[-1], lat, lon) * 1000
+
+            stop_ids.append(stop_id)
+            orders.append(order)
+            coordinates.append((lat, lon))
+            distances.append(total)
+            times.append(time_from_previous)
+
+        return cls(
+            line_id=str(line_id),
+            version=version,
+            stop_ids=tuple(stop_ids),
+            orders=tuple(orders),
+            coordinates=tuple(coordinates),
+            cumulative_distances=tuple(distances),
+            times_from_previous=tuple(times),
+            stop_index={str(stop_id): index for index, stop_id in enumerate(stop_ids)},
+            order_index={order: index for index, order in enumerate(orders)},
+        )
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def __contains__(self, stop_id):
+        return str(stop_id) in self.stop_index
+
+    def index_of(self, stop_id) -> Optional[int]:
+        """Get the position of a stop on the line, or None."""
+        return self.stop_index.get(str(stop_id))
+
+    def stops_after(self, stop_id) -> List:
+        """Get the IDs of the stops after a stop, in route order."""
+        index = self.index_of(stop_id)
+        return [] if index is None else list(self.stop_ids[index + 1:])
+
+    def stops_before(self, stop_id) -> List:
+        """Get the IDs of the stops before a stop, nearest first."""
+        index = self.index_of(stop_id)
+        return [] if index is None else list(reversed(self.stop_ids[:index]))
+
+    def distance_between(self, from_stop_id, to_stop_id) -> Optional[float]:
+        """
+        Get the route distance between two stops in meters.
+
+        Returns:
+            Distance in meters (direction-independent) or None if a stop is
+            not on the line
+        """
+        from_index = self.index_of(from_stop_id)
+        to_index = self.index_of(to_stop_id)
+        if from_index is None or to_index is None:
+            return None
+        return abs(self.cumulative_distances[to_index] - self.cumulative_distances[from_index])
+
+    def nearest_index(self, latitude: float, longitude: float) -> Tuple[Optional[int], float]:
+        """
+        Find the stop closest to a point.
+
+        Returns:
+            (index, distance in km), or (None, inf) for a line without stops
+        """
+        nearest, min_distance = None, float('inf')
+        for index, (lat, lon) in enumerate(self.coordinates):
+            distance = haversine_distance(latitude, longitude, lat, lon)
+            if distance < min_distance:
+                nearest, min_distance = index, distance
+        return nearest, min_distance
+
+
+def _version_key(line_id):
+    return CACHE_KEY_LINE_TOPOLOGY_VERSION.format(line_id=line_id)
+
+
+def _get_version(line_id):
+    key = _version_key(line_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a lost counter never reuses an old version
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_line_topology(line_id) -> LineTopology:
+    """
+    Get a line's topology.
+
+    Checks the process-local LRU first, then Redis, then builds it from the
+    database. Every lookup reads the line's version, so a bump made by any
+    process is seen immediately. Without a shared cache (version unknown) the
+    topology is built fresh on each call.
+
+    Args:
+        line_id: ID of the line
+
+    Returns:
+        LineTopology
+    """
+    line_id = str(line_id)
+
+    try:
+        version = _get_version(line_id)
+    except Exception as e:
+        logger.warning(f"Failed to read topology version for line {line_id}: {e}")
+        version = None
+
+    if version is None:
+        return LineTopology.build(line_id)
+
+    with _local_lock:
+        topology = _local_cache.get(line_id)
+        if topology is not None and topology.version == version:
+            _local_cache.move_to_end(line_id)
+            return topology
+
+    key = CACHE_KEY_LINE_TOPOLOGY.format(line_id=line_id, version=version)
+    topology = cache.get(key)
+    if topology is None:
+        topology = LineTopology.build(line_id, version)
+        cache.set(key, topology, CACHE_TIMEOUT_LINE_TOPOLOGY)
+
+    with _local_lock:
+        _local_cache[line_id] = topology
+        _local_cache.move_to_end(line_id)
+        while len(_local_cache) > LOCAL_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+
+    return topology
+
+
+def bump_line_topology(line_id):
+    """
+    Retire a line's cached topology once the surrounding transaction commits.
+
+    Args:
+        line_id: ID of the line
+    """
+    line_id = str(line_id)
+
+    def bump():
+        with _local_lock:
+            _local_cache.pop(line_id, None)
+        key = _version_key(line_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), None)
+        except Exception as e:
+            logger.warning(f"Failed to bump topology version for line {line_id}: {e}")
+
+    transaction.on_commit(bump)
+
+
+def clear_local_topologies():
+    """Drop every process-local topology."""
+    with _local_lock:
+        _local_cache.clear()
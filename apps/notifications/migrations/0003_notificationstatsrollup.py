@@ -0,0 +1,37 @@
+# Generated by Django 5.2.12 on 2026-10-18 20:47
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_alter_notification_notification_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationStatsRollup',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(db_index=True, verbose_name='bucket start')),
+                ('channel', models.CharField(blank=True, max_length=20, verbose_name='channel')),
+                ('notification_type', models.CharField(max_length=50, verbose_name='notification type')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='created')),
+                ('read_count', models.PositiveIntegerField(default=0, verbose_name='read')),
+                ('scheduled_created_count', models.PositiveIntegerField(default=0, verbose_name='scheduled created')),
+                ('scheduled_errored_count', models.PositiveIntegerField(default=0, verbose_name='scheduled errored')),
+                ('scheduled_sent_count', models.PositiveIntegerField(default=0, verbose_name='scheduled sent')),
+                ('scheduled_failed_count', models.PositiveIntegerField(default=0, verbose_name='scheduled failed')),
+            ],
+            options={
+                'verbose_name': 'notification stats rollup',
+                'verbose_name_plural': 'notification stats rollups',
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('bucket_start', 'channel', 'notification_type'), name='unique_notification_stats_bucket')],
+            },
+        ),
+    ]
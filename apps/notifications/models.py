@@ -91,7 +91,7 @@ class Notification(BaseModel):
         verbose_name_plural = _("notifications")
         ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["user", "-created_at", "-id"]),
             models.Index(fields=["user", "is_read"]),
         ]
 
@@ -231,4 +231,47 @@ class NotificationSchedule(BaseModel):
         ]
         
     def __str__(self):
-        return f"{self.title} - {self.scheduled_for}"
\ No newline at end of file
+        return f"{self.title} - {self.scheduled_for}"
+
+
+class NotificationStatsRollup(BaseModel):
+    """
+    Hourly pre-aggregated notification counters used by the monitor.
+
+    Notification counters are bucketed by creation hour and broken down by
+    channel and type. Scheduled-notification outcomes have no single channel,
+    so they are stored on rows with an empty channel.
+    """
+    bucket_start = models.DateTimeField(_("bucket start"), db_index=True)
+    channel = models.CharField(_("channel"), max_length=20, blank=True)
+    notification_type = models.CharField(_("notification type"), max_length=50)
+
+    created_count = models.PositiveIntegerField(_("created"), default=0)
+    read_count = models.PositiveIntegerField(_("read"), default=0)
+    scheduled_created_count = models.PositiveIntegerField(
+        _("scheduled created"),
+        default=0,
+    )
+    scheduled_errored_count = models.PositiveIntegerField(
+        _("scheduled errored"),
+        default=0,
+    )
+    scheduled_sent_count = models.PositiveIntegerField(_("scheduled sent"), default=0)
+    scheduled_failed_count = models.PositiveIntegerField(
+        _("scheduled failed"),
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = _("notification stats rollup")
+        verbose_name_plural = _("notification stats rollups")
+        ordering = ["-bucket_start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket_start", "channel", "notification_type"],
+                name="unique_notification_stats_bucket",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket_start:%Y-%m-%d %H:00} - {self.channel or '-'}/{self.notification_type}"
@@ -19,6 +19,7 @@ from .models import (
     NotificationPreference
 )
 from .firebase import FCMService
+from .rollups import get_window_counts
 
 logger = logging.getLogger(__name__)
 
@@ -87,11 +88,14 @@ class NotificationMonitor:
             # Collect all metrics
             metrics = []
             
+            # Counters shared by the windowed checks
+            counts = get_window_counts(timezone.now() - timedelta(hours=24))
+            
             # Firebase connectivity
             metrics.append(cls._check_firebase_status())
             
             # Delivery rates
-            metrics.append(cls._check_delivery_rates())
+            metrics.append(cls._check_delivery_rates(counts=counts))
             
             # Queue health
             metrics.append(cls._check_queue_health())
@@ -103,7 +107,7 @@ class NotificationMonitor:
             metrics.append(cls._check_system_performance())
             
             # Error rates
-            metrics.append(cls._check_error_rates())
+            metrics.append(cls._check_error_rates(counts=counts))
             
             # Calculate overall health
             health_score = cls._calculate_health_score(metrics)
@@ -153,40 +157,15 @@ class NotificationMonitor:
         try:
             since = timezone.now() - timedelta(hours=hours)
             
-            # Basic counts
-            total_notifications = Notification.objects.filter(
-                created_at__gte=since
-            ).count()
-            
-            read_notifications = Notification.objects.filter(
-                created_at__gte=since,
-                is_read=True
-            ).count()
-            
-            scheduled_sent = NotificationSchedule.objects.filter(
-                sent_at__gte=since,
-                is_sent=True
-            ).count()
-            
-            scheduled_failed = NotificationSchedule.objects.filter(
-                created_at__gte=since,
-                is_sent=True,
-                error__isnull=False
-            ).exclude(error='').count()
-            
-            # Channel breakdown
-            channel_stats = Notification.objects.filter(
-                created_at__gte=since
-            ).values('channel').annotate(count=Count('id'))
-            
-            # Type breakdown
-            type_stats = Notification.objects.filter(
-                created_at__gte=since
-            ).values('notification_type').annotate(count=Count('id'))
+            # Pre-aggregated counters for the window
+            counts = get_window_counts(since)
+            total_notifications = counts['created']
+            read_notifications = counts['read']
+            scheduled_sent = counts['scheduled_sent']
+            scheduled_failed = counts['scheduled_failed']
             
             # Device token stats
-            active_tokens = DeviceToken.objects.filter(is_active=True).count()
-            inactive_tokens = DeviceToken.objects.filter(is_active=False).count()
+            active_tokens, inactive_tokens = cls._get_token_counts()
             
             # Calculate rates
             read_rate = (read_notifications / total_notifications) if total_notifications > 0 else 0
@@ -208,8 +187,8 @@ class NotificationMonitor:
                     'delivery_rate': round(delivery_rate, 3)
                 },
                 'breakdowns': {
-                    'by_channel': {item['channel']: item['count'] for item in channel_stats},
-                    'by_type': {item['notification_type']: item['count'] for item in type_stats}
+                    'by_channel': counts['by_channel'],
+                    'by_type': counts['by_type']
                 }
             }
             
@@ -390,22 +369,15 @@ class NotificationMonitor:
             )
     
     @classmethod
-    def _check_delivery_rates(cls) -> NotificationMetric:
+    def _check_delivery_rates(cls, counts: Optional[Dict[str, Any]] = None) -> NotificationMetric:
         """Check notification delivery rates."""
         try:
             # Check last 24 hours
-            since = timezone.now() - timedelta(hours=24)
+            if counts is None:
+                counts = get_window_counts(timezone.now() - timedelta(hours=24))
             
-            sent = NotificationSchedule.objects.filter(
-                sent_at__gte=since,
-                is_sent=True
-            ).count()
-            
-            failed = NotificationSchedule.objects.filter(
-                sent_at__gte=since,
-                is_sent=True,
-                error__isnull=False
-            ).exclude(error='').count()
+            sent = counts['scheduled_sent']
+            failed = counts['scheduled_failed']
             
             total = sent + failed
             delivery_rate = sent / total if total > 0 else 1.0
@@ -478,8 +450,7 @@ class NotificationMonitor:
     def _check_token_health(cls) -> NotificationMetric:
         """Check device token health."""
         try:
-            active_tokens = DeviceToken.objects.filter(is_active=True).count()
-            inactive_tokens = DeviceToken.objects.filter(is_active=False).count()
+            active_tokens, inactive_tokens = cls._get_token_counts()
             total_tokens = active_tokens + inactive_tokens
             
             failure_rate = inactive_tokens / total_tokens if total_tokens > 0 else 0
@@ -567,20 +538,15 @@ class NotificationMonitor:
             )
     
     @classmethod
-    def _check_error_rates(cls) -> NotificationMetric:
+    def _check_error_rates(cls, counts: Optional[Dict[str, Any]] = None) -> NotificationMetric:
         """Check error rates in the system."""
         try:
             # Check last 24 hours for errors
-            since = timezone.now() - timedelta(hours=24)
+            if counts is None:
+                counts = get_window_counts(timezone.now() - timedelta(hours=24))
             
-            total_attempts = NotificationSchedule.objects.filter(
-                created_at__gte=since
-            ).count()
-            
-            failed_attempts = NotificationSchedule.objects.filter(
-                created_at__gte=since,
-                error__isnull=False
-            ).exclude(error='').count()
+            total_attempts = counts['scheduled_created']
+            failed_attempts = counts['scheduled_errored']
             
             error_rate = failed_attempts / total_attempts if total_attempts > 0 else 0
             
@@ -615,6 +581,15 @@ class NotificationMonitor:
                 timestamp=timezone.now()
             )
     
+    @classmethod
+    def _get_token_counts(cls):
+        """Get active and inactive device token counts in a single query."""
+        token_counts = DeviceToken.objects.aggregate(
+            active=Count('id', filter=Q(is_active=True)),
+            inactive=Count('id', filter=Q(is_active=False))
+        )
+        return token_counts['active'], token_counts['inactive']
+    
     @classmethod
     def _calculate_health_score(cls, metrics: List[NotificationMetric]) -> float:
         """Calculate overall health score from metrics."""
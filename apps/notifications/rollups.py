@@ -0,0 +1,278 @@
+"""
+Hourly notification statistics rollups.
+
+Closed hours are aggregated into ``NotificationStatsRollup`` rows by a periodic
+task, so monitoring windows read a handful of pre-aggregated buckets and only
+scan raw tables for the hours that have not been rolled up yet, before the
+first rolled-up bucket or after the last one.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Notification, NotificationSchedule, NotificationStatsRollup
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_WATERMARK = "notifications:rollup:watermark"
+CACHE_KEY_LOW_WATERMARK = "notifications:rollup:low_watermark"
+
+COUNTER_FIELDS = (
+    "created",
+    "read",
+    "scheduled_created",
+    "scheduled_errored",
+    "scheduled_sent",
+    "scheduled_failed",
+)
+
+SCHEDULE_ERROR_Q = Q(error__isnull=False) & ~Q(error="")
+
+
+def truncate_to_hour(value: datetime) -> datetime:
+    """
+    Align a datetime to the start of its UTC hour.
+    """
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _empty_counts() -> Dict[str, Any]:
+    counts = {field: 0 for field in COUNTER_FIELDS}
+    counts["by_channel"] = defaultdict(int)
+    counts["by_type"] = defaultdict(int)
+    return counts
+
+
+def _accumulate(counts: Dict[str, Any], channel: str, notification_type: str, **values):
+    for field, value in values.items():
+        counts[field] += value or 0
+
+    created = values.get("created") or 0
+    if created:
+        if channel:
+            counts["by_channel"][channel] += created
+        counts["by_type"][notification_type] += created
+
+
+def _raw_aggregates(start: datetime, end: Optional[datetime] = None, bucketed: bool = False):
+    """
+    Yield ``(bucket, channel, notification_type, counters)`` from the raw tables.
+
+    Args:
+        start: Inclusive lower bound
+        end: Exclusive upper bound, or None for open-ended
+        bucketed: Group by UTC hour as well
+
+    Yields:
+        Tuples of bucket start (None when not bucketed), channel, type and counters
+    """
+    def in_range(field):
+        lookups = {f"{field}__gte": start}
+        if end is not None:
+            lookups[f"{field}__lt"] = end
+        return lookups
+
+    def group(queryset, time_field, *fields):
+        if bucketed:
+            queryset = queryset.annotate(bucket=TruncHour(time_field, tzinfo=dt_timezone.utc))
+            return queryset.values("bucket", *fields)
+        return queryset.values(*fields)
+
+    notifications = group(
+        Notification.objects.filter(**in_range("created_at")),
+        "created_at",
+        "channel",
+        "notification_type",
+    ).annotate(
+        created=Count("id"),
+        read=Count("id", filter=Q(is_read=True)),
+    ).order_by()
+    for row in notifications:
+        yield row.get("bucket"), row["channel"], row["notification_type"], {
+            "created": row["created"],
+            "read": row["read"],
+        }
+
+    scheduled = group(
+        NotificationSchedule.objects.filter(**in_range("created_at")),
+        "created_at",
+        "notification_type",
+    ).annotate(
+        scheduled_created=Count("id"),
+        scheduled_errored=Count("id", filter=SCHEDULE_ERROR_Q),
+    ).order_by()
+    for row in scheduled:
+        yield row.get("bucket"), "", row["notification_type"], {
+            "scheduled_created": row["scheduled_created"],
+            "scheduled_errored": row["scheduled_errored"],
+        }
+
+    delivered = group(
+        NotificationSchedule.objects.filter(is_sent=True, **in_range("sent_at")),
+        "sent_at",
+        "notification_type",
+    ).annotate(
+        scheduled_sent=Count("id"),
+        scheduled_failed=Count("id", filter=SCHEDULE_ERROR_Q),
+    ).order_by()
+    for row in delivered:
+        yield row.get("bucket"), "", row["notification_type"], {
+            "scheduled_sent": row["scheduled_sent"],
+            "scheduled_failed": row["scheduled_failed"],
+        }
+
+
+def build_hourly_rollups(start: datetime, end: Optional[datetime] = None) -> int:
+    """
+    Rebuild rollup buckets for every closed hour in ``[start, end)``.
+
+    Buckets are replaced rather than incremented, so the same range can be
+    rebuilt safely (e.g. to pick up notifications read after their hour closed,
+    or to backfill history).
+
+    Args:
+        start: Start of the range (aligned down to the hour)
+        end: End of the range (aligned down to the hour), defaults to now
+
+    Returns:
+        Number of rollup rows written
+    """
+    start = truncate_to_hour(start)
+    end = truncate_to_hour(end or timezone.now())
+    if start >= end:
+        return 0
+
+    low_watermark = get_rollup_low_watermark()
+    watermark = get_rollup_watermark()
+
+    buckets = {}
+    for bucket, channel, notification_type, values in _raw_aggregates(start, end, bucketed=True):
+        key = (bucket, channel, notification_type)
+        row = buckets.get(key)
+        if row is None:
+            row = buckets[key] = NotificationStatsRollup(
+                bucket_start=bucket,
+                channel=channel,
+                notification_type=notification_type,
+            )
+        for field, value in values.items():
+            setattr(row, f"{field}_count", getattr(row, f"{field}_count") + value)
+
+    with transaction.atomic():
+        NotificationStatsRollup.objects.filter(
+            bucket_start__gte=start,
+            bucket_start__lt=end,
+        ).delete()
+        NotificationStatsRollup.objects.bulk_create(buckets.values(), batch_size=500)
+
+    # The watermarks only grow over ranges touching the rolled-up hours, so
+    # every hour between them stays rolled up
+    if low_watermark is None or watermark is None:
+        low_watermark, watermark = start, end
+    elif start <= watermark and end >= low_watermark:
+        low_watermark, watermark = min(low_watermark, start), max(watermark, end)
+    else:
+        logger.warning(
+            f"Notification rollups of {start} - {end} are not contiguous with "
+            f"{low_watermark} - {watermark}; backfill the hours between"
+        )
+    cache.set(CACHE_KEY_LOW_WATERMARK, low_watermark, None)
+    cache.set(CACHE_KEY_WATERMARK, watermark, None)
+
+    logger.info(f"Rebuilt {len(buckets)} notification rollup rows for {start} - {end}")
+    return len(buckets)
+
+
+def get_rollup_watermark(refresh: bool = False) -> Optional[datetime]:
+    """
+    Get the end of the most recent rolled-up hour, or None if nothing is rolled up.
+    """
+    if not refresh:
+        watermark = cache.get(CACHE_KEY_WATERMARK)
+        if watermark is not None:
+            return watermark
+
+    latest = NotificationStatsRollup.objects.aggregate(latest=Max("bucket_start"))["latest"]
+    if latest is None:
+        return None
+
+    watermark = latest + timedelta(hours=1)
+    cache.set(CACHE_KEY_WATERMARK, watermark, None)
+    return watermark
+
+
+def get_rollup_low_watermark(refresh: bool = False) -> Optional[datetime]:
+    """
+    Get the start of the first rolled-up hour, or None if nothing is rolled up.
+    """
+    if not refresh:
+        low_watermark = cache.get(CACHE_KEY_LOW_WATERMARK)
+        if low_watermark is not None:
+            return low_watermark
+
+    low_watermark = NotificationStatsRollup.objects.aggregate(earliest=Min("bucket_start"))["earliest"]
+    if low_watermark is None:
+        return None
+
+    cache.set(CACHE_KEY_LOW_WATERMARK, low_watermark, None)
+    return low_watermark
+
+
+def _rollup_rows(start: datetime, end: datetime) -> Iterable:
+    return NotificationStatsRollup.objects.filter(
+        bucket_start__gte=start,
+        bucket_start__lt=end,
+    ).values("channel", "notification_type").annotate(
+        **{field: Sum(f"{field}_count") for field in COUNTER_FIELDS}
+    ).order_by()
+
+
+def get_window_counts(since: datetime) -> Dict[str, Any]:
+    """
+    Get notification counters from ``since`` (aligned down to the hour) until now.
+
+    Rolled-up hours are read from the rollup table; hours before the low
+    watermark and the tail after the watermark are aggregated from the raw
+    tables.
+
+    Args:
+        since: Start of the window
+
+    Returns:
+        Dictionary of counters plus ``by_channel`` and ``by_type`` breakdowns
+        of created notifications
+    """
+    window_start = truncate_to_hour(since)
+    counts = _empty_counts()
+
+    low_watermark = get_rollup_low_watermark()
+    watermark = get_rollup_watermark()
+    live_start = window_start
+    if low_watermark is not None and watermark is not None and watermark > window_start:
+        rolled_up_start = max(window_start, low_watermark)
+        if rolled_up_start > window_start:
+            for _, channel, notification_type, values in _raw_aggregates(window_start, rolled_up_start):
+                _accumulate(counts, channel, notification_type, **values)
+
+        for row in _rollup_rows(rolled_up_start, watermark):
+            _accumulate(
+                counts,
+                row["channel"],
+                row["notification_type"],
+                **{field: row[field] for field in COUNTER_FIELDS},
+            )
+        live_start = max(watermark, rolled_up_start)
+
+    for _, channel, notification_type, values in _raw_aggregates(live_start):
+        _accumulate(counts, channel, notification_type, **values)
+
+    counts["by_channel"] = dict(counts["by_channel"])
+    counts["by_type"] = dict(counts["by_type"])
+    return counts
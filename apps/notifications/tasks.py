@@ -202,6 +202,31 @@ def send_trip_updates():
         logger.error(f"Error sending trip updates: {e}")
         return {'status': 'error', 'message': str(e)}
 
+@shared_task(name='notifications.rollup_stats')
+def rollup_notification_stats(hours=24):
+    """
+    Rebuild hourly notification statistics rollups.
+    This task should run hourly; pass a larger ``hours`` value to backfill.
+    
+    Args:
+        hours: Number of closed hours to rebuild
+    """
+    try:
+        from datetime import timedelta
+        from .rollups import build_hourly_rollups, get_rollup_watermark
+        
+        start = timezone.now() - timedelta(hours=hours)
+        # Catch up on the hours missed while the task was not running
+        watermark = get_rollup_watermark()
+        if watermark is not None:
+            start = min(start, watermark)
+        rows = build_hourly_rollups(start)
+        
+        return {'status': 'success', 'hours': hours, 'rows': rows}
+    except Exception as e:
+        logger.error(f"Error rolling up notification stats: {e}")
+        return {'status': 'error', 'message': str(e)}
+
 # R15 — Consolidation: re-export enhanced task functions so callers can
 # import from the canonical tasks.py. enhanced_tasks.py is a deprecated shim.
 from .enhanced_tasks import (  # noqa: E402, F401
@@ -715,7 +715,8 @@ class NotificationPerformanceTestCase(NotificationAPITestCase):
                 message=f'Message {i}'
             )
         
-        with self.assertNumQueries(3):  # Should be optimized with select_related
+        # Keyset pagination skips the COUNT(*) of page-number pagination
+        with self.assertNumQueries(2):  # Should be optimized with select_related
             response = self.user_client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
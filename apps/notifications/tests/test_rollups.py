@@ -0,0 +1,132 @@
+"""
+Tests for hourly notification statistics rollups.
+"""
+from datetime import timedelta
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from apps.notifications.models import (
+    Notification,
+    NotificationSchedule,
+    NotificationStatsRollup
+)
+from apps.notifications.monitoring import NotificationMonitor
+from apps.notifications.rollups import (
+    build_hourly_rollups,
+    get_window_counts,
+    truncate_to_hour
+)
+
+User = get_user_model()
+
+
+class NotificationRollupTest(TestCase):
+    """Test building and reading notification rollups."""
+
+    def setUp(self):
+        """Set up test data spread over the last few hours."""
+        self.user = User.objects.create_user(
+            email='rollup@example.com',
+            password='testpass123'
+        )
+        self.now = timezone.now()
+
+        for i in range(4):
+            notification = Notification.objects.create(
+                user=self.user,
+                notification_type='system',
+                title=f'Notification {i}',
+                message=f'Message {i}',
+                channel='push' if i % 2 else 'in_app',
+                is_read=(i < 3)
+            )
+            Notification.objects.filter(pk=notification.pk).update(
+                created_at=self.now - timedelta(hours=i + 2)
+            )
+
+        schedule = NotificationSchedule.objects.create(
+            user=self.user,
+            notification_type='system',
+            scheduled_for=self.now - timedelta(hours=3),
+            title='Scheduled',
+            message='Scheduled message',
+            is_sent=True,
+            sent_at=self.now - timedelta(hours=3),
+            error='Delivery failed'
+        )
+        NotificationSchedule.objects.filter(pk=schedule.pk).update(
+            created_at=self.now - timedelta(hours=3)
+        )
+
+    def test_build_hourly_rollups_creates_buckets(self):
+        """Test that closed hours are aggregated into rollup rows."""
+        build_hourly_rollups(self.now - timedelta(hours=24))
+
+        totals = {
+            'created': sum(r.created_count for r in NotificationStatsRollup.objects.all()),
+            'read': sum(r.read_count for r in NotificationStatsRollup.objects.all()),
+        }
+        self.assertEqual(totals, {'created': 4, 'read': 3})
+
+        schedule_row = NotificationStatsRollup.objects.get(channel='')
+        self.assertEqual(schedule_row.scheduled_created_count, 1)
+        self.assertEqual(schedule_row.scheduled_sent_count, 1)
+        self.assertEqual(schedule_row.scheduled_failed_count, 1)
+
+    def test_rebuild_is_idempotent(self):
+        """Test that rebuilding a range replaces buckets instead of adding to them."""
+        build_hourly_rollups(self.now - timedelta(hours=24))
+        first = NotificationStatsRollup.objects.count()
+
+        build_hourly_rollups(self.now - timedelta(hours=24))
+
+        self.assertEqual(NotificationStatsRollup.objects.count(), first)
+
+    def test_window_counts_match_raw_tables(self):
+        """Test that rolled-up and live counts agree."""
+        live = get_window_counts(self.now - timedelta(hours=24))
+
+        build_hourly_rollups(self.now - timedelta(hours=24))
+        rolled_up = get_window_counts(self.now - timedelta(hours=24))
+
+        self.assertEqual(live, rolled_up)
+        self.assertEqual(rolled_up['by_channel'], {'in_app': 2, 'push': 2})
+
+    def test_window_counts_include_live_tail(self):
+        """Test that notifications after the watermark are still counted."""
+        build_hourly_rollups(self.now - timedelta(hours=24))
+        Notification.objects.create(
+            user=self.user,
+            notification_type='system',
+            title='Fresh',
+            message='Fresh message'
+        )
+
+        counts = get_window_counts(self.now - timedelta(hours=24))
+
+        self.assertEqual(counts['created'], 5)
+
+    def test_window_counts_include_hours_before_rollups(self):
+        """Test that hours older than the first rolled-up bucket are still counted."""
+        build_hourly_rollups(self.now - timedelta(hours=3))
+
+        counts = get_window_counts(self.now - timedelta(hours=24))
+
+        self.assertEqual(counts['created'], 4)
+        self.assertEqual(counts['by_channel'], {'in_app': 2, 'push': 2})
+
+    def test_stats_read_from_rollups(self):
+        """Test that monitor stats use rollup buckets."""
+        NotificationStatsRollup.objects.create(
+            bucket_start=truncate_to_hour(self.now - timedelta(hours=1)),
+            channel='sms',
+            notification_type='system',
+            created_count=10,
+            read_count=5
+        )
+
+        stats = NotificationMonitor.get_notification_stats(hours=24)
+
+        self.assertEqual(stats['breakdowns']['by_channel']['sms'], 10)
@@ -8,7 +8,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
-from apps.api.pagination import StandardResultsSetPagination
+from apps.api.pagination import KeysetPagination, StandardResultsSetPagination
 from apps.api.permissions import IsOwnerOrReadOnly
 from apps.core.permissions import IsAdmin
 from .models import DeviceToken, Notification, NotificationPreference, NotificationSchedule
@@ -69,7 +69,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     """
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filterset_class = NotificationFilter
 
     def get_permissions(self):
@@ -0,0 +1,216 @@
+"""
+Buffered, sampled recording of offline mode events.
+
+Events are pushed to a Redis list (or a process-local buffer when the cache
+is not Redis) and written to ``OfflineLog`` in bulk by a periodic flush, so
+cache reads never wait on an INSERT. Every event is counted in daily
+aggregate metrics; only a sample of high-volume types is kept as log rows.
+"""
+import json
+import logging
+import random
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from apps.core.utils.cache import get_redis_client
+
+from .models import OfflineLog
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Share of events of each type kept as log rows; unlisted types are always kept
+OFFLINE_LOG_SAMPLE_RATES = {
+    'cache_hit': 0.01,
+    'cache_miss': 0.1,
+    'cache_expired': 0.1,
+    **getattr(settings, 'OFFLINE_LOG_SAMPLE_RATES', {}),
+}
+OFFLINE_LOG_FLUSH_BATCH = getattr(settings, 'OFFLINE_LOG_FLUSH_BATCH', 1000)
+OFFLINE_LOG_BUFFER_MAX = getattr(settings, 'OFFLINE_LOG_BUFFER_MAX', 100000)
+
+CACHE_KEY_OFFLINE_LOG_BUFFER = 'offline:log:buffer'
+CACHE_KEY_OFFLINE_METRICS = 'offline:metrics:{day}'
+CACHE_TIMEOUT_OFFLINE_METRICS = 8 * 24 * 3600  # 8 days
+
+CACHE_EVENT_TYPES = ('cache_hit', 'cache_miss', 'cache_expired')
+
+# Fallbacks used when the cache backend is not Redis
+_local_lock = threading.Lock()
+_local_buffer = []
+_local_metrics = defaultdict(int)
+
+
+def record_event(user_id: str, log_type: str, message: str, metadata: Optional[Dict] = None):
+    """
+    Count an event and buffer it for the log if it is sampled.
+
+    Args:
+        user_id: ID of the user
+        log_type: Type of log event
+        message: Log message
+        metadata: Optional metadata
+    """
+    rate = OFFLINE_LOG_SAMPLE_RATES.get(log_type, 1.0)
+    sampled = rate >= 1 or random.random() < rate
+
+    event = None
+    if sampled:
+        # created_at is the flush time, so the event time travels in the metadata
+        metadata = {**(metadata or {}), 'recorded_at': timezone.now().isoformat()}
+        if rate < 1:
+            metadata['sample_rate'] = rate
+        event = json.dumps({
+            'user_id': str(user_id),
+            'log_type': log_type,
+            'message': message,
+            'metadata': metadata,
+        })
+
+    metrics_key = CACHE_KEY_OFFLINE_METRICS.format(day=timezone.localdate().isoformat())
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hincrby(metrics_key, log_type, 1)
+            pipe.expire(metrics_key, CACHE_TIMEOUT_OFFLINE_METRICS)
+            if event is not None:
+                pipe.rpush(CACHE_KEY_OFFLINE_LOG_BUFFER, event)
+                pipe.ltrim(CACHE_KEY_OFFLINE_LOG_BUFFER, -OFFLINE_LOG_BUFFER_MAX, -1)
+            pipe.execute()
+            return
+        except Exception as e:
+            logger.warning(f"Failed to buffer offline event in Redis: {e}")
+
+    with _local_lock:
+        _local_metrics[(metrics_key, log_type)] += 1
+        if event is not None:
+            _local_buffer.append(event)
+        full = len(_local_buffer) >= OFFLINE_LOG_FLUSH_BATCH
+
+    if full:
+        try:
+            flush_events()
+        except Exception as e:
+            logger.warning(f"Failed to flush offline events: {e}")
+
+
+def _pop_redis_events(client, batch_size: int):
+    """
+    Atomically take up to ``batch_size`` events off the Redis buffer.
+    """
+    pipe = client.pipeline()
+    pipe.lrange(CACHE_KEY_OFFLINE_LOG_BUFFER, 0, batch_size - 1)
+    pipe.ltrim(CACHE_KEY_OFFLINE_LOG_BUFFER, batch_size, -1)
+    events, _ = pipe.execute()
+    return events
+
+
+def _write_events(events) -> int:
+    """
+    Write buffered events as log rows, dropping those of deleted users.
+    """
+    events = [json.loads(event) for event in events]
+    user_ids = set(
+        str(user_id)
+        for user_id in User.objects.filter(
+            id__in={event['user_id'] for event in events}
+        ).values_list('id', flat=True)
+    )
+
+    logs = [
+        OfflineLog(
+            user_id=event['user_id'],
+            log_type=event['log_type'],
+            message=event['message'],
+            metadata=event['metadata'],
+        )
+        for event in events
+        if event['user_id'] in user_ids
+    ]
+    OfflineLog.objects.bulk_create(logs, batch_size=OFFLINE_LOG_FLUSH_BATCH)
+    return len(logs)
+
+
+def flush_events(batch_size: int = OFFLINE_LOG_FLUSH_BATCH) -> int:
+    """
+    Write every buffered event to ``OfflineLog``.
+
+    A batch that fails to write is put back at the head of its buffer and
+    the error is raised, so the next flush retries it.
+
+    Args:
+        batch_size: Events written per INSERT
+
+    Returns:
+        Number of log rows created
+    """
+    with _local_lock:
+        events = _local_buffer[:]
+        del _local_buffer[:]
+
+    written = 0
+    for start in range(0, len(events), batch_size):
+        try:
+            written += _write_events(events[start:start + batch_size])
+        except Exception:
+            with _local_lock:
+                _local_buffer[:0] = events[start:]
+            raise
+
+    client = get_redis_client()
+    if client is not None:
+        while True:
+            events = _pop_redis_events(client, batch_size)
+            if events:
+                try:
+                    written += _write_events(events)
+                except Exception:
+                    client.lpush(CACHE_KEY_OFFLINE_LOG_BUFFER, *reversed(events))
+                    raise
+            if len(events) < batch_size:
+                break
+
+    return written
+
+
+def get_event_metrics(day: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Get the event counts of a day, including unsampled events.
+
+    Args:
+        day: Local date, today by default
+
+    Returns:
+        Dict with per-type counts and the cache hit rate
+    """
+    day = day or timezone.localdate()
+    metrics_key = CACHE_KEY_OFFLINE_METRICS.format(day=day.isoformat())
+
+    counts = {log_type: 0 for log_type, _ in OfflineLog.LOG_TYPES}
+
+    client = get_redis_client()
+    if client is not None:
+        for log_type, count in client.hgetall(metrics_key).items():
+            counts[log_type.decode() if isinstance(log_type, bytes) else log_type] = int(count)
+    else:
+        with _local_lock:
+            for (key, log_type), count in _local_metrics.items():
+                if key == metrics_key:
+                    counts[log_type] = count
+
+    lookups = sum(counts[log_type] for log_type in CACHE_EVENT_TYPES)
+
+    return {
+        'date': day.isoformat(),
+        'counts': counts,
+        'cache_lookups': lookups,
+        'hit_rate': counts['cache_hit'] / lookups if lookups else None,
+    }
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.12 on 2026-10-18 21:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offline_mode', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncqueue',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client-supplied key; an action with the same key is applied once per user', max_length=100, null=True, verbose_name='idempotency key'),
+        ),
+        migrations.AddIndex(
+            model_name='syncqueue',
+            index=models.Index(fields=['user', 'idempotency_key'], name='offline_mod_user_id_9dc7e6_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.12 on 2026-10-18 21:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def clear_duplicate_idempotency_keys(apps, schema_editor):
+    """
+    Keep each key on the earliest item so the unique constraint can be added.
+
+    Later items with the same key are duplicates and are marked completed,
+    as the batch processor would have done.
+    """
+    SyncQueue = apps.get_model('offline_mode', 'SyncQueue')
+
+    duplicates = SyncQueue.objects.exclude(idempotency_key=None).values(
+        'user_id', 'idempotency_key'
+    ).annotate(count=Count('id')).filter(count__gt=1)
+
+    for duplicate in duplicates:
+        items = SyncQueue.objects.filter(
+            user_id=duplicate['user_id'],
+            idempotency_key=duplicate['idempotency_key'],
+        ).order_by('created_at')
+        SyncQueue.objects.filter(
+            pk__in=list(items.values_list('pk', flat=True)[1:])
+        ).update(idempotency_key=None, status='completed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offline_mode', '0002_sync_queue_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            clear_duplicate_idempotency_keys,
+            migrations.RunPython.noop,
+        ),
+        migrations.RemoveIndex(
+            model_name='syncqueue',
+            name='offline_mod_user_id_9dc7e6_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='syncqueue',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('user', 'idempotency_key'), name='unique_sync_queue_idempotency_key'),
+        ),
+    ]
@@ -277,6 +277,13 @@ class SyncQueue(BaseModel, TimeStampedMixin):
     data = models.JSONField(
         verbose_name='action data'
     )
+    idempotency_key = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        verbose_name='idempotency key',
+        help_text='Client-supplied key; an action with the same key is applied once per user'
+    )
     
     # Sync status
     status = models.CharField(
@@ -319,6 +326,13 @@ class SyncQueue(BaseModel, TimeStampedMixin):
             models.Index(fields=['user', 'status']),
             models.Index(fields=['status', '-priority']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='unique_sync_queue_idempotency_key',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.action_type} {self.model_name} - {self.status}"
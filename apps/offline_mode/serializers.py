@@ -73,7 +73,7 @@ class SyncQueueSerializer(serializers.ModelSerializer):
         model = SyncQueue
         fields = [
             'id', 'action_type', 'model_name', 'object_id',
-            'data', 'status', 'attempts', 'last_attempt_at',
+            'data', 'idempotency_key', 'status', 'attempts', 'last_attempt_at',
             'completed_at', 'error_message', 'priority',
             'created_at', 'updated_at'
         ]
@@ -117,6 +117,11 @@ class QueueActionSerializer(serializers.Serializer):
     )
     data = serializers.JSONField()
     priority = serializers.IntegerField(default=0)
+    idempotency_key = serializers.CharField(
+        max_length=100,
+        required=False,
+        allow_blank=True
+    )
 
 
 class CacheStatisticsSerializer(serializers.Serializer):
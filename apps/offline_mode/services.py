@@ -5,13 +5,15 @@ import hashlib
 import json
 import logging
 import sys
+from collections import defaultdict
 from datetime import timedelta
 from typing import Dict, List, Optional, Any, Tuple
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Q, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from apps.accounts.selectors import get_user_by_id
@@ -20,21 +22,29 @@ from apps.api.v1.buses.serializers import BusSerializer
 from apps.core.exceptions import ValidationError
 from apps.core.services import BaseService
 from apps.lines.models import Line, Stop, Schedule
+from apps.lines.services import TimetableService
 from apps.api.v1.lines.serializers import LineSerializer, StopSerializer, ScheduleSerializer
 from apps.notifications.models import Notification
 from apps.notifications.serializers import NotificationSerializer
+from apps.tracking.services.crowd_service import StopCrowdService
 
+from .events import record_event
 from .models import (
     CacheConfiguration,
     UserCache,
     CachedData,
     SyncQueue,
-    OfflineLog,
 )
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Sync queue items claimed per batch
+SYNC_BATCH_SIZE = 500
+
+# Items left syncing longer than this are claimed again
+SYNC_CLAIM_TIMEOUT = timedelta(minutes=10)
+
 
 class OfflineModeService(BaseService):
     """
@@ -245,6 +255,7 @@ class OfflineModeService(BaseService):
         """Sync stops data."""
         count = 0
         stops = Stop.objects.filter(is_active=True)
+        crowd = StopCrowdService.get_all()
         
         for stop in stops:
             # Create simple data dict
@@ -257,6 +268,7 @@ class OfflineModeService(BaseService):
                 'longitude': float(stop.longitude) if stop.longitude else None,
                 'is_active': stop.is_active,
                 'features': stop.features,
+                'crowd_level': crowd.get(str(stop.id), {}).get('level'),
                 'created_at': stop.created_at.isoformat(),
                 'updated_at': stop.updated_at.isoformat(),
             }
@@ -302,6 +314,16 @@ class OfflineModeService(BaseService):
             )
             count += 1
         
+        # Ship compiled timetables so clients can look up departures offline
+        for line_id in {schedule.line_id for schedule in schedules}:
+            cls._cache_data(
+                cache=cache,
+                data_type='schedule',
+                data_id=f"timetable:{line_id}",
+                data=TimetableService.get_timetable(line_id),
+                expires_hours=24
+            )
+        
         return count
     
     @classmethod
@@ -496,7 +518,8 @@ class OfflineModeService(BaseService):
         model_name: str,
         data: Dict,
         object_id: Optional[str] = None,
-        priority: int = 0
+        priority: int = 0,
+        idempotency_key: Optional[str] = None
     ) -> SyncQueue:
         """
         Queue an offline action for later sync.
@@ -508,6 +531,8 @@ class OfflineModeService(BaseService):
             data: Action data
             object_id: Optional object ID
             priority: Sync priority
+            idempotency_key: Optional client key; re-sending it returns the
+                item already queued
             
         Returns:
             SyncQueue instance
@@ -515,14 +540,30 @@ class OfflineModeService(BaseService):
         try:
             user = get_user_by_id(user_id)
             
-            queue_item = SyncQueue.objects.create(
-                user=user,
-                action_type=action_type,
-                model_name=model_name,
-                object_id=object_id,
-                data=data,
-                priority=priority
-            )
+            if idempotency_key:
+                existing = SyncQueue.objects.filter(
+                    user=user,
+                    idempotency_key=idempotency_key
+                ).order_by('created_at').first()
+                if existing is not None:
+                    return existing
+            
+            try:
+                # A savepoint, so a concurrent retry with the same key can be recovered from
+                with transaction.atomic():
+                    queue_item = SyncQueue.objects.create(
+                        user=user,
+                        action_type=action_type,
+                        model_name=model_name,
+                        object_id=object_id,
+                        data=data,
+                        priority=priority,
+                        idempotency_key=idempotency_key or None
+                    )
+            except IntegrityError:
+                if not idempotency_key:
+                    raise
+                return SyncQueue.objects.get(user=user, idempotency_key=idempotency_key)
             
             cls.log_event(
                 user_id=user_id,
@@ -542,7 +583,6 @@ class OfflineModeService(BaseService):
             raise ValidationError(str(e))
     
     @classmethod
-    @transaction.atomic
     def process_sync_queue(cls, user_id: str) -> Dict[str, Any]:
         """
         Process pending sync queue items for a user.
@@ -555,83 +595,234 @@ class OfflineModeService(BaseService):
         """
         try:
             user = get_user_by_id(user_id)
+            return cls.process_sync_batches(user_id=user.id)
             
-            # Get pending items
-            pending_items = SyncQueue.objects.filter(
-                user=user,
-                status='pending'
-            ).order_by('-priority', 'created_at')
-            
-            results = {
-                'total': pending_items.count(),
-                'completed': 0,
-                'failed': 0,
-                'errors': []
-            }
+        except Exception as e:
+            logger.error(f"Error processing sync queue: {e}")
+            raise ValidationError(str(e))
+    
+    @classmethod
+    def process_sync_batches(
+        cls,
+        user_id: Optional[str] = None,
+        batch_size: int = SYNC_BATCH_SIZE,
+        max_batches: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Process pending sync queue items in batches until the queue is drained.
+        
+        Args:
+            user_id: Optional user to restrict processing to
+            batch_size: Items claimed per batch
+            max_batches: Optional cap on the number of batches
             
-            for item in pending_items:
-                try:
-                    # Mark as syncing
-                    item.status = 'syncing'
-                    item.attempts += 1
-                    item.last_attempt_at = timezone.now()
-                    item.save()
-                    
-                    # Process based on action type
-                    if item.action_type == 'create':
-                        cls._process_create_action(item)
-                    elif item.action_type == 'update':
-                        cls._process_update_action(item)
-                    elif item.action_type == 'delete':
-                        cls._process_delete_action(item)
-                    
-                    # Mark as completed
-                    item.status = 'completed'
-                    item.completed_at = timezone.now()
-                    item.save()
-                    
-                    results['completed'] += 1
-                    
-                except Exception as e:
-                    # Mark as failed
-                    item.status = 'failed'
-                    item.error_message = str(e)
-                    item.save()
-                    
-                    results['failed'] += 1
-                    results['errors'].append({
-                        'item_id': str(item.id),
-                        'error': str(e)
-                    })
-                    
-                    logger.error(f"Error processing sync queue item {item.id}: {e}")
+        Returns:
+            Sync results summed over all batches
+        """
+        results = {
+            'total': 0,
+            'completed': 0,
+            'failed': 0,
+            'duplicates': 0,
+            'errors': []
+        }
+        
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = cls.process_sync_batch(user_id=user_id, batch_size=batch_size)
+            batches += 1
+            
+            for key in ('total', 'completed', 'failed', 'duplicates'):
+                results[key] += batch[key]
+            results['errors'].extend(batch['errors'])
+            
+            if batch['total'] < batch_size:
+                break
+        
+        return results
+    
+    @classmethod
+    def _claim_sync_items(cls, user_id: Optional[str], batch_size: int) -> List[SyncQueue]:
+        """
+        Claim a batch of pending items by marking them as syncing.
+        
+        Rows locked by another worker are skipped, so concurrent workers
+        claim disjoint batches. Items left syncing by a dead worker are
+        claimed again once SYNC_CLAIM_TIMEOUT has passed.
+        """
+        now = timezone.now()
+        
+        with transaction.atomic():
+            queryset = SyncQueue.objects.select_for_update(skip_locked=True).filter(
+                Q(status='pending') |
+                Q(status='syncing', last_attempt_at__lt=now - SYNC_CLAIM_TIMEOUT)
+            )
+            if user_id is not None:
+                queryset = queryset.filter(user_id=user_id)
+            
+            items = list(queryset.order_by('-priority', 'created_at')[:batch_size])
             
+            for item in items:
+                item.status = 'syncing'
+                item.attempts += 1
+                item.last_attempt_at = now
+                item.updated_at = now
+            
+            SyncQueue.objects.bulk_update(
+                items, ['status', 'attempts', 'last_attempt_at', 'updated_at']
+            )
+        
+        return items
+    
+    @classmethod
+    def _split_duplicates(cls, items: List[SyncQueue]) -> Tuple[List[SyncQueue], List[SyncQueue]]:
+        """
+        Split items into those to apply and repeats of an idempotency key.
+        
+        A key already completed, or seen earlier in the batch, is a repeat.
+        """
+        keyed = [item for item in items if item.idempotency_key]
+        seen = set()
+        if keyed:
+            seen = set(
+                SyncQueue.objects.filter(
+                    user_id__in={item.user_id for item in keyed},
+                    idempotency_key__in={item.idempotency_key for item in keyed},
+                    status='completed'
+                ).values_list('user_id', 'idempotency_key')
+            )
+        
+        unique, duplicates = [], []
+        for item in items:
+            if item.idempotency_key:
+                key = (item.user_id, item.idempotency_key)
+                if key in seen:
+                    duplicates.append(item)
+                    continue
+                seen.add(key)
+            unique.append(item)
+        
+        return unique, duplicates
+    
+    @classmethod
+    def process_sync_batch(
+        cls,
+        user_id: Optional[str] = None,
+        batch_size: int = SYNC_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Claim and apply one batch of pending sync queue items.
+        
+        Items are grouped by (model_name, action_type) and each group is
+        applied in one call. If a group fails, its items are retried one by
+        one so a single bad item does not fail the rest. Status changes are
+        written with one bulk update.
+        
+        Args:
+            user_id: Optional user to restrict processing to
+            batch_size: Maximum number of items to claim
+            
+        Returns:
+            Sync results for the batch
+        """
+        items = cls._claim_sync_items(user_id, batch_size)
+        
+        results = {
+            'total': len(items),
+            'completed': 0,
+            'failed': 0,
+            'duplicates': 0,
+            'errors': []
+        }
+        if not items:
             return results
+        
+        items, duplicates = cls._split_duplicates(items)
+        
+        groups = defaultdict(list)
+        for item in items:
+            groups[(item.model_name, item.action_type)].append(item)
+        
+        completed, failed = list(duplicates), []
+        for (model_name, action_type), group in groups.items():
+            try:
+                with transaction.atomic():
+                    cls._apply_sync_group(model_name, action_type, group)
+                completed.extend(group)
+                continue
+            except Exception as e:
+                if len(group) == 1:
+                    group[0].error_message = str(e)
+                    failed.append(group[0])
+                    continue
             
-        except Exception as e:
-            logger.error(f"Error processing sync queue: {e}")
-            raise ValidationError(str(e))
+            for item in group:
+                try:
+                    with transaction.atomic():
+                        cls._apply_sync_group(model_name, action_type, [item])
+                    completed.append(item)
+                except Exception as e:
+                    item.error_message = str(e)
+                    failed.append(item)
+        
+        now = timezone.now()
+        for item in completed:
+            item.status = 'completed'
+            item.completed_at = now
+            item.error_message = ''
+            item.updated_at = now
+        for item in failed:
+            item.status = 'failed'
+            item.updated_at = now
+            logger.error(f"Error processing sync queue item {item.id}: {item.error_message}")
+        
+        SyncQueue.objects.bulk_update(
+            completed + failed,
+            ['status', 'completed_at', 'error_message', 'updated_at']
+        )
+        
+        results['completed'] = len(completed)
+        results['failed'] = len(failed)
+        results['duplicates'] = len(duplicates)
+        results['errors'] = [
+            {'item_id': str(item.id), 'error': item.error_message}
+            for item in failed
+        ]
+        
+        return results
     
     @classmethod
-    def _process_create_action(cls, item: SyncQueue):
-        """Process create action from sync queue."""
+    def _apply_sync_group(cls, model_name: str, action_type: str, items: List[SyncQueue]):
+        """Apply a group of queued actions on the same model and action."""
+        if action_type == 'create':
+            cls._process_create_actions(model_name, items)
+        elif action_type == 'update':
+            cls._process_update_actions(model_name, items)
+        elif action_type == 'delete':
+            cls._process_delete_actions(model_name, items)
+        else:
+            raise ValidationError(f"Unknown action type: {action_type}")
+    
+    @classmethod
+    def _process_create_actions(cls, model_name: str, items: List[SyncQueue]):
+        """Process create actions from sync queue."""
         # This would be implemented based on specific model requirements
         # For now, just log it
-        logger.info(f"Processing create action for {item.model_name}")
+        logger.info(f"Processing {len(items)} create actions for {model_name}")
     
     @classmethod
-    def _process_update_action(cls, item: SyncQueue):
-        """Process update action from sync queue."""
+    def _process_update_actions(cls, model_name: str, items: List[SyncQueue]):
+        """Process update actions from sync queue."""
         # This would be implemented based on specific model requirements
         # For now, just log it
-        logger.info(f"Processing update action for {item.model_name} {item.object_id}")
+        logger.info(f"Processing {len(items)} update actions for {model_name}")
     
     @classmethod
-    def _process_delete_action(cls, item: SyncQueue):
-        """Process delete action from sync queue."""
+    def _process_delete_actions(cls, model_name: str, items: List[SyncQueue]):
+        """Process delete actions from sync queue."""
         # This would be implemented based on specific model requirements
         # For now, just log it
-        logger.info(f"Processing delete action for {item.model_name} {item.object_id}")
+        logger.info(f"Processing {len(items)} delete actions for {model_name}")
     
     @classmethod
     def clear_user_cache(cls, user_id: str) -> bool:
@@ -670,6 +861,43 @@ class OfflineModeService(BaseService):
             logger.error(f"Error clearing user cache: {e}")
             return False
     
+    @classmethod
+    def refresh_cache_statistics(cls, cache_ids: Optional[List[str]] = None) -> int:
+        """
+        Recompute item counts and sizes of user caches in one UPDATE.
+        
+        Each column is a grouped aggregate over the cache's items, so the
+        statement costs one round trip however many caches there are.
+        
+        Args:
+            cache_ids: Optional caches to refresh, all by default
+            
+        Returns:
+            Number of caches updated
+        """
+        def items_aggregate(aggregate):
+            return Coalesce(
+                Subquery(
+                    CachedData.objects.filter(
+                        user_cache=OuterRef('pk')
+                    ).order_by().values('user_cache').annotate(
+                        total=aggregate
+                    ).values('total')[:1]
+                ),
+                0
+            )
+        
+        caches = UserCache.objects.all()
+        if cache_ids is not None:
+            caches = caches.filter(id__in=cache_ids)
+        
+        return caches.update(
+            cached_lines_count=items_aggregate(Count('id', filter=Q(data_type='line'))),
+            cached_stops_count=items_aggregate(Count('id', filter=Q(data_type='stop'))),
+            cached_schedules_count=items_aggregate(Count('id', filter=Q(data_type='schedule'))),
+            cache_size_bytes=items_aggregate(Sum('size_bytes'))
+        )
+    
     @classmethod
     def get_cache_statistics(cls, user_id: str) -> Dict[str, Any]:
         """
@@ -727,6 +955,9 @@ class OfflineModeService(BaseService):
         """
         Log an offline mode event.
         
+        The event is counted and, if sampled, buffered; rows are written
+        in bulk by the periodic flush.
+        
         Args:
             user_id: ID of the user
             log_type: Type of log event
@@ -734,12 +965,6 @@ class OfflineModeService(BaseService):
             metadata: Optional metadata
         """
         try:
-            user = get_user_by_id(user_id)
-            OfflineLog.objects.create(
-                user=user,
-                log_type=log_type,
-                message=message,
-                metadata=metadata or {}
-            )
+            record_event(user_id, log_type, message, metadata)
         except Exception as e:
             logger.error(f"Error logging offline event: {e}")
\ No newline at end of file
@@ -2,17 +2,40 @@
 Celery tasks for offline mode operations.
 """
 import logging
+from itertools import islice
+from typing import List
+
 from celery import shared_task
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
 
-from .models import UserCache, CacheConfiguration, SyncQueue
+from .models import UserCache, CacheConfiguration
 from .services import OfflineModeService
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Users synced per auto-sync task
+AUTO_SYNC_CHUNK_SIZE = 100
+
+# Seconds between consecutive auto-sync tasks
+AUTO_SYNC_CHUNK_INTERVAL = 10
+
+# Longest stagger of one check_auto_sync run, kept below its 30 minute period
+# so a run's tasks have started before the next run picks the backlog up
+AUTO_SYNC_MAX_SPREAD = 25 * 60
+
+
+def _chunked(iterable, size: int):
+    """Yield lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 @shared_task(name='offline_mode.auto_sync_user_cache')
 def auto_sync_user_cache(user_id: str):
@@ -31,6 +54,24 @@ def auto_sync_user_cache(user_id: str):
         return {'status': 'error', 'message': str(e)}
 
 
+@shared_task(name='offline_mode.auto_sync_user_caches')
+def auto_sync_user_caches(user_ids: List[str]):
+    """
+    Automatically sync a chunk of users' caches.
+    
+    Args:
+        user_ids: IDs of the users
+    """
+    synced = 0
+    for user_id in user_ids:
+        result = auto_sync_user_cache(user_id)
+        if result.get('status') != 'error':
+            synced += 1
+    
+    logger.info(f"Auto-synced {synced} of {len(user_ids)} caches")
+    return {'caches_synced': synced, 'caches_failed': len(user_ids) - synced}
+
+
 @shared_task(name='offline_mode.clean_expired_cache')
 def clean_expired_cache():
     """
@@ -75,29 +116,18 @@ def clean_expired_cache():
 @shared_task(name='offline_mode.process_sync_queues')
 def process_sync_queues():
     """
-    Process pending sync queue items for all users.
+    Process pending sync queue items for all users in batches.
     """
     try:
-        # Get users with pending sync items
-        user_ids = SyncQueue.objects.filter(
-            status='pending'
-        ).values_list('user_id', flat=True).distinct()
+        batch = OfflineModeService.process_sync_batches()
         
         results = {
-            'users_processed': 0,
-            'items_synced': 0,
-            'items_failed': 0
+            'items_processed': batch['total'],
+            'items_synced': batch['completed'],
+            'items_failed': batch['failed'],
+            'items_duplicate': batch['duplicates']
         }
         
-        for user_id in user_ids:
-            try:
-                user_result = OfflineModeService.process_sync_queue(str(user_id))
-                results['users_processed'] += 1
-                results['items_synced'] += user_result.get('completed', 0)
-                results['items_failed'] += user_result.get('failed', 0)
-            except Exception as e:
-                logger.error(f"Error processing sync queue for user {user_id}: {e}")
-        
         logger.info(f"Processed sync queues: {results}")
         return results
         
@@ -121,7 +151,7 @@ def check_auto_sync():
             minutes=config.sync_interval_minutes
         )
         
-        from django.db.models import Q
+        from django.db.models import F, Q
         caches_to_sync = UserCache.objects.filter(
             is_syncing=False
         ).filter(
@@ -129,20 +159,53 @@ def check_auto_sync():
             Q(last_sync_at__lt=sync_threshold)
         )
         
-        sync_count = 0
-        for cache in caches_to_sync:
-            # Schedule sync task
-            auto_sync_user_cache.delay(str(cache.user_id))
-            sync_count += 1
+        # Fan out one task per chunk of users, staggered so a large
+        # backlog is spread over time instead of hitting the workers at once.
+        # Each run schedules the stalest caches that fit in the spread and
+        # leaves the rest to the next run.
+        max_chunks = AUTO_SYNC_MAX_SPREAD // AUTO_SYNC_CHUNK_INTERVAL + 1
+        user_ids = caches_to_sync.order_by(
+            F('last_sync_at').asc(nulls_first=True)
+        ).values_list('user_id', flat=True)[:max_chunks * AUTO_SYNC_CHUNK_SIZE].iterator(
+            chunk_size=AUTO_SYNC_CHUNK_SIZE
+        )
         
-        logger.info(f"Scheduled {sync_count} auto-sync tasks")
-        return {'caches_scheduled': sync_count}
+        sync_count = 0
+        chunk_count = 0
+        for chunk in _chunked(user_ids, AUTO_SYNC_CHUNK_SIZE):
+            auto_sync_user_caches.apply_async(
+                args=[[str(user_id) for user_id in chunk]],
+                countdown=chunk_count * AUTO_SYNC_CHUNK_INTERVAL
+            )
+            sync_count += len(chunk)
+            chunk_count += 1
+        
+        logger.info(f"Scheduled {sync_count} auto-syncs in {chunk_count} tasks")
+        return {'caches_scheduled': sync_count, 'tasks_scheduled': chunk_count}
         
     except Exception as e:
         logger.error(f"Error checking auto-sync: {e}")
         return {'status': 'error', 'message': str(e)}
 
 
+@shared_task(name='offline_mode.flush_offline_logs')
+def flush_offline_logs():
+    """
+    Write buffered offline events to the log.
+    """
+    try:
+        from .events import flush_events
+        
+        written = flush_events()
+        
+        logger.info(f"Flushed {written} offline log events")
+        return {'logs_written': written}
+        
+    except Exception as e:
+        logger.error(f"Error flushing offline logs: {e}")
+        return {'status': 'error', 'message': str(e)}
+
+
 @shared_task(name='offline_mode.cleanup_old_logs')
 def cleanup_old_logs(days_to_keep: int = 30):
     """
@@ -175,34 +238,11 @@ def update_cache_statistics():
     Update cache statistics for all users.
     """
     try:
-        from django.db import models
-        
-        updated_count = 0
-        
-        for cache in UserCache.objects.all():
-            # Update counts
-            cache.cached_lines_count = cache.cached_items.filter(
-                data_type='line'
-            ).count()
-            cache.cached_stops_count = cache.cached_items.filter(
-                data_type='stop'
-            ).count()
-            cache.cached_schedules_count = cache.cached_items.filter(
-                data_type='schedule'
-            ).count()
-            
-            # Update total size
-            total_size = cache.cached_items.aggregate(
-                total=models.Sum('size_bytes')
-            )['total'] or 0
-            cache.cache_size_bytes = total_size
-            
-            cache.save()
-            updated_count += 1
+        updated_count = OfflineModeService.refresh_cache_statistics()
         
         logger.info(f"Updated statistics for {updated_count} caches")
         return {'caches_updated': updated_count}
         
     except Exception as e:
         logger.error(f"Error updating cache statistics: {e}")
-        return {'status': 'error', 'message': str(e)}
\ No newline at end of file
+        return {'status': 'error', 'message': str(e)}
@@ -1,3 +1,275 @@
+"""
+Tests for the offline mode app.
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.offline_mode import events, tasks
+from apps.offline_mode.models import CacheConfiguration, CachedData, OfflineLog, SyncQueue, UserCache
+from apps.offline_mode.services import OfflineModeService
+
+User = get_user_model()
+
+
+class SyncQueueBatchTest(TestCase):
+    """Test batched sync queue processing."""
+
+    def setUp(self):
+        """Set up two users with queued actions."""
+        self.user = User.objects.create_user(email='sync-one@test.com', password='testpass123')
+        self.other = User.objects.create_user(email='sync-two@test.com', password='testpass123')
+
+    def queue(self, user, action_type='update', key=None, data=None):
+        return SyncQueue.objects.create(
+            user=user,
+            action_type=action_type,
+            model_name='stop',
+            data=data or {},
+            idempotency_key=key,
+        )
+
+    def test_batches_drain_queue_across_users(self):
+        """Test that all users' items are processed in batches."""
+        for _ in range(3):
+            self.queue(self.user)
+            self.queue(self.other, action_type='create')
+
+        result = OfflineModeService.process_sync_batches(batch_size=4)
+
+        self.assertEqual(result['total'], 6)
+        self.assertEqual(result['completed'], 6)
+        self.assertFalse(SyncQueue.objects.exclude(status='completed').exists())
+        self.assertEqual(set(SyncQueue.objects.values_list('attempts', flat=True)), {1})
+
+    def test_idempotency_keys_are_applied_once(self):
+        """Test that repeated keys are skipped in and across batches."""
+        done = self.queue(self.user, key='k1')
+        done.status = 'completed'
+        done.save()
+        self.queue(self.user, key='k1')
+        self.queue(self.user, key='k2')
+        self.queue(self.user, key='k2')
+        self.queue(self.other, key='k2')
+
+        with mock.patch.object(OfflineModeService, '_process_update_actions') as apply:
+            result = OfflineModeService.process_sync_batches()
+
+        applied = [item for call in apply.call_args_list for item in call.args[1]]
+        self.assertEqual(len(applied), 2)
+        self.assertEqual(result['duplicates'], 2)
+        self.assertEqual(result['completed'], 4)
+
+    def test_queue_action_returns_existing_key(self):
+        """Test that re-sending a key does not queue a second item."""
+        first = OfflineModeService.queue_offline_action(
+            user_id=str(self.user.id), action_type='create', model_name='stop', data={}, idempotency_key='retry'
+        )
+        second = OfflineModeService.queue_offline_action(
+            user_id=str(self.user.id), action_type='create', model_name='stop', data={}, idempotency_key='retry'
+        )
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(SyncQueue.objects.count(), 1)
+
+    def test_idempotency_key_is_unique_per_user(self):
+        """Test that the database rejects a second item with the same key."""
+        self.queue(self.user, key='race')
+        self.queue(self.other, key='race')
+        self.queue(self.user)
+        self.queue(self.user)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.queue(self.user, key='race')
+
+    def test_concurrent_retry_returns_existing_item(self):
+        """Test that losing the insert race returns the item that won."""
+        winner = self.queue(self.user, key='race')
+
+        with mock.patch.object(SyncQueue.objects, 'filter', return_value=SyncQueue.objects.none()):
+            item = OfflineModeService.queue_offline_action(
+                user_id=str(self.user.id), action_type='update', model_name='stop', data={}, idempotency_key='race'
+            )
+
+        self.assertEqual(item.id, winner.id)
+        self.assertEqual(SyncQueue.objects.count(), 1)
+
+    def test_failing_item_does_not_fail_group(self):
+        """Test that a failed group is retried item by item."""
+        good = self.queue(self.user)
+        bad = self.queue(self.user, data={'fail': True})
+
+        def apply(model_name, items):
+            if any(item.data.get('fail') for item in items):
+                raise ValueError('bad item')
+
+        with mock.patch.object(OfflineModeService, '_process_update_actions', side_effect=apply):
+            result = OfflineModeService.process_sync_queue(str(self.user.id))
+
+        self.assertEqual((result['completed'], result['failed']), (1, 1))
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(good.status, 'completed')
+        self.assertEqual(bad.status, 'failed')
+        self.assertEqual(bad.error_message, 'bad item')
+
+
+class CacheStatisticsTaskTest(TestCase):
+    """Test cache statistics refresh and auto-sync fan-out."""
+
+    def setUp(self):
+        """Set up caches with stale statistics."""
+        self.caches = []
+        for index in range(3):
+            user = User.objects.create_user(email=f'cache-{index}@test.com', password='testpass123')
+            self.caches.append(UserCache.objects.create(user=user, cached_lines_count=9, cache_size_bytes=999))
+
+        for data_type, data_id, size in (('line', '1', 100), ('line', '2', 50), ('stop', '1', 10)):
+            CachedData.objects.create(
+                user_cache=self.caches[0], data_type=data_type, data_id=data_id, data={}, size_bytes=size
+            )
+
+    def test_update_cache_statistics_in_one_query(self):
+        """Test that all caches are refreshed by a single statement."""
+        with self.assertNumQueries(1):
+            result = tasks.update_cache_statistics()
+
+        self.assertEqual(result, {'caches_updated': 3})
+        cache = UserCache.objects.get(pk=self.caches[0].pk)
+        self.assertEqual(
+            (cache.cached_lines_count, cache.cached_stops_count, cache.cached_schedules_count, cache.cache_size_bytes),
+            (2, 1, 0, 160)
+        )
+        empty = UserCache.objects.get(pk=self.caches[1].pk)
+        self.assertEqual((empty.cached_lines_count, empty.cache_size_bytes), (0, 0))
+
+    def test_check_auto_sync_fans_out_in_chunks(self):
+        """Test that syncs are enqueued per chunk with staggered countdowns."""
+        CacheConfiguration.objects.create(name='default', auto_sync_on_connect=True)
+
+        with mock.patch.object(tasks, 'AUTO_SYNC_CHUNK_SIZE', 2), \
+                mock.patch.object(tasks.auto_sync_user_caches, 'apply_async') as apply_async:
+            result = tasks.check_auto_sync()
+
+        self.assertEqual(result, {'caches_scheduled': 3, 'tasks_scheduled': 2})
+        self.assertEqual(
+            [call.kwargs['countdown'] for call in apply_async.call_args_list],
+            [0, tasks.AUTO_SYNC_CHUNK_INTERVAL]
+        )
+        self.assertEqual(
+            sorted(user_id for call in apply_async.call_args_list for user_id in call.kwargs['args'][0]),
+            sorted(str(cache.user_id) for cache in self.caches)
+        )
+
+    def test_check_auto_sync_caps_spread(self):
+        """Test that a run only schedules the stalest caches that fit in its spread."""
+        CacheConfiguration.objects.create(name='default', auto_sync_on_connect=True)
+        UserCache.objects.filter(pk=self.caches[0].pk).update(last_sync_at=timezone.now() - timedelta(days=2))
+        UserCache.objects.filter(pk=self.caches[1].pk).update(last_sync_at=timezone.now() - timedelta(days=3))
+
+        with mock.patch.object(tasks, 'AUTO_SYNC_CHUNK_SIZE', 1), \
+                mock.patch.object(tasks, 'AUTO_SYNC_MAX_SPREAD', tasks.AUTO_SYNC_CHUNK_INTERVAL), \
+                mock.patch.object(tasks.auto_sync_user_caches, 'apply_async') as apply_async:
+            result = tasks.check_auto_sync()
+
+        self.assertEqual(result, {'caches_scheduled': 2, 'tasks_scheduled': 2})
+        self.assertEqual(
+            [call.kwargs['args'][0] for call in apply_async.call_args_list],
+            [[str(self.caches[2].user_id)], [str(self.caches[1].user_id)]]
+        )
+        self.assertEqual(apply_async.call_args_list[-1].kwargs['countdown'], tasks.AUTO_SYNC_CHUNK_INTERVAL)
+
+
+class OfflineEventRecorderTest(TestCase):
+    """Test sampled, buffered offline event recording."""
+
+    def setUp(self):
+        """Set up a user with an empty event buffer."""
+        self.user = User.objects.create_user(email='events@test.com', password='testpass123')
+        events.flush_events()
+        events._local_metrics.clear()
+
+    def test_cache_reads_do_not_insert_logs(self):
+        """Test that cache lookups are buffered until the flush."""
+        cache = OfflineModeService.get_or_create_user_cache(str(self.user.id))
+        events.flush_events()
+        CachedData.objects.create(user_cache=cache, data_type='line', data_id='1', data={'id': 1})
+
+        with mock.patch.dict(events.OFFLINE_LOG_SAMPLE_RATES, {'cache_hit': 1.0, 'cache_miss': 1.0}):
+            with CaptureQueriesContext(connection) as queries:
+                OfflineModeService.get_cached_data(str(self.user.id), 'line', '1')
+                OfflineModeService.get_cached_data(str(self.user.id), 'line', '2')
+
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('INSERT')])
+        self.assertFalse(OfflineLog.objects.exists())
+        self.assertEqual(tasks.flush_offline_logs(), {'logs_written': 2})
+        self.assertEqual(
+            sorted(OfflineLog.objects.values_list('log_type', flat=True)),
+            ['cache_hit', 'cache_miss']
+        )
+
+    def test_sampled_out_events_are_still_counted(self):
+        """Test that metrics count every event while logs keep a sample."""
+        with mock.patch.dict(events.OFFLINE_LOG_SAMPLE_RATES, {'cache_hit': 0.0}):
+            for _ in range(3):
+                events.record_event(str(self.user.id), 'cache_hit', 'hit')
+        events.record_event(str(self.user.id), 'cache_miss', 'miss')
+
+        metrics = events.get_event_metrics()
+        self.assertEqual(metrics['counts']['cache_hit'], 3)
+        self.assertEqual(metrics['cache_lookups'], 4)
+        self.assertEqual(metrics['hit_rate'], 0.75)
+        self.assertEqual(events.flush_events(), 1)
+
+    def test_flush_drops_events_of_deleted_users(self):
+        """Test that events of deleted users are skipped instead of failing the batch."""
+        other = User.objects.create_user(email='events-gone@test.com', password='testpass123')
+        events.record_event(str(self.user.id), 'sync_start', 'start')
+        events.record_event(str(other.id), 'sync_start', 'start')
+        other.delete()
+
+        self.assertEqual(events.flush_events(), 1)
+        self.assertEqual(OfflineLog.objects.get().user, self.user)
+
+    def test_flush_keeps_recorded_time(self):
+        """Test that log rows keep the event time, not only the flush time."""
+        recorded_at = timezone.now() - timedelta(minutes=5)
+        with mock.patch.object(events.timezone, 'now', return_value=recorded_at):
+            events.record_event(str(self.user.id), 'sync_start', 'start')
+
+        events.flush_events()
+        self.assertEqual(OfflineLog.objects.get().metadata['recorded_at'], recorded_at.isoformat())
+
+    def test_failed_flush_keeps_events(self):
+        """Test that a batch that fails to write is retried by the next flush."""
+        events.record_event(str(self.user.id), 'sync_start', 'start')
+
+        with mock.patch.object(OfflineLog.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                events.flush_events()
+
+        self.assertEqual(events.flush_events(), 1)
+        self.assertEqual(OfflineLog.objects.count(), 1)
+
+    def test_summary_weights_sampled_rows(self):
+        """Test that the per-user summary estimates events from sampled rows."""
+        for _ in range(2):
+            OfflineLog.objects.create(
+                user=self.user, log_type='cache_hit', message='hit', metadata={'sample_rate': 0.01}
+            )
+        OfflineLog.objects.create(user=self.user, log_type='sync_start', message='start')
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('offline_mode:offline-logs-summary'))
+
+        self.assertEqual(response.data['cache_hit'], {'label': 'Cache Hit', 'count': 200, 'logged': 2})
+        self.assertEqual(response.data['sync_start']['count'], 1)
 
-# Create your tests here.
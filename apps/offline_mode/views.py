@@ -1,10 +1,14 @@
 """
 Views for offline mode API endpoints.
 """
-from django.db.models import Q
+from collections import defaultdict
+from datetime import date
+
+from django.db.models import Count, Q
+from django.db.models.fields.json import KT
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
 from apps.api.pagination import StandardResultsSetPagination
@@ -29,6 +33,7 @@ from .serializers import (
     DataRequestSerializer,
 )
 from apps.api.throttling import SyncRateThrottle
+from .events import get_event_metrics
 from .services import OfflineModeService
 
 
@@ -332,15 +337,43 @@ class OfflineLogViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Get log summary by type."""
-        logs = self.get_queryset()
+        """
+        Get log summary by type.
+        
+        Sampled event types keep only a share of their rows, so each row is
+        weighted by its ``sample_rate`` to estimate the number of events.
+        """
+        rows = self.get_queryset().order_by().annotate(
+            sample_rate=KT('metadata__sample_rate')
+        ).values('log_type', 'sample_rate').annotate(count=Count('id'))
+        
+        estimates = defaultdict(float)
+        logged = defaultdict(int)
+        for row in rows:
+            rate = float(row['sample_rate']) if row['sample_rate'] else 1.0
+            estimates[row['log_type']] += row['count'] / rate
+            logged[row['log_type']] += row['count']
         
         summary = {}
         for log_type, label in OfflineLog.LOG_TYPES:
-            count = logs.filter(log_type=log_type).count()
             summary[log_type] = {
                 'label': label,
-                'count': count
+                'count': round(estimates[log_type]),
+                'logged': logged[log_type],
             }
         
         return Response(summary)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def metrics(self, request):
+        """Get a day's event counts and cache hit rate across all users."""
+        day = request.query_params.get('date')
+        try:
+            day = date.fromisoformat(day) if day else None
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(get_event_metrics(day))
@@ -3,10 +3,21 @@ WebSocket consumers for real-time tracking functionality.
 """
 import json
 import logging
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 
+from .live_state import aget_group_snapshot
+from .ws_sessions import (
+    aget_replay_events,
+    aload_session,
+    asave_session,
+    is_resumable_group,
+    new_session_id,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,9 +29,13 @@ class TrackingConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """
         Handle WebSocket connection.
+
+        A ``session`` query parameter from an earlier connection restores
+        its subscriptions and replays the positions missed in between.
         """
         # Get user from scope (added by AuthMiddlewareStack)
         self.user = self.scope["user"]
+        self.user_key = None if isinstance(self.user, AnonymousUser) else str(self.user.id)
         
         logger.info(f"WebSocket connection attempt from {self.scope.get('client', 'unknown')}")
         logger.info(f"WebSocket path: {self.scope.get('path', 'unknown')}")
@@ -46,6 +61,21 @@ class TrackingConsumer(AsyncWebsocketConsumer):
         else:
             self.personal_group = None
 
+        # Resume the previous session or start a new one
+        query_params = parse_qs(self.scope.get('query_string', b'').decode('utf-8'))
+        requested_session = query_params.get('session', [None])[0]
+        session = await aload_session(requested_session, self.user_key)
+
+        self.subscriptions = set()
+        if session:
+            self.session_id = requested_session
+            for group in session['groups']:
+                await self.channel_layer.group_add(group, self.channel_name)
+                self.subscriptions.add(group)
+        else:
+            self.session_id = new_session_id()
+        await self.save_session()
+
         logger.info(f"WebSocket connected: {self.channel_name} for user {self.user}")
 
         # Send connection confirmation
@@ -54,9 +84,16 @@ class TrackingConsumer(AsyncWebsocketConsumer):
             'type': 'connection_established',
             'message': 'Connected to real-time tracking',
             'user_authenticated': not isinstance(self.user, AnonymousUser),
+            'session_id': self.session_id,
+            'resumed': session is not None,
+            'subscriptions': sorted(self.subscriptions),
             'timestamp': timestamp
         }))
 
+        if session:
+            for event in await aget_replay_events(self.subscriptions, session['last_seen']):
+                await self.send(text_data=json.dumps(event))
+
     async def disconnect(self, close_code):
         """
         Handle WebSocket disconnection.
@@ -75,8 +112,54 @@ class TrackingConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
 
+        # Leave subscribed groups, keeping them in the session for a resume
+        for group in getattr(self, 'subscriptions', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        if hasattr(self, 'session_id'):
+            await self.save_session()
+
         logger.info(f"WebSocket disconnected: {self.channel_name} with code {close_code}")
 
+    async def save_session(self):
+        """
+        Store this socket's subscriptions under its session ID.
+        """
+        try:
+            await asave_session(self.session_id, self.user_key, self.subscriptions)
+        except Exception as e:
+            logger.warning(f"Failed to save WebSocket session {self.session_id}: {e}")
+
+    async def subscribe_group(self, group):
+        """
+        Join a group and remember it in the session.
+        """
+        await self.channel_layer.group_add(group, self.channel_name)
+        if is_resumable_group(group) and group not in self.subscriptions:
+            self.subscriptions.add(group)
+            await self.save_session()
+
+    async def unsubscribe_group(self, group):
+        """
+        Leave a group and forget it in the session.
+        """
+        await self.channel_layer.group_discard(group, self.channel_name)
+        if group in self.subscriptions:
+            self.subscriptions.discard(group)
+            await self.save_session()
+
+    async def send_snapshot(self, group):
+        """
+        Send the cached live state of a bus or line group the socket just joined.
+        """
+        try:
+            snapshot = await aget_group_snapshot(group)
+        except Exception as e:
+            logger.warning(f"Failed to build snapshot for {group}: {e}")
+            return
+
+        if snapshot is not None:
+            await self.send(text_data=json.dumps(snapshot))
+
     async def receive(self, text_data):
         """
         Handle messages from WebSocket.
@@ -127,16 +210,14 @@ class TrackingConsumer(AsyncWebsocketConsumer):
         
         # Add to bus-specific group
         bus_group = f"bus_{bus_id}"
-        await self.channel_layer.group_add(
-            bus_group,
-            self.channel_name
-        )
+        await self.subscribe_group(bus_group)
         
         await self.send(text_data=json.dumps({
             'type': 'subscription_confirmed',
             'subscription': 'bus',
             'bus_id': bus_id
         }))
+        await self.send_snapshot(bus_group)
 
     async def handle_line_subscription(self, data):
         """
@@ -152,16 +233,14 @@ class TrackingConsumer(AsyncWebsocketConsumer):
         
         # Add to line-specific group
         line_group = f"line_{line_id}"
-        await self.channel_layer.group_add(
-            line_group,
-            self.channel_name
-        )
+        await self.subscribe_group(line_group)
         
         await self.send(text_data=json.dumps({
             'type': 'subscription_confirmed',
             'subscription': 'line',
             'line_id': line_id
         }))
+        await self.send_snapshot(line_group)
 
     async def handle_generic_subscription(self, data):
         """
@@ -189,10 +268,7 @@ class TrackingConsumer(AsyncWebsocketConsumer):
             
             # Add to user-specific notification group
             notification_group = f"notifications_{user_id}"
-            await self.channel_layer.group_add(
-                notification_group,
-                self.channel_name
-            )
+            await self.subscribe_group(notification_group)
             
             await self.send(text_data=json.dumps({
                 'type': 'subscription_confirmed',
@@ -205,10 +281,7 @@ class TrackingConsumer(AsyncWebsocketConsumer):
         # Handle other subscription types
         if channel in ['general', 'system']:
             # Add to general/system updates group
-            await self.channel_layer.group_add(
-                f"{channel}_updates",
-                self.channel_name
-            )
+            await self.subscribe_group(f"{channel}_updates")
             
             await self.send(text_data=json.dumps({
                 'type': 'subscription_confirmed',
@@ -230,10 +303,7 @@ class TrackingConsumer(AsyncWebsocketConsumer):
             return
 
         line_group = f"line_{line_id}"
-        await self.channel_layer.group_discard(
-            line_group,
-            self.channel_name
-        )
+        await self.unsubscribe_group(line_group)
 
         await self.send(text_data=json.dumps({
             'type': 'unsubscription_confirmed',
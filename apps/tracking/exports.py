@@ -0,0 +1,257 @@
+"""
+Columnar exports of the tracking analytics facts.
+
+Per-trip and per-hour facts are streamed from the database with
+``iterator()`` and written chunk by chunk, so an export never holds a whole
+date range in memory. Files are gzip CSV by default, or Parquet when
+``pyarrow`` is installed.
+"""
+import csv
+import gzip
+import io
+import logging
+import tempfile
+from datetime import date
+from itertools import islice
+from typing import Iterable, Optional
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from .models import PassengerHourlyRollup, Trip
+from .rollups import _passenger_rollups, _split_range, day_bounds
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_CSV = "csv"
+EXPORT_FORMAT_PARQUET = "parquet"
+EXPORT_FORMATS = (EXPORT_FORMAT_CSV, EXPORT_FORMAT_PARQUET)
+EXPORT_CHUNK_SIZE = 2000
+
+# (column name, type) pairs; the type drives CSV formatting and the Parquet schema
+TRIP_FACT_COLUMNS = (
+    ("trip_id", "string"),
+    ("line_id", "string"),
+    ("bus_id", "string"),
+    ("driver_id", "string"),
+    ("start_time", "timestamp"),
+    ("end_time", "timestamp"),
+    ("is_completed", "bool"),
+    ("distance", "float"),
+    ("average_speed", "float"),
+    ("max_passengers", "int"),
+    ("total_stops", "int"),
+)
+TRIP_FACT_FIELDS = (
+    "id", "line_id", "bus_id", "driver_id", "start_time", "end_time",
+    "is_completed", "distance", "average_speed", "max_passengers", "total_stops",
+)
+
+HOURLY_FACT_COLUMNS = (
+    ("bucket_start", "timestamp"),
+    ("line_id", "string"),
+    ("stop_id", "string"),
+    ("record_count", "int"),
+    ("total_passengers", "int"),
+    ("occupancy_sum", "float"),
+    ("occupancy_max", "float"),
+    ("occupancy_min", "float"),
+)
+HOURLY_FACT_FIELDS = tuple(name for name, _ in HOURLY_FACT_COLUMNS)
+
+_CONVERTERS = {
+    "string": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "timestamp": lambda value: value,
+}
+
+
+def _convert(columns, row):
+    """
+    Convert a database row to plain Python values, keeping ``None``.
+    """
+    return [
+        None if value is None else _CONVERTERS[kind](value)
+        for (_, kind), value in zip(columns, row)
+    ]
+
+
+def _chunks(rows: Iterable, size: int):
+    """
+    Yield lists of at most ``size`` rows.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _write_csv(fh, columns, chunks) -> int:
+    """
+    Write chunks of rows to ``fh`` as gzip CSV.
+    """
+    written = 0
+    with gzip.GzipFile(fileobj=fh, mode="wb") as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow([name for name, _ in columns])
+        for chunk in chunks:
+            writer.writerows(
+                [
+                    value.isoformat() if kind == "timestamp" and value is not None else value
+                    for (_, kind), value in zip(columns, row)
+                ]
+                for row in chunk
+            )
+            written += len(chunk)
+        text.flush()
+        text.detach()
+    return written
+
+
+def _write_parquet(fh, columns, chunks) -> int:
+    """
+    Write chunks of rows to ``fh`` as Parquet, one row group per chunk.
+    """
+    types = {
+        "string": pyarrow.string(),
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+        "bool": pyarrow.bool_(),
+        "timestamp": pyarrow.timestamp("us", tz="UTC"),
+    }
+    schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+    written = 0
+    with pyarrow.parquet.ParquetWriter(fh, schema) as writer:
+        for chunk in chunks:
+            arrays = [
+                pyarrow.array([row[index] for row in chunk], type=schema.field(index).type)
+                for index in range(len(columns))
+            ]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            written += len(chunk)
+    return written
+
+
+def write_facts(path: str, columns, rows: Iterable, fmt: str = EXPORT_FORMAT_CSV,
+                chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Stream rows to ``path`` in the default storage.
+
+    The file is built in a temporary file and replaces any previous export
+    at the same path.
+
+    Args:
+        path: Storage path without extension
+        columns: (name, type) pairs
+        rows: Iterable of converted rows
+        fmt: ``csv`` (gzip) or ``parquet``
+        chunk_size: Rows per write
+
+    Returns:
+        Number of rows written
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == EXPORT_FORMAT_PARQUET and pyarrow is None:
+        raise ValueError("Parquet exports require pyarrow to be installed")
+
+    with tempfile.TemporaryFile() as fh:
+        chunks = _chunks(rows, chunk_size)
+        if fmt == EXPORT_FORMAT_PARQUET:
+            written = _write_parquet(fh, columns, chunks)
+        else:
+            written = _write_csv(fh, columns, chunks)
+
+        fh.seek(0)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, File(fh))
+
+    logger.info(f"Exported {written} rows to {path}")
+    return written
+
+
+def export_path(name: str, start_date: date, end_date: date, fmt: str) -> str:
+    """
+    Get the storage path of an export.
+    """
+    extension = "parquet" if fmt == EXPORT_FORMAT_PARQUET else "csv.gz"
+    period = start_date.isoformat()
+    if end_date != start_date:
+        period = f"{period}_{end_date.isoformat()}"
+    return f"exports/{name}/{period}.{extension}"
+
+
+def iter_trip_facts(start_date: date, end_date: date, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield one row per trip started in ``[start_date, end_date]``.
+    """
+    start, end = day_bounds(start_date, end_date)
+    rows = Trip.objects.filter(
+        start_time__gte=start,
+        start_time__lt=end,
+    ).order_by("start_time", "id").values_list(*TRIP_FACT_FIELDS).iterator(chunk_size=chunk_size)
+
+    for row in rows:
+        yield _convert(TRIP_FACT_COLUMNS, row)
+
+
+def iter_hourly_facts(start_date: date, end_date: date, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield one row per hour, line and stop of ``[start_date, end_date]``.
+
+    Rolled-up days are read from the hourly rollups; the rest is aggregated live.
+    """
+    for first_day, last_day, rolled_up in _split_range(start_date, end_date):
+        if rolled_up:
+            start, end = day_bounds(first_day, last_day)
+            rows = PassengerHourlyRollup.objects.filter(
+                bucket_start__gte=start,
+                bucket_start__lt=end,
+            ).order_by("bucket_start", "id").values_list(*HOURLY_FACT_FIELDS).iterator(chunk_size=chunk_size)
+            for row in rows:
+                yield _convert(HOURLY_FACT_COLUMNS, row)
+        else:
+            live = sorted(_passenger_rollups(first_day, last_day), key=lambda row: row.bucket_start)
+            for row in live:
+                yield _convert(HOURLY_FACT_COLUMNS, [getattr(row, field) for field in HOURLY_FACT_FIELDS])
+
+
+def export_trip_facts(start_date: date, end_date: Optional[date] = None,
+                      fmt: str = EXPORT_FORMAT_CSV) -> str:
+    """
+    Export the per-trip facts of ``[start_date, end_date]``.
+
+    Returns:
+        Storage path of the export
+    """
+    end_date = end_date or start_date
+    path = export_path("trips", start_date, end_date, fmt)
+    write_facts(path, TRIP_FACT_COLUMNS, iter_trip_facts(start_date, end_date), fmt)
+    return path
+
+
+def export_hourly_facts(start_date: date, end_date: Optional[date] = None,
+                        fmt: str = EXPORT_FORMAT_CSV) -> str:
+    """
+    Export the per-hour passenger facts of ``[start_date, end_date]``.
+
+    Returns:
+        Storage path of the export
+    """
+    end_date = end_date or start_date
+    path = export_path("passengers_hourly", start_date, end_date, fmt)
+    write_facts(path, HOURLY_FACT_COLUMNS, iter_hourly_facts(start_date, end_date), fmt)
+    return path
@@ -0,0 +1,236 @@
+"""
+Async reads of cached live bus state.
+
+Live state is written by ``cache_live_state`` as JSON hashes: one per bus,
+one per line and field keyed by bus, and one of ETAs per stop. WebSocket
+subscription snapshots and the async live endpoints read them through the
+async Redis client, a line in a single pipelined round trip, and never
+query the database. Caches other than django-redis fall back to the regular
+cached bus locations and passenger counts where they can.
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.core.constants import (
+    CACHE_KEY_BUS_LOCATION,
+    CACHE_KEY_BUS_PASSENGERS,
+    CACHE_KEY_BUS_POSITIONS_SEEN,
+    CACHE_KEY_LINE_BUSES,
+    CACHE_KEY_LIVE_BUS,
+    CACHE_KEY_LIVE_LINE,
+    CACHE_KEY_LIVE_STOP_ETAS,
+    CACHE_TIMEOUT_BUS_POSITION,
+)
+from apps.core.utils.cache import get_async_redis_client
+
+LIVE_STATE_FIELDS = ('position', 'occupancy', 'etas')
+
+# How long a passed ETA is still listed as an arrival, in seconds
+LIVE_ARRIVAL_GRACE = 60
+
+
+def _is_stale(position: Optional[Dict], now: datetime) -> bool:
+    """
+    Check whether a position is missing or older than CACHE_TIMEOUT_BUS_POSITION.
+    """
+    if not position or not position.get('timestamp'):
+        return True
+    timestamp = datetime.fromisoformat(position['timestamp'])
+    return now - timestamp > timedelta(seconds=CACHE_TIMEOUT_BUS_POSITION)
+
+
+def _bus_state(bus_id: str, position=None, occupancy=None, etas=None) -> Dict:
+    return {
+        'bus_id': str(bus_id),
+        'position': position,
+        'occupancy': occupancy,
+        'etas': etas or {},
+    }
+
+
+async def _aread_redis_state(client, bus_ids: List[str], line_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Read the live hashes of buses and lines in one pipelined round trip.
+    """
+    async with client.pipeline(transaction=False) as pipe:
+        for bus_id in bus_ids:
+            pipe.hgetall(CACHE_KEY_LIVE_BUS.format(bus_id=bus_id))
+        for line_id in line_ids:
+            for field in LIVE_STATE_FIELDS:
+                pipe.hgetall(CACHE_KEY_LIVE_LINE.format(line_id=line_id, field=field))
+        results = iter(await pipe.execute())
+
+    states = {}
+    for bus_id in bus_ids:
+        values = next(results)
+        if values:
+            states[bus_id] = _bus_state(bus_id, **{field: json.loads(value) for field, value in values.items()})
+    for _ in line_ids:
+        for field in LIVE_STATE_FIELDS:
+            for bus_id, value in next(results).items():
+                states.setdefault(bus_id, _bus_state(bus_id))[field] = json.loads(value)
+    return states
+
+
+async def _aread_cached_state(bus_ids: List[str], line_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Build live state from cached locations and passenger counts, without ETAs.
+    """
+    bus_ids = set(bus_ids)
+    if line_ids:
+        lines = await cache.aget_many([CACHE_KEY_LINE_BUSES.format(line_id=line_id) for line_id in line_ids])
+        for buses in lines.values():
+            bus_ids.update(str(bus['bus_id']) for bus in buses or ())
+
+    if not bus_ids:
+        return {}
+
+    location_keys = {CACHE_KEY_BUS_LOCATION.format(bus_id=bus_id): bus_id for bus_id in bus_ids}
+    passenger_keys = {CACHE_KEY_BUS_PASSENGERS.format(bus_id=bus_id): bus_id for bus_id in bus_ids}
+    values = await cache.aget_many([*location_keys, *passenger_keys])
+
+    states = {}
+    for key, location in values.items():
+        if key in location_keys:
+            states[location_keys[key]] = _bus_state(location_keys[key], position={
+                'latitude': location['latitude'],
+                'longitude': location['longitude'],
+                'speed': location.get('speed'),
+                'heading': location.get('heading'),
+                'nearest_stop_id': location.get('nearest_stop_id'),
+                'distance_to_stop': location.get('distance_to_stop'),
+                'timestamp': location['timestamp'],
+            })
+    for key, count in values.items():
+        if key in passenger_keys:
+            states.setdefault(passenger_keys[key], _bus_state(passenger_keys[key]))['occupancy'] = {'count': count}
+    return states
+
+
+async def aget_live_state(bus_ids: Iterable[str] = (), line_ids: Iterable[str] = ()) -> Dict[str, Dict]:
+    """
+    Get the live state of buses, directly or through the lines they run on.
+
+    Buses reached through a line are left out once their position is stale.
+
+    Args:
+        bus_ids: IDs of buses
+        line_ids: IDs of lines
+
+    Returns:
+        Dict of bus ID to ``position``, ``occupancy`` and ``etas``
+    """
+    bus_ids = [str(bus_id) for bus_id in bus_ids]
+    line_ids = [str(line_id) for line_id in line_ids]
+
+    client = get_async_redis_client()
+    if client is not None:
+        states = await _aread_redis_state(client, bus_ids, line_ids)
+    else:
+        states = await _aread_cached_state(bus_ids, line_ids)
+
+    now = timezone.now()
+    return {
+        bus_id: state
+        for bus_id, state in states.items()
+        if bus_id in bus_ids or not _is_stale(state['position'], now)
+    }
+
+
+async def aget_active_buses(line_id: Optional[str] = None) -> Optional[List[Dict]]:
+    """
+    Get the live state of every bus that reported a position recently.
+
+    Args:
+        line_id: Only buses on this line
+
+    Returns:
+        Live states ordered by bus ID, or None when the cache is not Redis
+    """
+    client = get_async_redis_client()
+    if client is None:
+        return None
+
+    if line_id:
+        states = await aget_live_state(line_ids=[line_id])
+    else:
+        bus_ids = await client.zrangebyscore(
+            CACHE_KEY_BUS_POSITIONS_SEEN, time.time() - CACHE_TIMEOUT_BUS_POSITION, '+inf'
+        )
+        states = await aget_live_state(bus_ids=bus_ids) if bus_ids else {}
+
+    return sorted(states.values(), key=lambda state: state['bus_id'])
+
+
+async def aget_stop_arrivals(stop_id: str, line_id: Optional[str] = None) -> Optional[List[Dict]]:
+    """
+    Get the cached ETAs of buses heading to a stop.
+
+    Args:
+        stop_id: ID of the stop
+        line_id: Only buses on this line
+
+    Returns:
+        Arrivals ordered by ETA, or None when the cache is not Redis
+    """
+    client = get_async_redis_client()
+    if client is None:
+        return None
+
+    etas = await client.hgetall(CACHE_KEY_LIVE_STOP_ETAS.format(stop_id=stop_id))
+    now = timezone.now()
+
+    arrivals = []
+    for bus_id, value in etas.items():
+        arrival = json.loads(value)
+        if line_id and arrival['line_id'] != str(line_id):
+            continue
+        eta = datetime.fromisoformat(arrival['eta'])
+        if timezone.is_naive(eta):
+            eta = timezone.make_aware(eta)
+        seconds = (eta - now).total_seconds()
+        if seconds < -LIVE_ARRIVAL_GRACE:
+            continue
+        arrivals.append({
+            'bus_id': bus_id,
+            'line_id': arrival['line_id'],
+            'eta': arrival['eta'],
+            'minutes': max(0, round(seconds / 60)),
+        })
+
+    return sorted(arrivals, key=lambda arrival: arrival['eta'])
+
+
+async def aget_group_snapshot(group: str) -> Optional[Dict]:
+    """
+    Get the ``snapshot`` event sent to a socket joining a bus or line group.
+
+    Args:
+        group: ``bus_<id>`` or ``line_<id>`` group name
+
+    Returns:
+        Snapshot event, or None for other groups
+    """
+    if group.startswith('bus_'):
+        bus_id = group[len('bus_'):]
+        states = await aget_live_state(bus_ids=[bus_id])
+        scope = {'bus_id': bus_id}
+    elif group.startswith('line_'):
+        line_id = group[len('line_'):]
+        states = await aget_live_state(line_ids=[line_id])
+        scope = {'line_id': line_id}
+    else:
+        return None
+
+    return {
+        'type': 'snapshot',
+        'subscription': group,
+        **scope,
+        'buses': sorted(states.values(), key=lambda state: state['bus_id']),
+        'timestamp': timezone.now().isoformat(),
+    }
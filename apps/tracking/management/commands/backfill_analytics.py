@@ -0,0 +1,65 @@
+"""
+Management command to backfill tracking rollups, reports and exports.
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.tracking.exports import EXPORT_FORMATS, export_hourly_facts, export_trip_facts
+from apps.tracking.rollups import build_daily_rollups, get_rollup_low_watermark
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily tracking rollups over a date range, optionally with reports and fact exports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', required=True, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day (YYYY-MM-DD), defaults to yesterday')
+        parser.add_argument('--reports', action='store_true', help='Regenerate the daily report files')
+        parser.add_argument('--export', action='store_true', help='Export per-trip and per-hour facts')
+        parser.add_argument('--format', default='csv', choices=EXPORT_FORMATS, help='Export file format')
+
+    def handle(self, *args, **options):
+        date_from = self.parse_date(options['date_from'])
+        yesterday = timezone.localdate() - timedelta(days=1)
+        date_to = self.parse_date(options['date_to']) if options['date_to'] else yesterday
+
+        if date_to > yesterday:
+            self.stdout.write(self.style.WARNING(f'Capping the range at {yesterday}; today is still open'))
+            date_to = yesterday
+        if date_from > date_to:
+            raise CommandError('--from must not be after --to')
+
+        # One day per transaction keeps locks and memory bounded on long ranges.
+        # History before the rolled-up days is built backwards, so each day
+        # stays contiguous with them.
+        days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+        low_watermark = get_rollup_low_watermark()
+        if low_watermark is not None and date_to < low_watermark:
+            days.reverse()
+
+        for day in days:
+            rows = build_daily_rollups(day)
+            message = f'{day}: {rows} rollup rows'
+
+            if options['reports']:
+                from tasks.periodic import REPORT_GENERATORS, save_reports
+
+                save_reports(day, *[generate(day) for generate in REPORT_GENERATORS.values()])
+                message += ', reports saved'
+
+            if options['export']:
+                export_trip_facts(day, fmt=options['format'])
+                export_hourly_facts(day, fmt=options['format'])
+                message += ', facts exported'
+
+            self.stdout.write(message)
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {date_from} to {date_to}'))
+
+    def parse_date(self, value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from apps.core.utils.spatial import create_spatial_indexes, drop_spatial_indexes, postgis_enabled
+
+
+def create_indexes(apps, schema_editor):
+    if postgis_enabled(schema_editor.connection):
+        create_spatial_indexes(schema_editor.connection)
+
+
+def drop_indexes(apps, schema_editor):
+    if postgis_enabled(schema_editor.connection):
+        drop_spatial_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lines", "0004_alter_servicedisruption_created_at_and_more"),
+        ("tracking", "0008_correct_reports_decimal"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.12 on 2026-10-18 21:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buses', '0004_bus_bus_type'),
+        ('lines', '0004_alter_servicedisruption_created_at_and_more'),
+        ('tracking', '0009_spatial_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='currencytransaction',
+            name='tracking_cu_user_id_0df35e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='locationupdate',
+            name='tracking_lo_bus_id_af9212_idx',
+        ),
+        migrations.AddIndex(
+            model_name='currencytransaction',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='tracking_cu_user_id_7cfe77_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationupdate',
+            index=models.Index(fields=['bus', '-created_at', '-id'], name='tracking_lo_bus_id_d572bb_idx'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.12 on 2026-10-18 21:24
+
+import datetime
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buses', '0004_bus_bus_type'),
+        ('drivers', '0002_add_driver_status_log'),
+        ('lines', '0004_alter_servicedisruption_created_at_and_more'),
+        ('tracking', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PassengerHourlyRollup',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(db_index=True, verbose_name='bucket start')),
+                ('record_count', models.PositiveIntegerField(default=0, verbose_name='records')),
+                ('total_passengers', models.PositiveIntegerField(default=0, verbose_name='total passengers')),
+                ('occupancy_sum', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='occupancy sum')),
+                ('occupancy_max', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='maximum occupancy')),
+                ('occupancy_min', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='minimum occupancy')),
+                ('line', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='hourly_passenger_rollups', to='lines.line', verbose_name='line')),
+                ('stop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='hourly_passenger_rollups', to='lines.stop', verbose_name='stop')),
+            ],
+            options={
+                'verbose_name': 'passenger hourly rollup',
+                'verbose_name_plural': 'passenger hourly rollups',
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['line', 'bucket_start'], name='tracking_pa_line_id_ffd825_idx'), models.Index(fields=['stop', 'bucket_start'], name='tracking_pa_stop_id_9f0bf0_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StopDailyRollup',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, verbose_name='date')),
+                ('report_count', models.PositiveIntegerField(default=0, verbose_name='reports')),
+                ('total_reported', models.PositiveIntegerField(default=0, verbose_name='total reported')),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='lines.stop', verbose_name='stop')),
+            ],
+            options={
+                'verbose_name': 'stop daily rollup',
+                'verbose_name_plural': 'stop daily rollups',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['stop', 'date'], name='tracking_st_stop_id_797358_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'stop'), name='unique_stop_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TripDailyRollup',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, verbose_name='date')),
+                ('trip_count', models.PositiveIntegerField(default=0, verbose_name='trips')),
+                ('total_distance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='total distance')),
+                ('total_passengers', models.PositiveIntegerField(default=0, verbose_name='total passengers')),
+                ('speed_sum', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='speed sum')),
+                ('speed_count', models.PositiveIntegerField(default=0, verbose_name='speed count')),
+                ('completed_trip_count', models.PositiveIntegerField(default=0, verbose_name='completed trips')),
+                ('completed_distance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='completed distance')),
+                ('completed_passengers', models.PositiveIntegerField(default=0, verbose_name='completed passengers')),
+                ('completed_speed_sum', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='completed speed sum')),
+                ('completed_speed_count', models.PositiveIntegerField(default=0, verbose_name='completed speed count')),
+                ('completed_duration', models.DurationField(default=datetime.timedelta, verbose_name='completed duration')),
+                ('anomaly_count', models.PositiveIntegerField(default=0, verbose_name='anomalies')),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='buses.bus', verbose_name='bus')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='drivers.driver', verbose_name='driver')),
+                ('line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='lines.line', verbose_name='line')),
+            ],
+            options={
+                'verbose_name': 'trip daily rollup',
+                'verbose_name_plural': 'trip daily rollups',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['line', 'date'], name='tracking_tr_line_id_61f48d_idx'), models.Index(fields=['bus', 'date'], name='tracking_tr_bus_id_175a30_idx'), models.Index(fields=['driver', 'date'], name='tracking_tr_driver__dbe9ca_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'line', 'bus', 'driver'), name='unique_trip_daily_rollup')],
+            },
+        ),
+    ]
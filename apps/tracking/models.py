@@ -1,8 +1,10 @@
 """
 Models for the tracking app.
 """
+from datetime import timedelta
+
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connection, models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -154,7 +156,7 @@ class LocationUpdate(BaseModel):
         ordering = ["-created_at"]
         get_latest_by = "created_at"
         indexes = [
-            models.Index(fields=["bus", "-created_at"]),
+            models.Index(fields=["bus", "-created_at", "-id"]),
             models.Index(fields=["line", "-created_at"]),
             models.Index(fields=["trip_id"]),
         ]
@@ -766,26 +768,103 @@ class VirtualCurrency(BaseModel):
     def __str__(self):
         return f"{self.user.email} - {self.balance} coins"
 
-    def add_currency(self, amount, description="", transaction_type="earned"):
-        """Add virtual currency to user's balance."""
-        if amount > 0:
-            self.balance += amount
-            self.lifetime_earned += amount
-        else:
-            self.balance += amount  # amount is negative for spending/penalties
-            self.lifetime_spent += abs(amount)
-
-        self.last_transaction = timezone.now()
-        self.save()
-
-        # Create transaction record
-        CurrencyTransaction.objects.create(
-            user=self.user,
-            amount=amount,
-            transaction_type=transaction_type,
-            description=description,
-            balance_after=self.balance
-        )
+    def add_currency(
+        self,
+        amount,
+        description="",
+        transaction_type="earned",
+        related_report=None,
+        metadata=None,
+        allow_negative=True,
+    ):
+        """
+        Add virtual currency to user's balance and record the transaction.
+
+        The delta is applied in the database, so concurrent awards for the same
+        user cannot overwrite each other.
+
+        Returns:
+            The created CurrencyTransaction, or None if ``allow_negative`` is
+            False and the balance is insufficient
+        """
+        with transaction.atomic():
+            # A zero movement cannot be rejected and leaves the balance alone,
+            # but is still recorded in the ledger
+            if amount:
+                totals = VirtualCurrency.apply_deltas(
+                    {self.user_id: amount},
+                    allow_negative=allow_negative,
+                ).get(self.user_id)
+
+                if totals is None:
+                    return None
+
+                self.balance, self.lifetime_earned, self.lifetime_spent, self.last_transaction = totals
+
+            return CurrencyTransaction.objects.create(
+                user_id=self.user_id,
+                amount=amount,
+                transaction_type=transaction_type,
+                description=description,
+                balance_after=self.balance,
+                related_report=related_report,
+                metadata=metadata or {},
+            )
+
+    @classmethod
+    def apply_deltas(cls, deltas, allow_negative=True):
+        """
+        Apply balance deltas for several users in a single UPDATE statement.
+
+        Args:
+            deltas: Mapping of user ID to either an amount (positive to earn,
+                negative to spend) or a ``(delta, earned, spent)`` tuple for
+                several netted movements
+            allow_negative: Skip users whose balance would drop below zero
+
+        Returns:
+            Mapping of user ID to ``(balance, lifetime_earned, lifetime_spent,
+            last_transaction)`` for every updated account
+        """
+        movements = {}
+        for user_id, value in deltas.items():
+            if isinstance(value, tuple):
+                movements[user_id] = value
+            else:
+                movements[user_id] = (value, max(value, 0), max(-value, 0))
+        deltas = {user_id: value for user_id, value in movements.items() if any(value)}
+        if not deltas:
+            return {}
+
+        now = timezone.now()
+        rows = []
+        params = []
+        for user_id, (delta, earned, spent) in sorted(deltas.items(), key=lambda item: str(item[0])):
+            rows.append("(%s::uuid, %s, %s, %s)")
+            params.extend([str(user_id), delta, earned, spent])
+
+        sql = f"""
+            UPDATE {cls._meta.db_table} AS vc
+            SET balance = vc.balance + d.delta,
+                lifetime_earned = vc.lifetime_earned + d.earned,
+                lifetime_spent = vc.lifetime_spent + d.spent,
+                last_transaction = %s,
+                updated_at = %s
+            FROM (VALUES {', '.join(rows)}) AS d(user_id, delta, earned, spent)
+            WHERE vc.user_id = d.user_id
+            {'' if allow_negative else 'AND vc.balance + d.delta >= 0'}
+            RETURNING vc.user_id, vc.balance, vc.lifetime_earned, vc.lifetime_spent
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now, now, *params])
+            results = cursor.fetchall()
+
+        ids = {str(user_id): user_id for user_id in deltas}
+        return {
+            ids.get(str(user_id), user_id): (balance, earned, spent, now)
+            for user_id, balance, earned, spent in results
+        }
 
 
 class CurrencyTransaction(BaseModel):
@@ -862,7 +941,7 @@ class CurrencyTransaction(BaseModel):
         verbose_name_plural = _("currency transactions")
         ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["user", "-created_at", "-id"]),
             models.Index(fields=["transaction_type"]),
         ]
 
@@ -1104,6 +1183,180 @@ class UserPremiumFeature(BaseModel):
             self.save()
 
 
+class TripDailyRollup(BaseModel):
+    """
+    Daily trip totals per line, bus and driver.
+
+    One row per (date, line, bus, driver) that had trips or trip anomalies, so
+    line, bus and driver totals are sums over a few rows per day. Dates are
+    local dates of the trip start (anomalies: of their creation). Averages are
+    kept as sums and counts so they can be combined across rows. Built by
+    ``apps.tracking.rollups``.
+    """
+    date = models.DateField(_("date"), db_index=True)
+    line = models.ForeignKey(
+        Line,
+        on_delete=models.CASCADE,
+        related_name="daily_rollups",
+        verbose_name=_("line"),
+    )
+    bus = models.ForeignKey(
+        Bus,
+        on_delete=models.CASCADE,
+        related_name="daily_rollups",
+        verbose_name=_("bus"),
+    )
+    driver = models.ForeignKey(
+        Driver,
+        on_delete=models.CASCADE,
+        related_name="daily_rollups",
+        verbose_name=_("driver"),
+    )
+
+    trip_count = models.PositiveIntegerField(_("trips"), default=0)
+    total_distance = models.DecimalField(
+        _("total distance"),
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+    )
+    total_passengers = models.PositiveIntegerField(_("total passengers"), default=0)
+    speed_sum = models.DecimalField(_("speed sum"), max_digits=12, decimal_places=2, default=0)
+    speed_count = models.PositiveIntegerField(_("speed count"), default=0)
+
+    completed_trip_count = models.PositiveIntegerField(_("completed trips"), default=0)
+    completed_distance = models.DecimalField(
+        _("completed distance"),
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+    )
+    completed_passengers = models.PositiveIntegerField(_("completed passengers"), default=0)
+    completed_speed_sum = models.DecimalField(
+        _("completed speed sum"),
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+    )
+    completed_speed_count = models.PositiveIntegerField(_("completed speed count"), default=0)
+    completed_duration = models.DurationField(_("completed duration"), default=timedelta)
+
+    anomaly_count = models.PositiveIntegerField(_("anomalies"), default=0)
+
+    class Meta:
+        verbose_name = _("trip daily rollup")
+        verbose_name_plural = _("trip daily rollups")
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "line", "bus", "driver"],
+                name="unique_trip_daily_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["line", "date"]),
+            models.Index(fields=["bus", "date"]),
+            models.Index(fields=["driver", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.line_id}/{self.bus_id}/{self.driver_id}"
+
+
+class PassengerHourlyRollup(BaseModel):
+    """
+    Hourly passenger-count totals per line and stop.
+
+    Buckets are local hours. Counts without a line or stop are kept on rows
+    with an empty line or stop.
+    """
+    bucket_start = models.DateTimeField(_("bucket start"), db_index=True)
+    line = models.ForeignKey(
+        Line,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="hourly_passenger_rollups",
+        verbose_name=_("line"),
+    )
+    stop = models.ForeignKey(
+        Stop,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="hourly_passenger_rollups",
+        verbose_name=_("stop"),
+    )
+
+    record_count = models.PositiveIntegerField(_("records"), default=0)
+    total_passengers = models.PositiveIntegerField(_("total passengers"), default=0)
+    occupancy_sum = models.DecimalField(
+        _("occupancy sum"),
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+    )
+    occupancy_max = models.DecimalField(
+        _("maximum occupancy"),
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    occupancy_min = models.DecimalField(
+        _("minimum occupancy"),
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = _("passenger hourly rollup")
+        verbose_name_plural = _("passenger hourly rollups")
+        ordering = ["-bucket_start"]
+        indexes = [
+            models.Index(fields=["line", "bucket_start"]),
+            models.Index(fields=["stop", "bucket_start"]),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket_start:%Y-%m-%d %H:00} - {self.line_id or '-'}/{self.stop_id or '-'}"
+
+
+class StopDailyRollup(BaseModel):
+    """
+    Daily waiting-count report totals per stop.
+    """
+    date = models.DateField(_("date"), db_index=True)
+    stop = models.ForeignKey(
+        Stop,
+        on_delete=models.CASCADE,
+        related_name="daily_rollups",
+        verbose_name=_("stop"),
+    )
+
+    report_count = models.PositiveIntegerField(_("reports"), default=0)
+    total_reported = models.PositiveIntegerField(_("total reported"), default=0)
+
+    class Meta:
+        verbose_name = _("stop daily rollup")
+        verbose_name_plural = _("stop daily rollups")
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "stop"],
+                name="unique_stop_daily_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["stop", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.stop_id}"
+
+
 __all__ = [
     'LocationUpdate',
     'Trip',
@@ -1120,4 +1373,7 @@ __all__ = [
     'DriverPerformanceScore',
     'PremiumFeature',
     'UserPremiumFeature',
+    'TripDailyRollup',
+    'PassengerHourlyRollup',
+    'StopDailyRollup',
 ]
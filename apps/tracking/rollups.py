@@ -0,0 +1,420 @@
+"""
+Daily and hourly tracking analytics rollups.
+
+Closed days are aggregated into ``TripDailyRollup``, ``PassengerHourlyRollup``
+and ``StopDailyRollup`` rows by a nightly task, so reports and admin
+dashboards read a few pre-aggregated rows per entity and day and only scan
+raw tables for the days that have not been rolled up yet (normally today,
+plus any history from before the first rolled-up day).
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import (
+    Anomaly,
+    PassengerCount,
+    PassengerHourlyRollup,
+    StopDailyRollup,
+    Trip,
+    TripDailyRollup,
+    WaitingCountReport,
+)
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_WATERMARK = "tracking:rollup:watermark"
+CACHE_KEY_LOW_WATERMARK = "tracking:rollup:low_watermark"
+
+COMPLETED_Q = Q(is_completed=True, end_time__isnull=False)
+
+
+def day_bounds(start_date: date, end_date: Optional[date] = None):
+    """
+    Get the aware datetimes spanning local days ``[start_date, end_date]``.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine((end_date or start_date) + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _trip_rollups(start_date: date, end_date: date) -> Dict[tuple, TripDailyRollup]:
+    """
+    Aggregate trips and trip anomalies of ``[start_date, end_date]`` into unsaved rows.
+    """
+    start, end = day_bounds(start_date, end_date)
+    rows = {}
+
+    def row_for(day, line_id, bus_id, driver_id):
+        key = (day, line_id, bus_id, driver_id)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = TripDailyRollup(date=day, line_id=line_id, bus_id=bus_id, driver_id=driver_id)
+        return row
+
+    trips = Trip.objects.filter(
+        start_time__gte=start,
+        start_time__lt=end,
+    ).annotate(
+        day=TruncDate("start_time"),
+    ).values(
+        "day", "line_id", "bus_id", "driver_id",
+    ).annotate(
+        trip_count=Count("id"),
+        total_distance=Sum("distance"),
+        total_passengers=Sum("max_passengers"),
+        speed_sum=Sum("average_speed"),
+        speed_count=Count("average_speed"),
+        completed_trip_count=Count("id", filter=COMPLETED_Q),
+        completed_distance=Sum("distance", filter=COMPLETED_Q),
+        completed_passengers=Sum("max_passengers", filter=COMPLETED_Q),
+        completed_speed_sum=Sum("average_speed", filter=COMPLETED_Q),
+        completed_speed_count=Count("average_speed", filter=COMPLETED_Q),
+        completed_duration=Sum(F("end_time") - F("start_time"), filter=COMPLETED_Q),
+    ).order_by()
+
+    for values in trips:
+        row = row_for(values.pop("day"), values.pop("line_id"), values.pop("bus_id"), values.pop("driver_id"))
+        for field, value in values.items():
+            if value is not None:
+                setattr(row, field, value)
+
+    anomalies = Anomaly.objects.filter(
+        created_at__gte=start,
+        created_at__lt=end,
+        trip__isnull=False,
+    ).annotate(
+        day=TruncDate("created_at"),
+    ).values(
+        "day", "trip__line_id", "trip__bus_id", "trip__driver_id",
+    ).annotate(
+        anomaly_count=Count("id"),
+    ).order_by()
+
+    for values in anomalies:
+        row_for(
+            values["day"], values["trip__line_id"], values["trip__bus_id"], values["trip__driver_id"]
+        ).anomaly_count = values["anomaly_count"]
+
+    return rows
+
+
+def _passenger_rollups(start_date: date, end_date: date) -> List[PassengerHourlyRollup]:
+    """
+    Aggregate passenger counts of ``[start_date, end_date]`` into unsaved hourly rows.
+    """
+    start, end = day_bounds(start_date, end_date)
+
+    counts = PassengerCount.objects.filter(
+        created_at__gte=start,
+        created_at__lt=end,
+    ).annotate(
+        bucket=TruncHour("created_at"),
+    ).values(
+        "bucket", "line_id", "stop_id",
+    ).annotate(
+        record_count=Count("id"),
+        total_passengers=Sum("count"),
+        occupancy_sum=Sum("occupancy_rate"),
+        occupancy_max=Max("occupancy_rate"),
+        occupancy_min=Min("occupancy_rate"),
+    ).order_by()
+
+    return [
+        PassengerHourlyRollup(
+            bucket_start=values.pop("bucket"),
+            **{field: value for field, value in values.items() if value is not None},
+        )
+        for values in counts
+    ]
+
+
+def _stop_rollups(start_date: date, end_date: date) -> List[StopDailyRollup]:
+    """
+    Aggregate waiting-count reports of ``[start_date, end_date]`` into unsaved rows.
+    """
+    start, end = day_bounds(start_date, end_date)
+
+    reports = WaitingCountReport.objects.filter(
+        created_at__gte=start,
+        created_at__lt=end,
+    ).annotate(
+        day=TruncDate("created_at"),
+    ).values(
+        "day", "stop_id",
+    ).annotate(
+        report_count=Count("id"),
+        total_reported=Sum("reported_count"),
+    ).order_by()
+
+    return [
+        StopDailyRollup(
+            date=values["day"],
+            stop_id=values["stop_id"],
+            report_count=values["report_count"],
+            total_reported=values["total_reported"] or 0,
+        )
+        for values in reports
+    ]
+
+
+def build_daily_rollups(start_date: date, end_date: Optional[date] = None) -> int:
+    """
+    Rebuild the rollups of every closed local day in ``[start_date, end_date]``.
+
+    Days are replaced rather than incremented, so the same range can be rebuilt
+    safely (e.g. to pick up trips completed after midnight, or to backfill).
+
+    Args:
+        start_date: First day to rebuild
+        end_date: Last day to rebuild, defaults to (and is capped at) yesterday
+
+    Returns:
+        Number of rollup rows written
+    """
+    yesterday = timezone.localdate() - timedelta(days=1)
+    end_date = min(end_date or yesterday, yesterday)
+    if start_date > end_date:
+        return 0
+
+    low_watermark = get_rollup_low_watermark()
+    watermark = get_rollup_watermark()
+
+    trip_rows = _trip_rollups(start_date, end_date).values()
+    passenger_rows = _passenger_rollups(start_date, end_date)
+    stop_rows = _stop_rollups(start_date, end_date)
+    start, end = day_bounds(start_date, end_date)
+
+    with transaction.atomic():
+        TripDailyRollup.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+        PassengerHourlyRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end).delete()
+        StopDailyRollup.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+
+        TripDailyRollup.objects.bulk_create(trip_rows, batch_size=500)
+        PassengerHourlyRollup.objects.bulk_create(passenger_rows, batch_size=500)
+        StopDailyRollup.objects.bulk_create(stop_rows, batch_size=500)
+
+    # The watermarks only grow over ranges touching the rolled-up days, so
+    # every day between them stays rolled up
+    if low_watermark is None or watermark is None:
+        low_watermark, watermark = start_date, end_date + timedelta(days=1)
+    elif start_date <= watermark and end_date >= low_watermark - timedelta(days=1):
+        low_watermark = min(low_watermark, start_date)
+        watermark = max(watermark, end_date + timedelta(days=1))
+    else:
+        logger.warning(
+            f"Tracking rollups of {start_date} - {end_date} are not contiguous with "
+            f"{low_watermark} - {watermark - timedelta(days=1)}; backfill the days between"
+        )
+    cache.set(CACHE_KEY_LOW_WATERMARK, low_watermark, None)
+    cache.set(CACHE_KEY_WATERMARK, watermark, None)
+
+    written = len(trip_rows) + len(passenger_rows) + len(stop_rows)
+    logger.info(f"Rebuilt {written} tracking rollup rows for {start_date} - {end_date}")
+    return written
+
+
+def get_rollup_watermark(refresh: bool = False) -> Optional[date]:
+    """
+    Get the first day that is not rolled up yet, or None if nothing is rolled up.
+    """
+    if not refresh:
+        watermark = cache.get(CACHE_KEY_WATERMARK)
+        if watermark is not None:
+            return watermark
+
+    latest = [
+        TripDailyRollup.objects.aggregate(latest=Max("date"))["latest"],
+        StopDailyRollup.objects.aggregate(latest=Max("date"))["latest"],
+    ]
+    latest_bucket = PassengerHourlyRollup.objects.aggregate(latest=Max("bucket_start"))["latest"]
+    if latest_bucket is not None:
+        latest.append(timezone.localtime(latest_bucket).date())
+
+    latest = [day for day in latest if day is not None]
+    if not latest:
+        return None
+
+    watermark = max(latest) + timedelta(days=1)
+    cache.set(CACHE_KEY_WATERMARK, watermark, None)
+    return watermark
+
+
+def get_rollup_low_watermark(refresh: bool = False) -> Optional[date]:
+    """
+    Get the first rolled-up day, or None if nothing is rolled up.
+    """
+    if not refresh:
+        low_watermark = cache.get(CACHE_KEY_LOW_WATERMARK)
+        if low_watermark is not None:
+            return low_watermark
+
+    earliest = [
+        TripDailyRollup.objects.aggregate(earliest=Min("date"))["earliest"],
+        StopDailyRollup.objects.aggregate(earliest=Min("date"))["earliest"],
+    ]
+    earliest_bucket = PassengerHourlyRollup.objects.aggregate(earliest=Min("bucket_start"))["earliest"]
+    if earliest_bucket is not None:
+        earliest.append(timezone.localtime(earliest_bucket).date())
+
+    earliest = [day for day in earliest if day is not None]
+    if not earliest:
+        return None
+
+    low_watermark = min(earliest)
+    cache.set(CACHE_KEY_LOW_WATERMARK, low_watermark, None)
+    return low_watermark
+
+
+def _split_range(date_from: date, date_to: date) -> List[Tuple[date, date, bool]]:
+    """
+    Split ``[date_from, date_to]`` around the rolled-up days.
+
+    Returns:
+        Ordered list of (first day, last day, rolled up) segments; days before
+        the low watermark and from the watermark on are not rolled up
+    """
+    low_watermark = get_rollup_low_watermark()
+    watermark = get_rollup_watermark()
+    if low_watermark is None or watermark is None:
+        return [(date_from, date_to, False)]
+
+    rolled_up_from = max(date_from, low_watermark)
+    rolled_up_to = min(date_to, watermark - timedelta(days=1))
+    if rolled_up_from > rolled_up_to:
+        return [(date_from, date_to, False)]
+
+    segments = []
+    if date_from < rolled_up_from:
+        segments.append((date_from, rolled_up_from - timedelta(days=1), False))
+    segments.append((rolled_up_from, rolled_up_to, True))
+    if rolled_up_to < date_to:
+        segments.append((rolled_up_to + timedelta(days=1), date_to, False))
+    return segments
+
+
+def get_trip_rollups(date_from: date, date_to: date, line_id=None) -> List[TripDailyRollup]:
+    """
+    Get the trip rollup rows of ``[date_from, date_to]``.
+
+    Rolled-up days are read from the rollup table; other days are aggregated
+    from the raw tables into unsaved rows.
+
+    Args:
+        date_from: First local day
+        date_to: Last local day
+        line_id: Optional line ID to filter by
+
+    Returns:
+        List of TripDailyRollup rows
+    """
+    rows = []
+
+    for first_day, last_day, rolled_up in _split_range(date_from, date_to):
+        if rolled_up:
+            queryset = TripDailyRollup.objects.filter(date__gte=first_day, date__lte=last_day)
+            if line_id:
+                queryset = queryset.filter(line_id=line_id)
+            rows.extend(queryset)
+        else:
+            live = _trip_rollups(first_day, last_day).values()
+            rows.extend(row for row in live if not line_id or str(row.line_id) == str(line_id))
+
+    return rows
+
+
+def get_passenger_rollups(date_from: date, date_to: date) -> List[PassengerHourlyRollup]:
+    """
+    Get the hourly passenger rollup rows of ``[date_from, date_to]``.
+    """
+    rows = []
+
+    for first_day, last_day, rolled_up in _split_range(date_from, date_to):
+        if rolled_up:
+            start, end = day_bounds(first_day, last_day)
+            rows.extend(PassengerHourlyRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end))
+        else:
+            rows.extend(_passenger_rollups(first_day, last_day))
+
+    return rows
+
+
+def get_stop_rollups(date_from: date, date_to: date) -> List[StopDailyRollup]:
+    """
+    Get the stop rollup rows of ``[date_from, date_to]``.
+    """
+    rows = []
+
+    for first_day, last_day, rolled_up in _split_range(date_from, date_to):
+        if rolled_up:
+            rows.extend(StopDailyRollup.objects.filter(date__gte=first_day, date__lte=last_day))
+        else:
+            rows.extend(_stop_rollups(first_day, last_day))
+
+    return rows
+
+
+def total_trip_rollups(rows, key=None) -> Dict:
+    """
+    Combine trip rollup rows, optionally grouped.
+
+    Args:
+        rows: TripDailyRollup rows
+        key: Optional function of a row returning its group
+
+    Returns:
+        Dict of group (None when ungrouped) to totals, with averages resolved
+        and the distinct ``bus_ids``/``driver_ids`` that had trips
+    """
+    groups = defaultdict(lambda: {
+        "trip_count": 0,
+        "total_distance": Decimal("0"),
+        "total_passengers": 0,
+        "speed_sum": Decimal("0"),
+        "speed_count": 0,
+        "completed_trip_count": 0,
+        "completed_distance": Decimal("0"),
+        "completed_passengers": 0,
+        "completed_speed_sum": Decimal("0"),
+        "completed_speed_count": 0,
+        "completed_duration": timedelta(),
+        "anomaly_count": 0,
+        "bus_ids": set(),
+        "driver_ids": set(),
+    })
+
+    for row in rows:
+        totals = groups[key(row) if key else None]
+        for field in (
+            "trip_count", "total_distance", "total_passengers", "speed_sum", "speed_count",
+            "completed_trip_count", "completed_distance", "completed_passengers",
+            "completed_speed_sum", "completed_speed_count", "completed_duration", "anomaly_count",
+        ):
+            totals[field] += getattr(row, field)
+        if row.trip_count:
+            totals["bus_ids"].add(row.bus_id)
+            totals["driver_ids"].add(row.driver_id)
+
+    for totals in groups.values():
+        totals["average_speed"] = (
+            float(totals["speed_sum"]) / totals["speed_count"] if totals["speed_count"] else None
+        )
+        totals["completed_average_speed"] = (
+            float(totals["completed_speed_sum"]) / totals["completed_speed_count"]
+            if totals["completed_speed_count"] else None
+        )
+        totals["average_duration_minutes"] = (
+            totals["completed_duration"].total_seconds() / totals["completed_trip_count"] / 60
+            if totals["completed_trip_count"] else None
+        )
+
+    return dict(groups)
@@ -7,12 +7,12 @@ from datetime import datetime, timedelta
 from django.db.models import Avg, Count, F, Max, Min, Q, Sum
 from django.utils import timezone
 
+from apps.core.constants import BUS_TRACKING_STATUS_ACTIVE
 from apps.core.selectors import get_object_or_404
 from apps.core.utils.cache import (
     get_cached_bus_location,
     get_cached_bus_passengers,
     get_cached_line_buses,
-    get_cached_stop_waiting,
 )
 from apps.core.utils.geo import calculate_eta
 
@@ -22,7 +22,6 @@ from .models import (
     LocationUpdate,
     PassengerCount,
     Trip,
-    WaitingPassengers,
 )
 
 logger = logging.getLogger(__name__)
@@ -162,6 +161,157 @@ def get_buses_on_line(line_id):
     return buses
 
 
+# Columns of the fleet snapshot, in payload order
+FLEET_SNAPSHOT_COLUMNS = (
+    "bus_id",
+    "license_plate",
+    "capacity",
+    "line_id",
+    "line_code",
+    "trip_id",
+    "driver_id",
+    "driver_name",
+    "tracking_started_at",
+    "latitude",
+    "longitude",
+    "speed",
+    "heading",
+    "nearest_stop_id",
+    "distance_to_stop",
+    "location_updated_at",
+    "passenger_count",
+    "occupancy_rate",
+    "count_updated_at",
+)
+
+
+def _as_float(value):
+    return float(value) if value is not None else None
+
+
+def _as_timestamp(value):
+    return value.timestamp() if value is not None else None
+
+
+def get_fleet_snapshot(line_id=None, since=None):
+    """
+    Get the position and load of every tracking bus as parallel columns.
+
+    Uses three queries: the tracking assignments with their bus, line and
+    driver, then the latest location and the latest passenger count of each
+    bus (``DISTINCT ON (bus_id)``, bounded by the earliest tracking start).
+    Timestamps are epoch seconds.
+
+    Args:
+        line_id: Optional line ID to filter by
+        since: Optional datetime; only buses whose assignment, location or
+            passenger count changed after it are returned, and buses that
+            stopped tracking after it are listed in ``removed``
+
+    Returns:
+        Dict with ``columns`` (name -> list), ``count`` and ``removed``
+    """
+    assignments = list(
+        get_tracking_buses(line_id).values_list(
+            "bus_id",
+            "bus__license_plate",
+            "bus__capacity",
+            "line_id",
+            "line__code",
+            "trip_id",
+            "bus__driver_id",
+            "bus__driver__user__first_name",
+            "bus__driver__user__last_name",
+            "start_time",
+            "updated_at",
+        ).order_by("bus_id", "-updated_at")
+    )
+
+    bus_ids = list(dict.fromkeys(row[0] for row in assignments))
+    start_times = [row[9] for row in assignments]
+    recent = Q(created_at__gte=min(start_times)) if start_times and None not in start_times else Q()
+
+    locations = {}
+    counts = {}
+    if bus_ids:
+        locations = {
+            row[0]: row[1:]
+            for row in LocationUpdate.objects.filter(recent, bus_id__in=bus_ids).order_by(
+                "bus_id", "-created_at"
+            ).distinct("bus_id").values_list(
+                "bus_id", "latitude", "longitude", "speed", "heading",
+                "nearest_stop_id", "distance_to_stop", "created_at",
+            )
+        }
+        counts = {
+            row[0]: row[1:]
+            for row in PassengerCount.objects.filter(recent, bus_id__in=bus_ids).order_by(
+                "bus_id", "-created_at"
+            ).distinct("bus_id").values_list(
+                "bus_id", "count", "occupancy_rate", "created_at",
+            )
+        }
+
+    columns = {name: [] for name in FLEET_SNAPSHOT_COLUMNS}
+    seen = set()
+    empty_location = (None,) * 7
+    empty_count = (None,) * 3
+
+    for (bus_id, license_plate, capacity, bus_line_id, line_code, trip_id,
+         driver_id, first_name, last_name, start_time, updated_at) in assignments:
+        # A bus tracks one line at a time; keep its latest assignment
+        if bus_id in seen:
+            continue
+        seen.add(bus_id)
+
+        lat, lon, speed, heading, nearest_stop_id, distance, located_at = locations.get(bus_id, empty_location)
+        passengers, occupancy_rate, counted_at = counts.get(bus_id, empty_count)
+
+        if since is not None and not any(
+            changed_at is not None and changed_at > since
+            for changed_at in (updated_at, located_at, counted_at)
+        ):
+            continue
+
+        columns["bus_id"].append(str(bus_id))
+        columns["license_plate"].append(license_plate)
+        columns["capacity"].append(capacity)
+        columns["line_id"].append(str(bus_line_id))
+        columns["line_code"].append(line_code)
+        columns["trip_id"].append(str(trip_id) if trip_id else None)
+        columns["driver_id"].append(str(driver_id) if driver_id else None)
+        columns["driver_name"].append(f"{first_name or ''} {last_name or ''}".strip() or None)
+        columns["tracking_started_at"].append(_as_timestamp(start_time))
+        columns["latitude"].append(_as_float(lat))
+        columns["longitude"].append(_as_float(lon))
+        columns["speed"].append(_as_float(speed))
+        columns["heading"].append(_as_float(heading))
+        columns["nearest_stop_id"].append(str(nearest_stop_id) if nearest_stop_id else None)
+        columns["distance_to_stop"].append(_as_float(distance))
+        columns["location_updated_at"].append(_as_timestamp(located_at))
+        columns["passenger_count"].append(passengers)
+        columns["occupancy_rate"].append(_as_float(occupancy_rate))
+        columns["count_updated_at"].append(_as_timestamp(counted_at))
+
+    removed = []
+    if since is not None:
+        stopped = BusLine.objects.filter(updated_at__gt=since).exclude(
+            is_active=True, tracking_status=BUS_TRACKING_STATUS_ACTIVE
+        )
+        if line_id:
+            stopped = stopped.filter(line_id=line_id)
+        removed = sorted({
+            str(bus_id) for bus_id in stopped.values_list("bus_id", flat=True)
+            if bus_id not in seen
+        })
+
+    return {
+        "count": len(columns["bus_id"]),
+        "columns": columns,
+        "removed": removed,
+    }
+
+
 def get_current_passenger_count(bus_id):
     """
     Get the current passenger count for a bus.
@@ -187,7 +337,7 @@ def get_current_passenger_count(bus_id):
 
 def get_waiting_passengers(stop_id, line_id=None):
     """
-    Get the number of waiting passengers at a stop.
+    Get the estimated number of waiting passengers at a stop.
 
     Args:
         stop_id: ID of the stop
@@ -196,23 +346,16 @@ def get_waiting_passengers(stop_id, line_id=None):
     Returns:
         Number of waiting passengers
     """
-    # Check cache first
-    cached_count = get_cached_stop_waiting(stop_id)
-    if cached_count is not None:
-        return cached_count
+    from .services.crowd_service import StopCrowdService
 
-    # If not in cache, get from database
-    try:
-        queryset = WaitingPassengers.objects.filter(stop_id=stop_id)
-
-        if line_id:
-            queryset = queryset.filter(line_id=line_id)
-
-        latest = queryset.latest("created_at")
-        return latest.count
-    except WaitingPassengers.DoesNotExist:
+    crowd = StopCrowdService.get_stop_crowd(stop_id)
+    if crowd is None:
         return 0
 
+    if line_id:
+        return crowd['lines'].get(str(line_id), {}).get('count', 0)
+    return crowd['count']
+
 
 def estimate_arrival_time(bus_id, stop_id):
     """
@@ -17,13 +17,16 @@ from apps.core.services import BaseService, create_object, update_object
 from apps.core.utils.cache import (
     cache_bus_location,
     cache_bus_passengers,
+    cache_bus_position,
     cache_line_buses,
+    cache_live_state,
     cache_stop_waiting,
 )
 from apps.core.utils.geo import calculate_distance
 from apps.drivers.selectors import get_driver_by_id
 from apps.lines.models import Line, Stop
 from apps.lines.selectors import get_line_by_id, get_stop_by_id
+from apps.lines.topology import get_line_topology
 
 from ..models import (
     Anomaly,
@@ -321,6 +324,10 @@ class LocationUpdateService(BaseService):
             if not longitude:
                 raise ValidationError("Longitude is required.")
 
+            # Work on native floats for the rest of the ping
+            lat = float(latitude)
+            lon = float(longitude)
+
             # Get active trip
             trip = get_active_trip(bus_id)
 
@@ -340,29 +347,16 @@ class LocationUpdateService(BaseService):
             }
 
             # Find nearest stop if line is provided
+            distance_to_stop = None
             if line:
-                from apps.lines.selectors import get_stops_by_line
-                stops = get_stops_by_line(line.id)
-
-                nearest_stop = None
-                min_distance = float("inf")
+                topology = get_line_topology(line.id)
+                nearest_index, min_distance = topology.nearest_index(lat, lon)
 
-                for stop in stops:
-                    distance = calculate_distance(
-                        float(latitude),
-                        float(longitude),
-                        float(stop.latitude),
-                        float(stop.longitude)
-                    )
-
-                    if distance and distance < min_distance:
-                        min_distance = distance
-                        nearest_stop = stop
-
-                if nearest_stop:
-                    location_data["nearest_stop"] = nearest_stop
-                    # Convert to meters
-                    location_data["distance_to_stop"] = Decimal(str(round(min_distance * 1000, 2))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+                if nearest_index is not None:
+                    location_data["nearest_stop_id"] = topology.stop_ids[nearest_index]
+                    # Convert to meters; the column only needs one Decimal
+                    distance_to_stop = round(min_distance * 1000, 2)
+                    location_data["distance_to_stop"] = Decimal(f"{distance_to_stop:.2f}")
 
             # Create location update
             location = create_object(LocationUpdate, location_data)
@@ -371,8 +365,8 @@ class LocationUpdateService(BaseService):
             location_dict = {
                 "id": str(location.id),
                 "bus_id": str(bus.id),
-                "latitude": float(location.latitude),
-                "longitude": float(location.longitude),
+                "latitude": lat,
+                "longitude": lon,
                 "altitude": float(location.altitude) if location.altitude else None,
                 "speed": float(location.speed) if location.speed else None,
                 "heading": float(location.heading) if location.heading else None,
@@ -380,44 +374,14 @@ class LocationUpdateService(BaseService):
                 "timestamp": location.created_at.isoformat(),
                 "line_id": str(line.id) if line else None,
                 "nearest_stop_id": str(location.nearest_stop_id) if location.nearest_stop_id else None,
-                "distance_to_stop": float(location.distance_to_stop) if location.distance_to_stop else None,
+                "distance_to_stop": distance_to_stop,
             }
 
-            cache_bus_location(bus.id, location_dict)
-
-            # Update line buses cache if line exists
-            if line:
-                from ..selectors import get_buses_on_line
-                buses_on_line = get_buses_on_line(line.id)
-                cache_line_buses(line.id, buses_on_line)
-
-            # Broadcast real-time update to WebSocket clients
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    ws_event = {
-                        "type": "bus_location_update",
-                        "bus_id": str(bus.id),
-                        "location": {
-                            "latitude": float(location.latitude),
-                            "longitude": float(location.longitude),
-                            "speed": float(location.speed) if location.speed else None,
-                            "heading": float(location.heading) if location.heading else None,
-                            "nearest_stop_id": str(location.nearest_stop_id) if location.nearest_stop_id else None,
-                            "distance_to_stop": float(location.distance_to_stop) if location.distance_to_stop else None,
-                        },
-                        "timestamp": location.created_at.isoformat(),
-                    }
-                    # Broadcast to general tracking group
-                    async_to_sync(channel_layer.group_send)("tracking_updates", ws_event)
-                    # Broadcast to line-specific group if tracking a line
-                    if line:
-                        async_to_sync(channel_layer.group_send)(f"line_{line.id}", ws_event)
-            except Exception as ws_err:
-                logger.warning(f"WebSocket broadcast failed: {ws_err}")
+            # Publish once committed so the transaction is never held across network I/O
+            transaction.on_commit(
+                lambda: cls._publish_location(location_dict),
+                robust=True,
+            )
 
             logger.info(f"Recorded location update for bus {bus.license_plate}")
             return location
@@ -426,6 +390,63 @@ class LocationUpdateService(BaseService):
             logger.error(f"Error recording location update: {e}")
             raise ValidationError(str(e))
 
+    @classmethod
+    def _publish_location(cls, location_dict):
+        """
+        Cache a recorded location and broadcast it to WebSocket clients.
+
+        Args:
+            location_dict: Cached form of the location update
+        """
+        bus_id = location_dict["bus_id"]
+        line_id = location_dict["line_id"]
+
+        cache_bus_location(bus_id, location_dict)
+        cache_bus_position(bus_id, location_dict["latitude"], location_dict["longitude"])
+        cache_live_state(bus_id, line_id, position={
+            "latitude": location_dict["latitude"],
+            "longitude": location_dict["longitude"],
+            "speed": location_dict["speed"],
+            "heading": location_dict["heading"],
+            "nearest_stop_id": location_dict["nearest_stop_id"],
+            "distance_to_stop": location_dict["distance_to_stop"],
+            "timestamp": location_dict["timestamp"],
+        })
+
+        # Update line buses cache if line exists
+        if line_id:
+            from ..selectors import get_buses_on_line
+            buses_on_line = get_buses_on_line(line_id)
+            cache_line_buses(line_id, buses_on_line)
+
+        # Broadcast real-time update to WebSocket clients
+        try:
+            from channels.layers import get_channel_layer
+            from asgiref.sync import async_to_sync
+
+            channel_layer = get_channel_layer()
+            if channel_layer:
+                ws_event = {
+                    "type": "bus_location_update",
+                    "bus_id": bus_id,
+                    "location": {
+                        "latitude": location_dict["latitude"],
+                        "longitude": location_dict["longitude"],
+                        "speed": location_dict["speed"],
+                        "heading": location_dict["heading"],
+                        "nearest_stop_id": location_dict["nearest_stop_id"],
+                        "distance_to_stop": location_dict["distance_to_stop"],
+                    },
+                    "timestamp": location_dict["timestamp"],
+                }
+                # Broadcast to general tracking group
+                async_to_sync(channel_layer.group_send)("tracking_updates", ws_event)
+                # Broadcast to line-specific group if tracking a line
+                if line_id:
+                    async_to_sync(channel_layer.group_send)(f"line_{line_id}", ws_event)
+        except Exception as ws_err:
+            logger.warning(f"WebSocket broadcast failed: {ws_err}")
+
     @classmethod
     def find_nearest_stop(cls, latitude, longitude, line_id=None, radius_km=0.5):
         """
@@ -441,13 +462,18 @@ class LocationUpdateService(BaseService):
             Nearest Stop object and distance in meters
         """
         try:
-            # Get stops
+            # Stops of a line come from its cached topology
             if line_id:
-                from apps.lines.selectors import get_stops_by_line
-                stops = get_stops_by_line(line_id)
-            else:
-                from apps.lines.selectors import get_active_stops
-                stops = get_active_stops()
+                topology = get_line_topology(line_id)
+                nearest_index, distance = topology.nearest_index(float(latitude), float(longitude))
+                if nearest_index is None or distance > radius_km:
+                    return None, None
+
+                # Convert to meters
+                return get_stop_by_id(topology.stop_ids[nearest_index]), distance * 1000
+
+            from apps.lines.selectors import get_active_stops
+            stops = get_active_stops()
 
             nearest_stop = None
             min_distance = float("inf")
@@ -527,8 +553,20 @@ class PassengerCountService(BaseService):
             # Create passenger count
             passenger_count = create_object(PassengerCount, passenger_data)
 
-            # Update cache
-            cache_bus_passengers(bus.id, count)
+            # Update cache once committed
+            occupancy = {
+                "count": count,
+                "capacity": bus.capacity,
+                "occupancy_rate": float(occupancy_rate),
+                "timestamp": passenger_count.created_at.isoformat(),
+            }
+            line_id = line.id if line else None
+
+            def publish():
+                cache_bus_passengers(bus.id, count)
+                cache_live_state(bus.id, line_id, occupancy=occupancy)
+
+            transaction.on_commit(publish, robust=True)
 
             logger.info(f"Updated passenger count for bus {bus.license_plate}: {count}")
             return passenger_count
@@ -580,8 +618,9 @@ class PassengerCountService(BaseService):
             # Create waiting passengers
             waiting = create_object(WaitingPassengers, waiting_data)
 
-            # Update cache
-            cache_stop_waiting(stop.id, count)
+            # Update cache once committed
+            transaction.on_commit(lambda: cache_stop_waiting(stop.id, count), robust=True)
+            StopCrowdService.record_observation(stop.id, count, line_id=line.id if line else None)
 
             logger.info(f"Updated waiting passengers for stop {stop.name}: {count}")
             return waiting
@@ -729,7 +768,8 @@ class TripService(BaseService):
                         bus_id=trip.bus_id,
                         tracking_status=BUS_TRACKING_STATUS_ACTIVE
                     ).update(
-                        tracking_status=BUS_TRACKING_STATUS_IDLE
+                        tracking_status=BUS_TRACKING_STATUS_IDLE,
+                        updated_at=timezone.now()
                     )
             except Exception:
                 pass
@@ -917,6 +957,7 @@ class AnomalyService(BaseService):
         except Exception as e:
             logger.error(f"Error detecting route deviation: {e}")
             return None
+from .crowd_service import StopCrowdService
 from .waiting_service import (
     ReputationService,
     VirtualCurrencyService,
@@ -930,6 +971,7 @@ __all__ = [
     'LocationUpdateService', 
     'PassengerCountService',
     'ReputationService',
+    'StopCrowdService',
     'TripService',
     'VirtualCurrencyService',
     'WaitingListService',
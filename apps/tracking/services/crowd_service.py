@@ -0,0 +1,316 @@
+"""
+Service for time-decayed crowd estimates at stops.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from apps.core.utils.cache import get_redis_client
+
+from ..models import BusWaitingList, WaitingCountReport, WaitingPassengers
+
+logger = logging.getLogger(__name__)
+
+
+# Decay the stored weight of a stop's line entry to "now", forget it once it
+# has decayed below the minimum weight, then either blend in an observed count
+# or shift the estimate by a delta. Entries of other lines that decayed away
+# are dropped on the way. Fields hold {line_id: [value, weight, timestamp]}.
+UPDATE_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+local line_id = ARGV[2]
+local now = tonumber(ARGV[3])
+local half_life = tonumber(ARGV[4])
+local min_weight = tonumber(ARGV[5])
+local mode = ARGV[6]
+local amount = tonumber(ARGV[7])
+local weight_in = tonumber(ARGV[8])
+
+local lines = {}
+for id, entry in pairs(raw and cjson.decode(raw) or {}) do
+    local decayed = entry[2] * math.pow(0.5, math.max(now - entry[3], 0) / half_life)
+    if decayed >= min_weight then
+        lines[id] = {entry[1], decayed, now}
+    end
+end
+
+local entry = lines[line_id] or {0, 0, now}
+local value, weight = entry[1], entry[2]
+
+if mode == 'observe' then
+    value = (value * weight + amount * weight_in) / (weight + weight_in)
+else
+    value = math.max(value + amount, 0)
+end
+lines[line_id] = {value, weight + weight_in, now}
+
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(lines))
+return 1
+"""
+
+# Delete stop fields that are still exactly as read, i.e. fully decayed and
+# not updated since. ARGV holds field, value pairs.
+PRUNE_SCRIPT = """
+local pruned = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        pruned = pruned + redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return pruned
+"""
+
+
+class StopCrowdService:
+    """
+    Service for confidence-weighted crowd estimates per stop and line.
+
+    Reports and waiting-count updates are blended into a running estimate whose
+    weight halves every ``HALF_LIFE_SECONDS``; waiting-list joins and leaves
+    shift it by one. Estimates that decay below ``MIN_WEIGHT`` are forgotten.
+    All estimates live in a single Redis hash with one field per stop, so every
+    stop, or a given set of stops, can be read in one call. Without Redis the
+    same shape is aggregated from the recent rows in the database.
+    """
+
+    KEY = 'crowd:stop_lines'
+    ANY_LINE = ''
+
+    HALF_LIFE_SECONDS = 15 * 60
+    # Weight at which an estimate is reported with full confidence
+    FULL_CONFIDENCE_WEIGHT = 3.0
+    # Estimates decayed below this weight are treated as unknown
+    MIN_WEIGHT = 0.05
+    # Waiting-list movements are direct evidence but say little about walk-ups
+    WAITING_LIST_WEIGHT = 0.2
+    # Window used by the database fallback
+    FALLBACK_WINDOW_MINUTES = 30
+
+    LEVEL_THRESHOLDS = ((5, 'low'), (15, 'medium'))
+
+    @classmethod
+    def record_observation(
+        cls,
+        stop_id: str,
+        count: int,
+        line_id: Optional[str] = None,
+        weight: float = 1.0
+    ):
+        """
+        Blend an observed waiting count into the estimate once the transaction commits.
+
+        Args:
+            stop_id: ID of the stop
+            count: Number of people observed waiting
+            line_id: Optional line the count applies to
+            weight: Confidence of the observation (0-1)
+        """
+        transaction.on_commit(
+            lambda: cls._update(stop_id, line_id, 'observe', count, max(float(weight), 0.01))
+        )
+
+    @classmethod
+    def record_delta(cls, stop_id: str, delta: int, line_id: Optional[str] = None):
+        """
+        Shift the estimate when someone joins or leaves a waiting list.
+
+        Args:
+            stop_id: ID of the stop
+            delta: +1 for a join, -1 for a leave
+            line_id: Optional line the waiting list applies to
+        """
+        transaction.on_commit(
+            lambda: cls._update(stop_id, line_id, 'adjust', delta, cls.WAITING_LIST_WEIGHT)
+        )
+
+    @classmethod
+    def _update(cls, stop_id, line_id, mode: str, amount, weight: float):
+        client = get_redis_client()
+        if client is None:
+            return
+
+        try:
+            script = client.register_script(UPDATE_SCRIPT)
+            script(
+                keys=[cls.KEY],
+                args=[
+                    str(stop_id),
+                    str(line_id) if line_id else cls.ANY_LINE,
+                    int(time.time()),
+                    cls.HALF_LIFE_SECONDS,
+                    cls.MIN_WEIGHT,
+                    mode,
+                    amount,
+                    weight,
+                ],
+            )
+        except Exception as e:
+            logger.warning(f"Failed to update crowd estimate for stop {stop_id}: {e}")
+
+    @classmethod
+    def get_stop_crowd(cls, stop_id: str) -> Optional[Dict]:
+        """
+        Get the crowd estimate for one stop.
+
+        Returns:
+            Estimate dictionary (see ``get_all``) or None if nothing is known
+        """
+        return cls.get_all([stop_id]).get(str(stop_id))
+
+    @classmethod
+    def get_all(cls, stop_ids: Optional[Iterable] = None) -> Dict[str, Dict]:
+        """
+        Get crowd estimates for all stops in one read.
+
+        Args:
+            stop_ids: Optional stop IDs to restrict the result to
+
+        Returns:
+            Dictionary keyed by stop ID with ``count``, ``confidence``, ``level``
+            and a per-line breakdown under ``lines`` (``''`` = any line)
+        """
+        wanted = {str(stop_id) for stop_id in stop_ids} if stop_ids is not None else None
+        client = get_redis_client()
+
+        if client is not None:
+            try:
+                entries = cls._read_redis(client, wanted)
+                return cls._summarize(entries)
+            except Exception as e:
+                logger.warning(f"Falling back to database crowd estimates: {e}")
+
+        return cls._summarize(cls._read_database(wanted))
+
+    @classmethod
+    def _read_redis(cls, client, wanted) -> Dict:
+        now = time.time()
+        entries = {}
+        decayed = []
+
+        if wanted is None:
+            fields = client.hgetall(cls.KEY).items()
+        else:
+            stop_ids = sorted(wanted)
+            fields = zip(stop_ids, client.hmget(cls.KEY, stop_ids) if stop_ids else [])
+
+        for stop_id, raw in fields:
+            if raw is None:
+                continue
+            stop_id = stop_id.decode() if isinstance(stop_id, bytes) else stop_id
+
+            live = False
+            for line_id, (value, weight, ts) in json.loads(raw).items():
+                weight = weight * 0.5 ** (max(now - ts, 0) / cls.HALF_LIFE_SECONDS)
+                if weight < cls.MIN_WEIGHT:
+                    continue
+
+                live = True
+                entries[(stop_id, line_id)] = (
+                    float(value),
+                    weight,
+                    datetime.fromtimestamp(ts, tz=dt_timezone.utc),
+                )
+
+            if not live:
+                decayed.extend((stop_id, raw))
+
+        if decayed:
+            client.register_script(PRUNE_SCRIPT)(keys=[cls.KEY], args=decayed)
+
+        return entries
+
+    @classmethod
+    def _read_database(cls, wanted) -> Dict:
+        since = timezone.now() - timedelta(minutes=cls.FALLBACK_WINDOW_MINUTES)
+        sums = {}
+
+        def scoped(queryset):
+            return queryset.filter(stop_id__in=wanted) if wanted is not None else queryset
+
+        def add(stop_id, line_id, weighted, weight, updated_at):
+            key = (str(stop_id), str(line_id) if line_id else cls.ANY_LINE)
+            total, total_weight, latest = sums.get(key, (0.0, 0.0, updated_at))
+            sums[key] = (total + weighted, total_weight + weight, max(latest, updated_at))
+
+        reports = scoped(WaitingCountReport.objects.filter(created_at__gte=since)).values(
+            'stop_id', 'line_id'
+        ).annotate(
+            weighted=Sum(Cast(F('reported_count'), FloatField()) * Cast(F('confidence_score'), FloatField())),
+            weight=Sum(Cast(F('confidence_score'), FloatField())),
+            updated_at=Max('created_at'),
+        ).order_by()
+        for row in reports:
+            add(row['stop_id'], row['line_id'], row['weighted'] or 0.0, row['weight'] or 0.0, row['updated_at'])
+
+        counts = scoped(WaitingPassengers.objects.filter(created_at__gte=since)).values(
+            'stop_id', 'line_id'
+        ).annotate(
+            total=Sum('count'),
+            updates=Count('id'),
+            updated_at=Max('created_at'),
+        ).order_by()
+        for row in counts:
+            add(row['stop_id'], row['line_id'], float(row['total']), float(row['updates']), row['updated_at'])
+
+        entries = {
+            key: (total / total_weight if total_weight else 0.0, total_weight, updated_at)
+            for key, (total, total_weight, updated_at) in sums.items()
+        }
+
+        waiting = scoped(BusWaitingList.objects.filter(is_active=True)).values('stop_id').annotate(
+            waiting=Count('id'),
+            updated_at=Max('joined_at'),
+        ).order_by()
+        for row in waiting:
+            key = (str(row['stop_id']), cls.ANY_LINE)
+            value, weight, updated_at = entries.get(key, (0.0, 0.0, row['updated_at']))
+            entries[key] = (
+                value + row['waiting'],
+                weight + row['waiting'] * cls.WAITING_LIST_WEIGHT,
+                max(updated_at, row['updated_at']),
+            )
+
+        return entries
+
+    @classmethod
+    def _summarize(cls, entries: Dict) -> Dict[str, Dict]:
+        stops = {}
+
+        for (stop_id, line_id), (value, weight, updated_at) in entries.items():
+            stop = stops.setdefault(stop_id, {'lines': {}})
+            stop['lines'][line_id] = {
+                'count': int(round(value)),
+                'confidence': cls._confidence(weight),
+                'updated_at': updated_at,
+            }
+
+        for stop in stops.values():
+            lines = stop['lines']
+            # Line-specific counts are subsets of the stop; stop-wide counts are not
+            per_line = sum(entry['count'] for line_id, entry in lines.items() if line_id != cls.ANY_LINE)
+            count = max(per_line, lines.get(cls.ANY_LINE, {}).get('count', 0))
+
+            stop['count'] = count
+            stop['confidence'] = max(entry['confidence'] for entry in lines.values())
+            stop['level'] = cls.get_level(count)
+
+        return stops
+
+    @classmethod
+    def _confidence(cls, weight: float) -> float:
+        return round(min(1.0, weight / cls.FULL_CONFIDENCE_WEIGHT), 2)
+
+    @classmethod
+    def get_level(cls, count: int) -> str:
+        """Map an estimated count onto a crowd level."""
+        for threshold, level in cls.LEVEL_THRESHOLDS:
+            if count <= threshold:
+                return level
+        return 'high'
@@ -10,6 +10,7 @@ from django.db import transaction
 from django.db.models import Avg, Count, Q, Sum
 from django.utils import timezone
 
+from apps.core.constants import USER_TYPE_DRIVER
 from apps.tracking.models import (
     CurrencyTransaction,
     DriverPerformanceScore,
@@ -19,6 +20,7 @@ from apps.tracking.models import (
     VirtualCurrency,
     WaitingCountReport,
 )
+from apps.tracking.services.leaderboard_service import LeaderboardService
 
 logger = logging.getLogger(__name__)
 
@@ -220,17 +222,9 @@ class DriverCurrencyService:
             )
 
             # Add currency using the model method
-            currency.add_currency(amount, description, transaction_type)
+            record = currency.add_currency(amount, description, transaction_type, metadata=metadata)
 
-            # Add metadata if provided
-            if metadata:
-                transaction = CurrencyTransaction.objects.filter(
-                    user=user,
-                    description=description
-                ).first()
-                if transaction:
-                    transaction.metadata = metadata
-                    transaction.save()
+            LeaderboardService.record_earning(record, is_driver=user.user_type == USER_TYPE_DRIVER)
 
             logger.info(f"Added {amount} coins to driver {user.email}")
 
@@ -249,8 +243,9 @@ class DriverCurrencyService:
         try:
             currency = VirtualCurrency.objects.get(user=user)
 
-            if currency.balance >= amount:
-                currency.add_currency(-amount, description, transaction_type)
+            # The balance check happens in the UPDATE itself, so concurrent
+            # purchases cannot overdraw the account
+            if currency.add_currency(-amount, description, transaction_type, allow_negative=False):
                 logger.info(f"Deducted {amount} coins from driver {user.email}")
                 return True
             else:
@@ -0,0 +1,359 @@
+"""
+Service for currency leaderboards backed by Redis sorted sets.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import Q, Sum, Value
+from django.utils import timezone
+
+from apps.core.constants import USER_TYPE_DRIVER
+from apps.core.utils.cache import get_redis_client
+
+from ..models import CurrencyTransaction
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+# Add an earning to a board and, while the board is being rebuilt, log it by
+# transaction so the rebuild can add the earnings its snapshot missed.
+INCREMENT_SCRIPT = """
+redis.call('ZINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if tonumber(ARGV[3]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[4], ARGV[2] .. '|' .. ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[5])
+end
+return 1
+"""
+
+# Add the logged earnings that are not in the rebuild's snapshot to the built
+# board, swap it in and end the rebuild window in one step. ARGV holds the
+# board TTL followed by the snapshot's transactions from the window.
+FINISH_REBUILD_SCRIPT = """
+local building, key, log, window, ready = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local ttl = tonumber(ARGV[1])
+
+local snapshot = {}
+for i = 2, #ARGV do
+    snapshot[ARGV[i]] = true
+end
+
+local logged = redis.call('HGETALL', log)
+for i = 1, #logged, 2 do
+    if not snapshot[logged[i]] then
+        local user_id, amount = string.match(logged[i + 1], '([^|]+)|([^|]+)')
+        redis.call('ZINCRBY', building, amount, user_id)
+    end
+end
+
+if redis.call('EXISTS', building) == 1 then
+    redis.call('RENAME', building, key)
+    if ttl > 0 then
+        redis.call('EXPIRE', key, ttl)
+    else
+        redis.call('PERSIST', key)
+    end
+else
+    redis.call('DEL', key)
+end
+
+redis.call('DEL', log, window)
+if ttl > 0 then
+    redis.call('SET', ready, 1, 'EX', ttl)
+else
+    redis.call('SET', ready, 1)
+end
+return 1
+"""
+
+
+class LeaderboardService:
+    """
+    Service for weekly, monthly and all-time earning leaderboards.
+
+    Earnings are added to one sorted set per board and period as they happen,
+    so top-N and rank lookups are O(log n). A board is only read from Redis
+    once it has been rebuilt from the ledger since the last flush or period
+    change; until then reads are aggregated from ``CurrencyTransaction``, as
+    they are when Redis is not available, and a rebuild is queued.
+    """
+
+    BOARD_CURRENCY = 'currency'
+    BOARD_DRIVER_CURRENCY = 'driver_currency'
+    BOARDS = (BOARD_CURRENCY, BOARD_DRIVER_CURRENCY)
+
+    PERIOD_WEEKLY = 'weekly'
+    PERIOD_MONTHLY = 'monthly'
+    PERIOD_ALL_TIME = 'all_time'
+    PERIODS = (PERIOD_WEEKLY, PERIOD_MONTHLY, PERIOD_ALL_TIME)
+
+    KEY_PREFIX = 'leaderboard'
+
+    # How long a queued rebuild keeps further reads from queueing another
+    REBUILD_LOCK_TTL = 60 * 5
+    # Ledger transactions this much older than a rebuild are assumed to have
+    # committed before it started
+    REBUILD_MARGIN = timedelta(minutes=10)
+
+    # Keep closed periods around long enough to show "last week/month"
+    PERIOD_TTL = {
+        PERIOD_WEEKLY: 60 * 60 * 24 * 15,
+        PERIOD_MONTHLY: 60 * 60 * 24 * 63,
+        PERIOD_ALL_TIME: None,
+    }
+
+    @classmethod
+    def normalize_period(cls, period: str) -> str:
+        """Map request values such as ``all-time`` onto a known period."""
+        period = (period or cls.PERIOD_WEEKLY).replace('-', '_')
+        return period if period in cls.PERIODS else cls.PERIOD_ALL_TIME
+
+    @classmethod
+    def get_period_start(cls, period: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Get the start of the calendar period containing ``now``."""
+        now = timezone.localtime(now or timezone.now())
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if period == cls.PERIOD_WEEKLY:
+            return midnight - timedelta(days=midnight.weekday())
+        if period == cls.PERIOD_MONTHLY:
+            return midnight.replace(day=1)
+        return None
+
+    @classmethod
+    def get_key(cls, board: str, period: str, now: Optional[datetime] = None) -> str:
+        """Get the sorted set key for a board in the current period."""
+        now = timezone.localtime(now or timezone.now())
+
+        if period == cls.PERIOD_WEEKLY:
+            year, week, _ = now.isocalendar()
+            suffix = f"{year}-W{week:02d}"
+        elif period == cls.PERIOD_MONTHLY:
+            suffix = now.strftime('%Y-%m')
+        else:
+            suffix = 'all'
+
+        return f"{cls.KEY_PREFIX}:{board}:{period}:{suffix}"
+
+    @classmethod
+    def record_earning(cls, record: Optional[CurrencyTransaction], is_driver: bool = False):
+        """
+        Add an earning to the leaderboards once the surrounding transaction commits.
+
+        Args:
+            record: Ledger transaction of the earning; spending is ignored
+            is_driver: Whether the user is a driver, whose earnings also count
+                towards the driver board
+        """
+        if record is None or record.amount <= 0:
+            return
+
+        boards = cls.BOARDS if is_driver else (cls.BOARD_CURRENCY,)
+        user_id, amount, transaction_id = str(record.user_id), record.amount, str(record.id)
+        transaction.on_commit(lambda: cls._increment(user_id, amount, transaction_id, boards))
+
+    @classmethod
+    def _increment(cls, user_id: str, amount: int, transaction_id: str, boards):
+        client = get_redis_client()
+        if client is None:
+            return
+
+        try:
+            script = client.register_script(INCREMENT_SCRIPT)
+            pipe = client.pipeline(transaction=False)
+            for board in boards:
+                for period in cls.PERIODS:
+                    key = cls.get_key(board, period)
+                    script(
+                        keys=[key, f"{key}:rebuild_log", f"{key}:rebuilding"],
+                        args=[amount, user_id, cls.PERIOD_TTL[period] or 0, transaction_id, cls.REBUILD_LOCK_TTL],
+                        client=pipe,
+                    )
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to update leaderboards for user {user_id}: {e}")
+
+    @classmethod
+    def _queue_rebuild(cls, client, board: str):
+        """Queue a rebuild of a board unless one was queued recently."""
+        if client.set(f"{cls.KEY_PREFIX}:rebuild:{board}", 1, nx=True, ex=cls.REBUILD_LOCK_TTL):
+            from ..tasks import rebuild_leaderboards
+
+            rebuild_leaderboards.delay(board)
+
+    @classmethod
+    def get_top(cls, board: str, period: str, limit: int = 10) -> List[Dict]:
+        """
+        Get the top entries of a leaderboard.
+
+        Args:
+            board: Board name
+            period: weekly/monthly/all_time
+            limit: Number of entries to return
+
+        Returns:
+            List of ``{'rank', 'user_id', 'score'}`` dictionaries
+        """
+        period = cls.normalize_period(period)
+        client = get_redis_client()
+
+        if client is not None:
+            try:
+                key = cls.get_key(board, period)
+                pipe = client.pipeline(transaction=False)
+                pipe.exists(f"{key}:ready")
+                pipe.zrevrange(key, 0, limit - 1, withscores=True)
+                ready, entries = pipe.execute()
+                if ready:
+                    return [
+                        {'rank': rank, 'user_id': member.decode(), 'score': int(score)}
+                        for rank, (member, score) in enumerate(entries, 1)
+                    ]
+                cls._queue_rebuild(client, board)
+            except Exception as e:
+                logger.warning(f"Falling back to database leaderboard for {board}/{period}: {e}")
+
+        totals = cls._earnings_queryset(board, period).order_by('-total', 'user')[:limit]
+        return [
+            {'rank': rank, 'user_id': str(entry['user']), 'score': entry['total']}
+            for rank, entry in enumerate(totals, 1)
+        ]
+
+    @classmethod
+    def get_rank(cls, board: str, period: str, user_id: str) -> Dict:
+        """
+        Get a user's rank and score on a leaderboard.
+
+        Returns:
+            Dictionary with ``rank`` (None if unranked), ``score`` and ``total_entries``
+        """
+        period = cls.normalize_period(period)
+        user_id = str(user_id)
+        client = get_redis_client()
+
+        if client is not None:
+            try:
+                key = cls.get_key(board, period)
+                pipe = client.pipeline(transaction=False)
+                pipe.exists(f"{key}:ready")
+                pipe.zrevrank(key, user_id)
+                pipe.zscore(key, user_id)
+                pipe.zcard(key)
+                ready, rank, score, total = pipe.execute()
+                if ready:
+                    return {
+                        'rank': rank + 1 if rank is not None else None,
+                        'score': int(score or 0),
+                        'total_entries': total,
+                    }
+                cls._queue_rebuild(client, board)
+            except Exception as e:
+                logger.warning(f"Falling back to database rank for {board}/{period}: {e}")
+
+        totals = cls._earnings_queryset(board, period)
+        score = totals.filter(user=user_id).values_list('total', flat=True).first()
+        if score is None:
+            return {'rank': None, 'score': 0, 'total_entries': totals.count()}
+
+        return {
+            'rank': totals.filter(total__gt=score).count() + 1,
+            'score': score,
+            'total_entries': totals.count(),
+        }
+
+    @classmethod
+    def hydrate(cls, entries: List[Dict]) -> Dict[str, User]:
+        """
+        Load users for leaderboard entries with their currency and reputation in one query.
+        """
+        user_ids = [entry['user_id'] for entry in entries]
+        users = User.objects.filter(id__in=user_ids).select_related(
+            'virtual_currency',
+            'reputation_score',
+        )
+        return {str(user.id): user for user in users}
+
+    @classmethod
+    def rebuild(cls, board: Optional[str] = None) -> int:
+        """
+        Rebuild leaderboard sorted sets from the transaction ledger.
+
+        Each board is built into a separate key and renamed over the live one.
+        Earnings recorded while a board is rebuilt are logged by transaction,
+        and the ones missing from the ledger snapshot are added before the
+        rename, so none are lost or counted twice.
+
+        Args:
+            board: Board to rebuild, or None for all boards
+
+        Returns:
+            Number of members written
+        """
+        client = get_redis_client()
+        if client is None:
+            return 0
+
+        finish = client.register_script(FINISH_REBUILD_SCRIPT)
+        written = 0
+        for board_name in ([board] if board else cls.BOARDS):
+            for period in cls.PERIODS:
+                key = cls.get_key(board_name, period)
+                building_key = f"{key}:building"
+                log_key = f"{key}:rebuild_log"
+                window_key = f"{key}:rebuilding"
+                ttl = cls.PERIOD_TTL[period]
+
+                # Open the window before the snapshot so every earning
+                # committed after it is logged
+                pipe = client.pipeline()
+                pipe.delete(log_key, building_key)
+                pipe.set(window_key, 1, ex=cls.REBUILD_LOCK_TTL)
+                pipe.execute()
+                window_start = timezone.now() - cls.REBUILD_MARGIN
+
+                # Totals and the recent transactions they include come from
+                # one statement, so they share a snapshot
+                totals = {}
+                snapshot_ids = []
+                for entry in cls._earnings_queryset(board_name, period).annotate(
+                    window_ids=ArrayAgg('id', filter=Q(created_at__gte=window_start), default=Value([])),
+                ).iterator():
+                    totals[str(entry['user'])] = entry['total']
+                    snapshot_ids.extend(str(transaction_id) for transaction_id in entry['window_ids'])
+
+                if totals:
+                    pipe = client.pipeline()
+                    pipe.zadd(building_key, totals)
+                    pipe.expire(building_key, cls.REBUILD_LOCK_TTL)
+                    pipe.execute()
+
+                finish(
+                    keys=[building_key, key, log_key, window_key, f"{key}:ready"],
+                    args=[ttl or 0, *snapshot_ids],
+                )
+                written += len(totals)
+
+        logger.info(f"Rebuilt leaderboards with {written} members")
+        return written
+
+    @classmethod
+    def _earnings_queryset(cls, board: str, period: str):
+        transactions = CurrencyTransaction.objects.filter(amount__gt=0)
+
+        start = cls.get_period_start(period)
+        if start:
+            transactions = transactions.filter(created_at__gte=start)
+
+        if board == cls.BOARD_DRIVER_CURRENCY:
+            transactions = transactions.filter(user__user_type=USER_TYPE_DRIVER)
+
+        return transactions.values('user').annotate(total=Sum('amount')).order_by()
@@ -12,6 +12,7 @@ from django.db import transaction
 from apps.core.exceptions import ValidationError
 from apps.tracking.models import LocationUpdate, Trip, RouteSegment
 from apps.lines.models import Stop, LineStop
+from apps.lines.topology import get_line_topology
 from apps.buses.models import Bus
 
 
@@ -284,44 +285,36 @@ class RouteService:
     def _get_remaining_stops(cls, line, current_lat: float, current_lng: float, 
                            destination_stop_id: Optional[str] = None) -> List[Dict]:
         """Get remaining stops on the route."""
+        topology = get_line_topology(line.id)
+        
         # Find closest stop to current position
-        stops = line.stops.through.objects.filter(
-            line=line
-        ).order_by('order').select_related('stop')
+        closest_stop_index, _ = topology.nearest_index(current_lat, current_lng)
+        if closest_stop_index is None:
+            return []
         
-        closest_stop_index = 0
-        min_distance = float('inf')
+        stop_ids = list(topology.stop_ids[closest_stop_index:])
+        if destination_stop_id and destination_stop_id in topology:
+            destination_index = topology.index_of(destination_stop_id)
+            if destination_index >= closest_stop_index:
+                stop_ids = stop_ids[:destination_index - closest_stop_index + 1]
         
-        for i, line_stop in enumerate(stops):
-            stop = line_stop.stop
-            distance = cls._calculate_distance(
-                current_lat, current_lng,
-                float(stop.latitude), float(stop.longitude)
-            )
-            
-            if distance < min_distance:
-                min_distance = distance
-                closest_stop_index = i
+        names = dict(Stop.objects.filter(id__in=stop_ids).values_list('id', 'name'))
         
         # Get remaining stops
         remaining = []
-        for line_stop in stops[closest_stop_index:]:
-            stop = line_stop.stop
-            stop_data = {
-                'id': str(stop.id),
-                'name': stop.name,
+        for stop_id in stop_ids:
+            index = topology.index_of(stop_id)
+            lat, lng = topology.coordinates[index]
+            remaining.append({
+                'id': str(stop_id),
+                'name': names.get(stop_id),
                 'location': {
-                    'lat': float(stop.latitude),
-                    'lng': float(stop.longitude)
+                    'lat': lat,
+                    'lng': lng
                 },
-                'order': line_stop.order,
+                'order': topology.orders[index],
                 'estimated_arrival': None  # Will be calculated
-            }
-            
-            remaining.append(stop_data)
-            
-            if destination_stop_id and str(stop.id) == destination_stop_id:
-                break
+            })
         
         return remaining
     
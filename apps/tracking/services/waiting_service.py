@@ -6,16 +6,19 @@ from decimal import Decimal
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import Avg, Count, Q
+from django.db.models import Count, Q
 from django.utils import timezone
 
+from apps.core.constants import USER_TYPE_DRIVER
 from apps.core.exceptions import ValidationError
 from apps.core.services import BaseService
 from apps.core.utils.geo import calculate_distance
 from apps.accounts.selectors import get_user_by_id
 from apps.buses.selectors import get_bus_by_id
 from apps.lines.selectors import get_stop_by_id
+from apps.lines.topology import get_line_topology
 from apps.notifications.services import NotificationService
 
 from ..models import (
@@ -26,9 +29,14 @@ from ..models import (
     VirtualCurrency,
     WaitingCountReport,
 )
+from ..utils.validation import ReportValidationContext
+from .crowd_service import StopCrowdService
+from .leaderboard_service import LeaderboardService
 
 logger = logging.getLogger(__name__)
 
+User = get_user_model()
+
 
 class WaitingListService(BaseService):
     """
@@ -44,17 +52,15 @@ class WaitingListService(BaseService):
         1. Get the bus's most recent location update.
         2. Find the ordered list of stops remaining on the active line after
            the bus's current nearest stop.
-        3. Sum straight-line distances between consecutive remaining stops.
+        3. Take the route distance between them from the line topology.
         4. Divide by a speed estimate (last known speed or line average).
         Returns None if data is insufficient.
         """
         try:
-            from apps.lines.models import LineStop
-
             latest_loc = (
                 LocationUpdate.objects
                 .filter(bus=bus)
-                .select_related('nearest_stop', 'line')
+                .select_related('line')
                 .order_by('-created_at')
                 .first()
             )
@@ -76,60 +82,32 @@ class WaitingListService(BaseService):
                 line = bl.line
 
             # Ordered stops on this line
-            line_stops = (
-                LineStop.objects
-                .filter(line=line)
-                .select_related('stop')
-                .order_by('order')
-            )
-
-            stop_ids_ordered = [ls.stop_id for ls in line_stops]
-            stop_objs = {ls.stop_id: ls.stop for ls in line_stops}
+            topology = get_line_topology(line.id)
 
-            # Position of bus's nearest stop and target stop
-            bus_stop_id = (
-                latest_loc.nearest_stop_id
-                if latest_loc.nearest_stop_id
-                else None
-            )
-            target_stop_id = stop.id
-
-            if target_stop_id not in stop_ids_ordered:
+            target_idx = topology.index_of(stop.id)
+            if target_idx is None:
                 return None  # stop not on this line
 
-            bus_idx = (
-                stop_ids_ordered.index(bus_stop_id)
-                if bus_stop_id in stop_ids_ordered
-                else 0
-            )
-            target_idx = stop_ids_ordered.index(target_stop_id)
+            # Position of bus's nearest stop
+            bus_idx = topology.index_of(latest_loc.nearest_stop_id) or 0
 
             if target_idx <= bus_idx:
                 # Bus has already passed or is at the target stop
                 return timezone.now() + timedelta(minutes=2)
 
-            # Sum distances from bus current position to target stop
-            remaining = stop_ids_ordered[bus_idx:target_idx + 1]
-            total_distance_km = Decimal('0')
+            # Route distance from bus current position to target stop
+            total_distance_km = (
+                topology.cumulative_distances[target_idx] - topology.cumulative_distances[bus_idx]
+            ) / 1000
 
             # Distance from bus to its nearest stop
             if latest_loc.distance_to_stop:
-                total_distance_km += Decimal(str(latest_loc.distance_to_stop)) / Decimal('1000')
-
-            # Distances between consecutive remaining stops
-            for i in range(len(remaining) - 1):
-                s1 = stop_objs[remaining[i]]
-                s2 = stop_objs[remaining[i + 1]]
-                d = calculate_distance(
-                    float(s1.latitude), float(s1.longitude),
-                    float(s2.latitude), float(s2.longitude),
-                )
-                total_distance_km += Decimal(str(d))
+                total_distance_km += float(latest_loc.distance_to_stop) / 1000
 
             # Speed estimate: last known speed or 20 km/h default
-            speed_kmh = Decimal('20')
+            speed_kmh = 20.0
             if latest_loc.speed and latest_loc.speed > 0:
-                speed_kmh = Decimal(str(latest_loc.speed))
+                speed_kmh = float(latest_loc.speed)
 
             travel_hours = total_distance_km / speed_kmh
             travel_seconds = int(travel_hours * 3600)
@@ -204,6 +182,7 @@ class WaitingListService(BaseService):
                 stop=stop,
                 estimated_arrival=estimated_arrival
             )
+            StopCrowdService.record_delta(stop.id, 1)
             
             # Award coins for joining waiting list
             VirtualCurrencyService.add_currency(
@@ -251,6 +230,7 @@ class WaitingListService(BaseService):
             waiting_list.is_active = False
             waiting_list.left_at = timezone.now()
             waiting_list.save()
+            StopCrowdService.record_delta(waiting_list.stop_id, -1)
             
             logger.info(f"User {user.email} left waiting list (reason: {reason})")
             return waiting_list
@@ -378,14 +358,11 @@ class WaitingReportService(BaseService):
                 if not LineStop.objects.filter(line=line, stop=stop).exists():
                     raise ValidationError(f"Stop '{stop.name}' is not on line '{line.code}'.")
             
-            # Check rate limiting (max 1 report per 10 minutes per stop)
-            recent_reports = WaitingCountReport.objects.filter(
-                reporter=user,
-                stop=stop,
-                created_at__gte=timezone.now() - timedelta(minutes=10)
-            ).count()
+            # Load everything the scoring rules need in one pass
+            context = ReportValidationContext.load(reporter_id, stop_id, bus_id)
             
-            if recent_reports > 0:
+            # Check rate limiting (max 1 report per 10 minutes per stop)
+            if context.reporter_reports_at_stop > 0:
                 raise ValidationError("You can only report once per 10 minutes at the same stop")
             
             # Verify location if coordinates provided
@@ -400,24 +377,25 @@ class WaitingReportService(BaseService):
                 location_verified = distance <= 0.1  # Within 100 meters
             
             # Get or create reporter's reputation
-            reputation, _ = ReputationScore.objects.get_or_create(
-                user=user,
-                defaults={
-                    'total_reports': 0,
-                    'correct_reports': 0,
-                    'reputation_level': 'bronze',
-                    'trust_multiplier': Decimal('1.00')
-                }
-            )
+            reputation = context.reputation
+            if reputation is None:
+                reputation, _ = ReputationScore.objects.get_or_create(
+                    user=user,
+                    defaults={
+                        'total_reports': 0,
+                        'correct_reports': 0,
+                        'reputation_level': 'bronze',
+                        'trust_multiplier': Decimal('1.00')
+                    }
+                )
             
             # Calculate confidence score
             confidence_score = cls._calculate_confidence_score(
                 confidence_level=confidence_level,
                 trust_multiplier=float(reputation.trust_multiplier),
                 location_verified=location_verified,
-                stop_id=stop_id,
                 reported_count=reported_count,
-                reporter_id=reporter_id
+                context=context
             )
             
             # Create report
@@ -433,22 +411,22 @@ class WaitingReportService(BaseService):
                 reporter_latitude=reporter_latitude,
                 reporter_longitude=reporter_longitude
             )
+            StopCrowdService.record_observation(
+                stop.id, reported_count, line_id=line_id, weight=confidence_score
+            )
             
             # Update reputation stats
             reputation.total_reports += 1
-            reputation.save()
+            reputation.save(update_fields=['total_reports', 'updated_at'])
             
             # Award base coins for reporting with diminishing returns for multiple reporters
             base_reward = 50
             multiplier = float(reputation.trust_multiplier)
             proximity_bonus = 20 if location_verified else 0
-            early_adopter_bonus = cls._calculate_early_adopter_bonus(stop_id, bus_id)
+            early_adopter_bonus = cls._calculate_early_adopter_bonus(context)
 
             # Diminishing returns for multiple reporters at same stop in last 10 minutes
-            reporter_count = WaitingCountReport.objects.filter(
-                stop_id=stop_id,
-                created_at__gte=timezone.now() - timedelta(minutes=10)
-            ).exclude(reporter=user).count()
+            reporter_count = context.other_reporters_at_stop
 
             diminishing_factors = [1.0, 0.7, 0.4, 0.2]
             diminishing_factor = diminishing_factors[min(reporter_count, len(diminishing_factors) - 1)]
@@ -529,9 +507,8 @@ class WaitingReportService(BaseService):
         confidence_level: str,
         trust_multiplier: float,
         location_verified: bool,
-        stop_id: str,
         reported_count: int,
-        reporter_id: str = None
+        context: ReportValidationContext
     ) -> float:
         """Calculate confidence score for a report."""
         # Base score from confidence level
@@ -545,34 +522,21 @@ class WaitingReportService(BaseService):
         if location_verified:
             score *= 1.2
         
-        # Cross-validation with recent reports
-        recent_reports = WaitingCountReport.objects.filter(
-            stop_id=stop_id,
-            created_at__gte=timezone.now() - timedelta(minutes=30)
-        ).exclude(reporter_id=reporter_id)  # Exclude same reporter
-        
-        if recent_reports.exists():
-            avg_count = recent_reports.aggregate(avg=Avg('reported_count'))['avg']
-            if avg_count:
-                # Boost score if count is close to recent average
-                difference_ratio = abs(reported_count - avg_count) / max(avg_count, 1)
-                if difference_ratio < 0.3:  # Within 30%
-                    score *= 1.1
+        # Cross-validation with other reporters in the last 30 minutes
+        avg_count = context.other_reports_recent_average
+        if avg_count:
+            # Boost score if count is close to recent average
+            difference_ratio = abs(reported_count - avg_count) / max(avg_count, 1)
+            if difference_ratio < 0.3:  # Within 30%
+                score *= 1.1
         
         return min(1.0, score)  # Cap at 1.0
     
     @classmethod
-    def _calculate_early_adopter_bonus(cls, stop_id: str, bus_id: Optional[str]) -> int:
+    def _calculate_early_adopter_bonus(cls, context: ReportValidationContext) -> int:
         """Calculate early adopter bonus for first report at a stop."""
-        # Check if this is the first report in the last hour
-        one_hour_ago = timezone.now() - timedelta(hours=1)
-        recent_count = WaitingCountReport.objects.filter(
-            stop_id=stop_id,
-            bus_id=bus_id,
-            created_at__gte=one_hour_ago
-        ).count()
-        
-        return 20 if recent_count == 0 else 0
+        # Reports for this stop and bus in the hour before this one
+        return 20 if context.bus_reports_last_hour == 0 else 0
     
     @classmethod
     def _process_verification_rewards(cls, report: WaitingCountReport, verification_status: str):
@@ -590,17 +554,19 @@ class WaitingReportService(BaseService):
             }
         )
         
+        awards = []
+        
         if verification_status == 'correct':
             reputation.correct_reports += 1
             
             # Driver verification bonus
-            VirtualCurrencyService.add_currency(
-                user_id=str(reporter.id),
-                amount=100,
-                transaction_type='driver_verification',
-                description='Driver confirmed your report was accurate!',
-                related_report=report
-            )
+            awards.append({
+                'user_id': str(reporter.id),
+                'amount': 100,
+                'transaction_type': 'driver_verification',
+                'description': 'Driver confirmed your report was accurate!',
+                'related_report': report
+            })
             
         elif verification_status == 'incorrect':
             # Penalty for false report
@@ -609,44 +575,46 @@ class WaitingReportService(BaseService):
             if severity_factor > 1.0:  # Off by more than 100%
                 penalty_amount = -200
             
-            VirtualCurrencyService.add_currency(
-                user_id=str(reporter.id),
-                amount=penalty_amount,
-                transaction_type='false_report',
-                description=f'Report was inaccurate (reported {report.reported_count}, actual {report.actual_count})',
-                related_report=report
-            )
+            awards.append({
+                'user_id': str(reporter.id),
+                'amount': penalty_amount,
+                'transaction_type': 'false_report',
+                'description': f'Report was inaccurate (reported {report.reported_count}, actual {report.actual_count})',
+                'related_report': report
+            })
             
         elif verification_status == 'partially_correct':
             reputation.correct_reports += Decimal('0.5')  # Partial credit
             
             # Smaller bonus for partially correct
-            VirtualCurrencyService.add_currency(
-                user_id=str(reporter.id),
-                amount=25,
-                transaction_type='driver_verification',
-                description='Report was partially accurate',
-                related_report=report
-            )
+            awards.append({
+                'user_id': str(reporter.id),
+                'amount': 25,
+                'transaction_type': 'driver_verification',
+                'description': 'Report was partially accurate',
+                'related_report': report
+            })
         
         # Update reputation level
         reputation.update_reputation()
         
         # Check for consistency bonus (5 consecutive accurate reports)
         if verification_status in ['correct', 'partially_correct']:
-            recent_reports = WaitingCountReport.objects.filter(
+            recent_statuses = list(WaitingCountReport.objects.filter(
                 reporter=reporter,
                 is_verified=True,
                 verification_status__in=['correct', 'partially_correct']
-            ).order_by('-created_at')[:5]
-            
-            if recent_reports.count() == 5 and all(r.verification_status in ['correct', 'partially_correct'] for r in recent_reports):
-                VirtualCurrencyService.add_currency(
-                    user_id=str(reporter.id),
-                    amount=25,
-                    transaction_type='consistency_bonus',
-                    description='5 consecutive accurate reports!'
-                )
+            ).order_by('-created_at').values_list('verification_status', flat=True)[:5])
+            
+            if len(recent_statuses) == 5:
+                awards.append({
+                    'user_id': str(reporter.id),
+                    'amount': 25,
+                    'transaction_type': 'consistency_bonus',
+                    'description': '5 consecutive accurate reports!'
+                })
+        
+        VirtualCurrencyService.award_batch(awards)
 
 
 class VirtualCurrencyService(BaseService):
@@ -711,41 +679,141 @@ class VirtualCurrencyService(BaseService):
             CurrencyTransaction instance
         """
         try:
-            user = get_user_by_id(user_id)
-            currency = cls.get_or_create_currency(user_id)
-            
-            # Update balance
-            currency.add_currency(amount, description, transaction_type)
-            
-            # Create transaction record (done by currency.add_currency)
-            transaction_record = CurrencyTransaction.objects.filter(
-                user=user
-            ).order_by('-created_at').first()
-            
-            if related_report:
-                transaction_record.related_report = related_report
-                transaction_record.save()
-            
-            # Send notification for significant transactions
-            if abs(amount) >= 50:
-                sign = "+" if amount >= 0 else ""
-                NotificationService.create_notification(
-                    user_id=user_id,
-                    notification_type='reward',
-                    title=f'{sign}{amount} coins earned!' if amount > 0 else f'{amount} coins deducted',
-                    message=description,
-                    data={
-                        'amount': amount,
-                        'new_balance': currency.balance,
-                        'transaction_type': transaction_type
-                    }
-                )
+            currency = VirtualCurrency.objects.select_related('user').filter(
+                user_id=user_id
+            ).first() or cls.get_or_create_currency(user_id)
+            user = currency.user
+            
+            # Apply the balance delta and append the transaction in one step
+            transaction_record = currency.add_currency(
+                amount,
+                description,
+                transaction_type,
+                related_report=related_report
+            )
+            
+            LeaderboardService.record_earning(
+                transaction_record, is_driver=user.user_type == USER_TYPE_DRIVER
+            )
+            cls._notify_balance_change(
+                user_id, amount, description, transaction_type, currency.balance
+            )
 
-            # Broadcast balance change via WebSocket to user's notification group
+            logger.info(f"Added {amount} coins to {user.email} - {description}")
+            return transaction_record
+            
+        except Exception as e:
+            logger.error(f"Error adding currency: {e}")
+            raise ValidationError(str(e))
+    
+    @classmethod
+    @transaction.atomic
+    def award_batch(cls, awards: List[Dict]) -> List[CurrencyTransaction]:
+        """
+        Apply many currency awards with one balance UPDATE and one INSERT.
+        
+        Args:
+            awards: List of dicts with user_id, amount, transaction_type,
+                description and optional related_report
+            
+        Returns:
+            Created CurrencyTransaction instances, in the order of ``awards``
+        """
+        awards = [award for award in awards if award['amount']]
+        if not awards:
+            return []
+        
+        user_ids = {str(award['user_id']) for award in awards}
+        
+        # Lock accounts in a stable order so concurrent batches cannot deadlock
+        existing = {
+            str(user_id) for user_id in VirtualCurrency.objects.select_for_update().filter(
+                user_id__in=user_ids
+            ).order_by('user_id').values_list('user_id', flat=True)
+        }
+        for user_id in user_ids - existing:
+            cls.get_or_create_currency(user_id)
+        
+        # Net the balance but keep earnings and spending apart for the lifetime totals
+        deltas = {}
+        for award in awards:
+            user_id = str(award['user_id'])
+            delta, earned, spent = deltas.get(user_id, (0, 0, 0))
+            amount = award['amount']
+            deltas[user_id] = (delta + amount, earned + max(amount, 0), spent + max(-amount, 0))
+        
+        totals = VirtualCurrency.apply_deltas(deltas)
+        
+        # Walk each user's awards backwards from the final balance
+        running = {user_id: values[0] for user_id, values in totals.items()}
+        balances_after = [None] * len(awards)
+        for index in range(len(awards) - 1, -1, -1):
+            user_id = str(awards[index]['user_id'])
+            balances_after[index] = running[user_id]
+            running[user_id] -= awards[index]['amount']
+        
+        records = CurrencyTransaction.objects.bulk_create([
+            CurrencyTransaction(
+                user_id=award['user_id'],
+                amount=award['amount'],
+                transaction_type=award['transaction_type'],
+                description=award['description'],
+                balance_after=balance_after,
+                related_report=award.get('related_report'),
+            )
+            for award, balance_after in zip(awards, balances_after)
+        ])
+        
+        driver_ids = {
+            str(user_id) for user_id in User.objects.filter(
+                id__in=user_ids, user_type=USER_TYPE_DRIVER
+            ).values_list('id', flat=True)
+        }
+        for award, record in zip(awards, records):
+            LeaderboardService.record_earning(record, is_driver=str(award['user_id']) in driver_ids)
+            cls._notify_balance_change(
+                str(award['user_id']),
+                award['amount'],
+                award['description'],
+                award['transaction_type'],
+                record.balance_after
+            )
+        
+        logger.info(f"Applied {len(records)} currency awards for {len(deltas)} users")
+        return records
+    
+    @classmethod
+    def _notify_balance_change(
+        cls,
+        user_id: str,
+        amount: int,
+        description: str,
+        transaction_type: str,
+        new_balance: int
+    ):
+        """Notify the user about a balance change in-app and over WebSocket."""
+        # Send notification for significant transactions
+        if abs(amount) >= 50:
+            sign = "+" if amount >= 0 else ""
+            NotificationService.create_notification(
+                user_id=user_id,
+                notification_type='reward',
+                title=f'{sign}{amount} coins earned!' if amount > 0 else f'{amount} coins deducted',
+                message=description,
+                data={
+                    'amount': amount,
+                    'new_balance': new_balance,
+                    'transaction_type': transaction_type
+                }
+            )
+
+        # Broadcast balance change via WebSocket to user's notification group, once committed
+        timestamp = timezone.now().isoformat()
+
+        def broadcast():
             try:
                 from channels.layers import get_channel_layer
                 from asgiref.sync import async_to_sync
-                from django.utils import timezone as tz
 
                 channel_layer = get_channel_layer()
                 if channel_layer:
@@ -754,20 +822,15 @@ class VirtualCurrencyService(BaseService):
                         {
                             "type": "gamification_update",
                             "delta": amount,
-                            "new_balance": int(currency.balance),
+                            "new_balance": int(new_balance),
                             "reason": description,
-                            "timestamp": tz.now().isoformat(),
+                            "timestamp": timestamp,
                         }
                     )
             except Exception as ws_err:
                 logger.warning(f"WebSocket gamification broadcast failed: {ws_err}")
 
-            logger.info(f"Added {amount} coins to {user.email} - {description}")
-            return transaction_record
-            
-        except Exception as e:
-            logger.error(f"Error adding currency: {e}")
-            raise ValidationError(str(e))
+        transaction.on_commit(broadcast, robust=True)
     
     @classmethod
     def get_leaderboard(cls, period: str = 'weekly', limit: int = 10) -> List[Dict]:
@@ -782,40 +845,27 @@ class VirtualCurrencyService(BaseService):
             List of leaderboard entries
         """
         try:
-            now = timezone.now()
-            
-            if period == 'weekly':
-                start_date = now - timedelta(days=7)
-            elif period == 'monthly':
-                start_date = now - timedelta(days=30)
-            else:  # all_time
-                start_date = None
-            
-            # Get transactions for period
-            transactions = CurrencyTransaction.objects.filter(
-                amount__gt=0  # Only earning transactions
+            entries = LeaderboardService.get_top(
+                LeaderboardService.BOARD_CURRENCY, period, limit
             )
-            
-            if start_date:
-                transactions = transactions.filter(created_at__gte=start_date)
-            
-            # Aggregate by user
-            user_earnings = transactions.values('user').annotate(
-                total_earned=Count('amount')
-            ).order_by('-total_earned')[:limit]
+            users = LeaderboardService.hydrate(entries)
             
             leaderboard = []
-            for i, entry in enumerate(user_earnings):
-                user = get_user_by_id(str(entry['user']))
-                currency = cls.get_or_create_currency(str(user.id))
+            for entry in entries:
+                user = users.get(entry['user_id'])
+                if user is None:
+                    continue
+                
+                currency = getattr(user, 'virtual_currency', None)
+                reputation = getattr(user, 'reputation_score', None)
                 
                 leaderboard.append({
-                    'rank': i + 1,
-                    'user_id': str(user.id),
+                    'rank': entry['rank'],
+                    'user_id': entry['user_id'],
                     'user_name': user.get_full_name() or user.email,
-                    'total_earned': entry['total_earned'],
-                    'current_balance': currency.balance,
-                    'reputation_level': getattr(user.reputation_score, 'reputation_level', 'bronze')
+                    'total_earned': entry['score'],
+                    'current_balance': currency.balance if currency else 0,
+                    'reputation_level': getattr(reputation, 'reputation_level', 'bronze')
                 })
             
             return leaderboard
@@ -823,6 +873,28 @@ class VirtualCurrencyService(BaseService):
         except Exception as e:
             logger.error(f"Error getting leaderboard: {e}")
             return []
+    
+    @classmethod
+    def get_user_rank(cls, user_id: str, period: str = 'weekly') -> Dict:
+        """
+        Get a user's position on the virtual currency leaderboard.
+        
+        Args:
+            user_id: ID of the user
+            period: weekly/monthly/all_time
+            
+        Returns:
+            Dictionary with rank, total earned and number of ranked users
+        """
+        rank = LeaderboardService.get_rank(
+            LeaderboardService.BOARD_CURRENCY, period, user_id
+        )
+        return {
+            'user_id': str(user_id),
+            'rank': rank['rank'],
+            'total_earned': rank['score'],
+            'total_entries': rank['total_entries']
+        }
 
 
 class ReputationService(BaseService):
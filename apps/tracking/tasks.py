@@ -8,6 +8,7 @@ from celery import shared_task
 from django.db.models import F
 from django.utils import timezone
 
+from apps.core.utils.cache import cache_live_state
 from apps.core.utils.geo import calculate_distance
 
 from .models import (
@@ -112,18 +113,19 @@ def calculate_eta_for_stops():
                 continue
 
             # Get stops for the line
-            from apps.lines.selectors import get_stops_by_line
-            stops = get_stops_by_line(bus_line.line_id)
+            from apps.lines.topology import get_line_topology
+            topology = get_line_topology(bus_line.line_id)
 
             # Calculate ETA for each stop
-            for stop in stops:
+            etas = {}
+            for stop_id, (stop_lat, stop_lon) in zip(topology.stop_ids, topology.coordinates):
                 from apps.core.utils.geo import calculate_eta
 
                 eta = calculate_eta(
                     float(location.latitude),
                     float(location.longitude),
-                    float(stop.latitude),
-                    float(stop.longitude),
+                    stop_lat,
+                    stop_lon,
                     float(location.speed) if location.speed else None
                 )
 
@@ -131,8 +133,11 @@ def calculate_eta_for_stops():
                     # Store ETA in cache
                     from django.core.cache import cache
 
-                    cache_key = f"eta:{bus_line.bus_id}:{stop.id}"
+                    cache_key = f"eta:{bus_line.bus_id}:{stop_id}"
                     cache.set(cache_key, eta.isoformat(), 300)  # 5 minutes
+                    etas[str(stop_id)] = eta.isoformat()
+
+            cache_live_state(bus_line.bus_id, bus_line.line_id, etas=etas)
 
         logger.info("Calculated ETA for stops")
         return True
@@ -368,3 +373,49 @@ def notify_waiting_passengers_on_arrival():
     except Exception as e:
         logger.error(f"Error in notify_waiting_passengers_on_arrival: {e}")
         return 0
+
+
+@shared_task
+def rebuild_leaderboards(board=None):
+    """
+    Rebuild the currency leaderboard sorted sets from the transaction ledger.
+    This task runs nightly and is queued by leaderboard reads whenever a board
+    is missing, e.g. after a Redis flush or at the start of a new period.
+    """
+    try:
+        from .services.leaderboard_service import LeaderboardService
+
+        written = LeaderboardService.rebuild(board)
+        logger.info(f"Rebuilt leaderboards: {written} members")
+        return written
+
+    except Exception as e:
+        logger.error(f"Error rebuilding leaderboards: {e}")
+        return 0
+
+
+@shared_task
+def rollup_daily_stats(days=2):
+    """
+    Rebuild the daily tracking analytics rollups of the last closed days.
+    This task should run nightly; pass a larger ``days`` value to backfill.
+    The default also rebuilds the day before yesterday, which picks up trips
+    that were completed after midnight.
+
+    Args:
+        days: Number of closed days to rebuild
+    """
+    try:
+        from .rollups import build_daily_rollups, get_rollup_watermark
+
+        start_date = timezone.localdate() - timedelta(days=days)
+        # Catch up on the days missed while the task was not running
+        watermark = get_rollup_watermark()
+        if watermark is not None:
+            start_date = min(start_date, watermark)
+        rows = build_daily_rollups(start_date)
+        return {'status': 'success', 'days': days, 'rows': rows}
+
+    except Exception as e:
+        logger.error(f"Error rolling up tracking stats: {e}")
+        return {'status': 'error', 'message': str(e)}
@@ -0,0 +1,123 @@
+"""
+Tests for the virtual currency ledger write path.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.tracking.models import CurrencyTransaction, VirtualCurrency
+from apps.tracking.services.waiting_service import VirtualCurrencyService
+
+User = get_user_model()
+
+
+class CurrencyLedgerTests(TestCase):
+    """Test suite for atomic balance updates and batch awards."""
+
+    def setUp(self):
+        """Set up users with existing currency accounts."""
+        self.user = User.objects.create_user(
+            email='ledger@test.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            email='ledger2@test.com',
+            password='testpass123'
+        )
+        self.currency = VirtualCurrency.objects.create(user=self.user, balance=100)
+        VirtualCurrency.objects.create(user=self.other_user, balance=0)
+
+    def test_add_currency_returns_created_transaction(self):
+        """Test that the service returns the row it created."""
+        record = VirtualCurrencyService.add_currency(
+            user_id=str(self.user.id),
+            amount=30,
+            transaction_type='accurate_report',
+            description='Accurate report'
+        )
+
+        self.assertEqual(record.amount, 30)
+        self.assertEqual(record.balance_after, 130)
+        self.assertEqual(CurrencyTransaction.objects.filter(user=self.user).count(), 1)
+
+    def test_stale_instances_do_not_overwrite_balance(self):
+        """Test that deltas apply to the stored balance, not the in-memory one."""
+        stale = VirtualCurrency.objects.get(pk=self.currency.pk)
+
+        self.currency.add_currency(20, 'First', 'accurate_report')
+        stale.add_currency(5, 'Second', 'accurate_report')
+
+        self.currency.refresh_from_db()
+        self.assertEqual(self.currency.balance, 125)
+        self.assertEqual(stale.balance, 125)
+
+    def test_spending_without_funds_is_rejected(self):
+        """Test that allow_negative=False refuses to overdraw."""
+        result = self.currency.add_currency(
+            -500, 'Too expensive', 'premium_purchase', allow_negative=False
+        )
+
+        self.assertIsNone(result)
+        self.currency.refresh_from_db()
+        self.assertEqual(self.currency.balance, 100)
+
+    def test_zero_movement_is_recorded(self):
+        """Test that a zero amount writes a ledger row instead of being rejected."""
+        result = self.currency.add_currency(0, 'Free item', 'premium_purchase', allow_negative=False)
+
+        self.assertIsNotNone(result)
+        self.assertEqual((result.amount, result.balance_after), (0, 100))
+        self.assertEqual(CurrencyTransaction.objects.filter(user=self.user).count(), 1)
+
+    def test_award_batch(self):
+        """Test applying awards for several users at once."""
+        records = VirtualCurrencyService.award_batch([
+            {
+                'user_id': self.user.id,
+                'amount': 10,
+                'transaction_type': 'accurate_report',
+                'description': 'First'
+            },
+            {
+                'user_id': self.other_user.id,
+                'amount': 25,
+                'transaction_type': 'consistency_bonus',
+                'description': 'Bonus'
+            },
+            {
+                'user_id': self.user.id,
+                'amount': -5,
+                'transaction_type': 'penalty',
+                'description': 'Penalty'
+            },
+        ])
+
+        self.assertEqual([r.balance_after for r in records], [110, 25, 105])
+
+        self.currency.refresh_from_db()
+        self.assertEqual(self.currency.balance, 105)
+        self.assertEqual(self.currency.lifetime_earned, 10)
+        self.assertEqual(self.currency.lifetime_spent, 5)
+
+    def test_award_batch_zero_net(self):
+        """Test that awards netting to zero still update lifetime totals."""
+        records = VirtualCurrencyService.award_batch([
+            {
+                'user_id': self.user.id,
+                'amount': 10,
+                'transaction_type': 'accurate_report',
+                'description': 'Earned'
+            },
+            {
+                'user_id': self.user.id,
+                'amount': -10,
+                'transaction_type': 'penalty',
+                'description': 'Penalty'
+            },
+        ])
+
+        self.assertEqual([r.balance_after for r in records], [110, 100])
+
+        self.currency.refresh_from_db()
+        self.assertEqual(self.currency.balance, 100)
+        self.assertEqual(self.currency.lifetime_earned, 10)
+        self.assertEqual(self.currency.lifetime_spent, 10)
@@ -0,0 +1,152 @@
+"""
+Tests for the currency leaderboards.
+"""
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.tracking.models import CurrencyTransaction
+from apps.tracking.services.leaderboard_service import LeaderboardService
+from apps.tracking.services.waiting_service import VirtualCurrencyService
+
+User = get_user_model()
+
+
+class LeaderboardServiceTests(TestCase):
+    """Test suite for LeaderboardService without Redis."""
+
+    def setUp(self):
+        """Set up users with different earnings."""
+        self.big_earner = User.objects.create_user(
+            email='big@test.com',
+            password='testpass123'
+        )
+        self.frequent_earner = User.objects.create_user(
+            email='frequent@test.com',
+            password='testpass123'
+        )
+
+        self._earn(self.big_earner, [500])
+        self._earn(self.frequent_earner, [10, 10, 10])
+
+    def _earn(self, user, amounts):
+        for amount in amounts:
+            CurrencyTransaction.objects.create(
+                user=user,
+                amount=amount,
+                transaction_type='accurate_report',
+                description='Test earning',
+                balance_after=amount
+            )
+
+    def test_top_ranks_by_amount_not_transaction_count(self):
+        """Test that leaderboards sum earnings instead of counting transactions."""
+        top = LeaderboardService.get_top(LeaderboardService.BOARD_CURRENCY, 'weekly', 10)
+
+        self.assertEqual(top[0]['user_id'], str(self.big_earner.id))
+        self.assertEqual(top[0]['score'], 500)
+        self.assertEqual(top[1]['score'], 30)
+
+    def test_get_rank(self):
+        """Test looking up a single user's rank."""
+        rank = LeaderboardService.get_rank(
+            LeaderboardService.BOARD_CURRENCY, 'all-time', self.frequent_earner.id
+        )
+
+        self.assertEqual(rank, {'rank': 2, 'score': 30, 'total_entries': 2})
+
+    def test_get_leaderboard_hydrates_in_batch(self):
+        """Test that leaderboard rows are hydrated without per-row queries."""
+        with self.assertNumQueries(2):
+            leaderboard = VirtualCurrencyService.get_leaderboard(period='monthly', limit=10)
+
+        self.assertEqual(len(leaderboard), 2)
+        self.assertEqual(leaderboard[0]['total_earned'], 500)
+        self.assertEqual(leaderboard[0]['current_balance'], 0)
+
+    def test_driver_board_only_includes_drivers(self):
+        """Test that the driver board filters by user type."""
+        driver = User.objects.create_user(
+            email='driver@test.com',
+            password='testpass123',
+            user_type='driver'
+        )
+        self._earn(driver, [40])
+
+        top = LeaderboardService.get_top(LeaderboardService.BOARD_DRIVER_CURRENCY, 'weekly', 10)
+
+        self.assertEqual([entry['user_id'] for entry in top], [str(driver.id)])
+
+    @patch('apps.tracking.services.leaderboard_service.get_redis_client')
+    def test_record_earning_updates_every_period(self, mock_get_client):
+        """Test that an earning is added to each period's sorted set."""
+        client = MagicMock()
+        mock_get_client.return_value = client
+        record = CurrencyTransaction.objects.filter(user=self.big_earner).get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LeaderboardService.record_earning(record)
+
+        script = client.register_script.return_value
+        self.assertEqual(script.call_count, len(LeaderboardService.PERIODS))
+        self.assertEqual(script.call_args.kwargs['args'][:2], [500, str(self.big_earner.id)])
+        self.assertEqual(script.call_args.kwargs['args'][3], str(record.id))
+        client.pipeline.return_value.execute.assert_called_once()
+
+    @patch('apps.tracking.services.leaderboard_service.get_redis_client')
+    def test_driver_earnings_reach_driver_board(self, mock_get_client):
+        """Test that any earning of a driver counts towards the driver board, as in a rebuild."""
+        client = MagicMock()
+        mock_get_client.return_value = client
+        driver = User.objects.create_user(
+            email='earning-driver@test.com',
+            password='testpass123',
+            user_type='driver'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VirtualCurrencyService.add_currency(str(driver.id), 20, 'accurate_report', 'Accurate report')
+
+        keys = [call.kwargs['keys'][0] for call in client.register_script.return_value.call_args_list]
+        self.assertIn(
+            LeaderboardService.get_key(LeaderboardService.BOARD_DRIVER_CURRENCY, 'all_time'), keys
+        )
+
+    @patch('apps.tracking.tasks.rebuild_leaderboards.delay')
+    @patch('apps.tracking.services.leaderboard_service.get_redis_client')
+    def test_missing_board_falls_back_and_queues_rebuild(self, mock_get_client, mock_delay):
+        """Test that a board that was never rebuilt is read from the ledger."""
+        client = MagicMock()
+        client.pipeline.return_value.execute.return_value = [0, [(b'partial', 25.0)]]
+        mock_get_client.return_value = client
+
+        top = LeaderboardService.get_top(LeaderboardService.BOARD_CURRENCY, 'weekly', 10)
+
+        self.assertEqual([entry['score'] for entry in top], [500, 30])
+        mock_delay.assert_called_once_with(LeaderboardService.BOARD_CURRENCY)
+
+    @patch('apps.tracking.services.leaderboard_service.get_redis_client')
+    def test_rebuild_reconciles_window(self, mock_get_client):
+        """Test that a rebuild opens its logging window before reading the ledger."""
+        client = MagicMock()
+        mock_get_client.return_value = client
+
+        written = LeaderboardService.rebuild(LeaderboardService.BOARD_CURRENCY)
+
+        key = LeaderboardService.get_key(LeaderboardService.BOARD_CURRENCY, 'all_time')
+        pipe = client.pipeline.return_value
+        self.assertEqual(written, 2 * len(LeaderboardService.PERIODS))
+        pipe.set.assert_any_call(f"{key}:rebuilding", 1, ex=LeaderboardService.REBUILD_LOCK_TTL)
+        pipe.zadd.assert_any_call(f"{key}:building", {
+            str(self.big_earner.id): 500,
+            str(self.frequent_earner.id): 30,
+        })
+
+        # Recent ledger rows are passed on so logged duplicates are skipped
+        finish = client.register_script.return_value.call_args
+        self.assertEqual(finish.kwargs['keys'][:2], [f"{key}:building", key])
+        self.assertEqual(
+            sorted(finish.kwargs['args'][1:]),
+            sorted(str(pk) for pk in CurrencyTransaction.objects.values_list('id', flat=True))
+        )
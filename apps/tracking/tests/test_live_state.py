@@ -0,0 +1,62 @@
+"""
+Tests for WebSocket subscription snapshots.
+"""
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from apps.core.constants import CACHE_KEY_BUS_LOCATION, CACHE_KEY_BUS_PASSENGERS, CACHE_KEY_LINE_BUSES
+from apps.tracking.consumers import TrackingConsumer
+from apps.tracking.live_state import aget_group_snapshot
+
+from .test_ws_sessions import IN_MEMORY_CHANNEL_LAYERS, LOCMEM_CACHES, bus_location
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class SubscriptionSnapshotTest(SimpleTestCase):
+    """Test the live state sent when joining a bus or line group."""
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        cache.set(CACHE_KEY_LINE_BUSES.format(line_id='line-1'), [{'bus_id': 'bus-1'}, {'bus_id': 'bus-2'}])
+        cache.set(CACHE_KEY_BUS_LOCATION.format(bus_id='bus-1'), bus_location('bus-1', now))
+        cache.set(CACHE_KEY_BUS_LOCATION.format(bus_id='bus-2'), bus_location('bus-2', now - timedelta(hours=1)))
+        cache.set(CACHE_KEY_BUS_PASSENGERS.format(bus_id='bus-1'), 12)
+
+    def test_line_subscription_sends_snapshot(self):
+        """Test that a line subscription is followed by the line's live buses."""
+        async_to_sync(self._test_line_subscription)()
+
+    async def _test_line_subscription(self):
+        communicator = WebsocketCommunicator(TrackingConsumer.as_asgi(), '/ws/')
+        communicator.scope['user'] = AnonymousUser()
+        await communicator.connect()
+        await communicator.receive_json_from()
+
+        await communicator.send_json_to({'type': 'subscribe_to_line', 'line_id': 'line-1'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'subscription_confirmed')
+
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual((snapshot['type'], snapshot['subscription']), ('snapshot', 'line_line-1'))
+        self.assertEqual([bus['bus_id'] for bus in snapshot['buses']], ['bus-1'])
+        self.assertEqual(snapshot['buses'][0]['occupancy'], {'count': 12})
+        self.assertEqual(snapshot['buses'][0]['position']['latitude'], 36.75)
+        await communicator.disconnect()
+
+    def test_bus_snapshot_keeps_stale_position(self):
+        """Test that a followed bus is reported even when it stopped reporting."""
+        snapshot = async_to_sync(aget_group_snapshot)('bus_bus-2')
+
+        self.assertEqual(snapshot['bus_id'], 'bus-2')
+        self.assertEqual([bus['bus_id'] for bus in snapshot['buses']], ['bus-2'])
+        self.assertIsNone(snapshot['buses'][0]['occupancy'])
+
+    def test_other_groups_have_no_snapshot(self):
+        """Test that only bus and line groups get snapshots."""
+        self.assertIsNone(async_to_sync(aget_group_snapshot)('general_updates'))
@@ -0,0 +1,84 @@
+"""
+Tests for waiting count report validation.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.lines.models import Stop
+from apps.tracking.models import WaitingCountReport
+from apps.tracking.utils.validation import ReportValidationContext, ReportValidator
+
+User = get_user_model()
+
+
+class ReportValidationContextTests(TestCase):
+    """Test suite for the preloaded report validation context."""
+
+    def setUp(self):
+        """Set up a stop with reports from two users."""
+        self.reporter = User.objects.create_user(
+            email='reporter@test.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            email='other@test.com',
+            password='testpass123'
+        )
+        self.stop = Stop.objects.create(
+            name='Validation Stop',
+            latitude=36.7538,
+            longitude=3.0588,
+            address='Test Address'
+        )
+        self.other_stop = Stop.objects.create(
+            name='Other Stop',
+            latitude=36.7548,
+            longitude=3.0598,
+            address='Test Address 2'
+        )
+
+        WaitingCountReport.objects.create(
+            reporter=self.other, stop=self.stop, reported_count=10
+        )
+        WaitingCountReport.objects.create(
+            reporter=self.other, stop=self.stop, reported_count=14
+        )
+        WaitingCountReport.objects.create(
+            reporter=self.reporter, stop=self.other_stop, reported_count=3
+        )
+
+    def test_load_counts_windows(self):
+        """Test that the context separates the reporter from other reporters."""
+        with self.assertNumQueries(2):
+            context = ReportValidationContext.load(self.reporter.id, self.stop.id)
+
+        self.assertEqual(context.reporter_reports_at_stop, 0)
+        self.assertEqual(context.reporter_reports_last_hour, 1)
+        self.assertEqual(context.reporter_reports_last_day, 1)
+        self.assertEqual(context.other_reports_recent, 2)
+        self.assertEqual(context.other_reports_recent_average, 12)
+        self.assertEqual(context.other_reporters_at_stop, 2)
+        self.assertEqual(context.bus_reports_last_hour, 2)
+        self.assertIsNone(context.reputation)
+
+    def test_validate_report_runs_in_memory(self):
+        """Test that scoring a report with a preloaded context runs no queries."""
+        context = ReportValidationContext.load(self.reporter.id, self.stop.id)
+
+        with self.assertNumQueries(0):
+            result = ReportValidator.validate_report(
+                reporter_id=str(self.reporter.id),
+                stop_id=str(self.stop.id),
+                reported_count=12,
+                context=context
+            )
+
+        self.assertTrue(result.is_valid)
+        self.assertIn("Consistent with other recent reports", result.reasons)
+
+    def test_rate_limit_applies_per_stop(self):
+        """Test that a recent report at the same stop is flagged."""
+        context = ReportValidationContext.load(self.other.id, self.stop.id)
+
+        self.assertEqual(context.reporter_reports_at_stop, 2)
+        self.assertEqual(ReportValidator._validate_rate_limits(context), 0.0)
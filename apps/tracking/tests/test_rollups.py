@@ -0,0 +1,274 @@
+"""
+Tests for daily tracking analytics rollups.
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.buses.models import Bus
+from apps.drivers.models import Driver
+from apps.lines.models import Line, Stop
+from apps.tracking.models import (
+    Anomaly,
+    PassengerCount,
+    PassengerHourlyRollup,
+    StopDailyRollup,
+    Trip,
+    TripDailyRollup,
+    WaitingCountReport,
+)
+from apps.tracking.exports import export_hourly_facts, export_trip_facts
+from apps.tracking.rollups import (
+    build_daily_rollups,
+    day_bounds,
+    get_trip_rollups,
+    total_trip_rollups,
+)
+from tasks.periodic import (
+    generate_bus_performance_report,
+    generate_daily_reports,
+    generate_line_performance_report,
+)
+
+User = get_user_model()
+
+
+class TrackingRollupTest(TestCase):
+    """Test building and reading tracking rollups."""
+
+    def setUp(self):
+        """Set up two days of trips, counts and reports."""
+        self.admin = User.objects.create_user(
+            email='rollup-admin@test.com',
+            password='testpass123',
+            is_staff=True
+        )
+        driver_user = User.objects.create_user(
+            email='rollup-driver@test.com',
+            password='testpass123',
+            first_name='Rollup',
+            last_name='Driver',
+            user_type='driver'
+        )
+        self.driver = Driver.objects.create(
+            user=driver_user,
+            phone_number='+213555000999',
+            id_card_number='ROLLUP1',
+            id_card_photo='test.jpg',
+            driver_license_number='ROLLUPDL1',
+            driver_license_photo='test.jpg',
+            status='approved',
+            years_of_experience=3
+        )
+        self.bus = Bus.objects.create(
+            license_plate='ROLL-001',
+            driver=self.driver,
+            model='Sprinter',
+            manufacturer='Mercedes-Benz',
+            year=2021,
+            capacity=30,
+            status='active',
+            is_approved=True
+        )
+        self.line = Line.objects.create(name='Rollup Line', code='RL1')
+        self.stop = Stop.objects.create(name='Rollup Stop', latitude=36.75, longitude=3.05)
+
+        self.today = timezone.localdate()
+        self.day = self.today - timedelta(days=2)
+        day_start, _ = day_bounds(self.day)
+
+        for hour, distance in ((8, '10.00'), (9, '14.00')):
+            start = day_start + timedelta(hours=hour)
+            trip = Trip.objects.create(
+                bus=self.bus,
+                driver=self.driver,
+                line=self.line,
+                start_time=start,
+                end_time=start + timedelta(minutes=40),
+                is_completed=True,
+                distance=Decimal(distance),
+                average_speed=Decimal('30.00'),
+                max_passengers=20
+            )
+        Anomaly.objects.create(bus=self.bus, trip=trip, type='schedule', description='Late')
+        Anomaly.objects.filter(trip=trip).update(created_at=day_start + timedelta(hours=9))
+
+        for count in (10, 20):
+            PassengerCount.objects.create(
+                bus=self.bus,
+                count=count,
+                capacity=30,
+                occupancy_rate=Decimal(count) / 30,
+                line=self.line,
+                stop=self.stop
+            )
+        PassengerCount.objects.update(created_at=day_start + timedelta(hours=8, minutes=15))
+
+        WaitingCountReport.objects.create(reporter=self.admin, stop=self.stop, reported_count=6)
+        WaitingCountReport.objects.update(created_at=day_start + timedelta(hours=7))
+
+        # An open trip today stays on the live tail
+        Trip.objects.create(
+            bus=self.bus,
+            driver=self.driver,
+            line=self.line,
+            start_time=timezone.now(),
+            max_passengers=5
+        )
+
+    def test_build_daily_rollups_creates_rows(self):
+        """Test that closed days are aggregated into rollup rows."""
+        build_daily_rollups(self.day)
+
+        row = TripDailyRollup.objects.get()
+        self.assertEqual(row.date, self.day)
+        self.assertEqual(row.trip_count, 2)
+        self.assertEqual(row.completed_trip_count, 2)
+        self.assertEqual(row.total_distance, Decimal('24.00'))
+        self.assertEqual(row.completed_duration, timedelta(minutes=80))
+        self.assertEqual(row.anomaly_count, 1)
+
+        hourly = PassengerHourlyRollup.objects.get()
+        self.assertEqual(hourly.record_count, 2)
+        self.assertEqual(hourly.total_passengers, 30)
+
+        stop_row = StopDailyRollup.objects.get()
+        self.assertEqual((stop_row.report_count, stop_row.total_reported), (1, 6))
+
+    def test_rebuild_is_idempotent(self):
+        """Test that rebuilding a range replaces rows instead of adding to them."""
+        build_daily_rollups(self.day)
+        build_daily_rollups(self.day)
+
+        self.assertEqual(TripDailyRollup.objects.count(), 1)
+        self.assertEqual(PassengerHourlyRollup.objects.count(), 1)
+
+    def test_today_is_never_rolled_up(self):
+        """Test that the open day is left to the live tail."""
+        build_daily_rollups(self.day, self.today)
+
+        self.assertFalse(TripDailyRollup.objects.filter(date=self.today).exists())
+
+    def test_rollups_match_raw_tables(self):
+        """Test that rolled-up and live totals agree and include today."""
+        live = total_trip_rollups(get_trip_rollups(self.day, self.today))[None]
+
+        build_daily_rollups(self.day)
+        rolled_up = total_trip_rollups(get_trip_rollups(self.day, self.today))[None]
+
+        self.assertEqual(live, rolled_up)
+        self.assertEqual(rolled_up['trip_count'], 3)
+        self.assertEqual(rolled_up['average_duration_minutes'], 40)
+
+    def test_days_before_rollups_read_raw_tables(self):
+        """Test that days older than the first rolled-up day are aggregated live."""
+        build_daily_rollups(self.day)
+
+        start = day_bounds(self.day - timedelta(days=1))[0] + timedelta(hours=8)
+        Trip.objects.create(
+            bus=self.bus,
+            driver=self.driver,
+            line=self.line,
+            start_time=start,
+            end_time=start + timedelta(minutes=20),
+            is_completed=True,
+            distance=Decimal('5.00'),
+            max_passengers=10
+        )
+
+        rows = get_trip_rollups(self.day - timedelta(days=1), self.today)
+        self.assertEqual(total_trip_rollups(rows)[None]['trip_count'], 4)
+        self.assertEqual(TripDailyRollup.objects.count(), 1)
+
+    def test_reports_read_rollups(self):
+        """Test that daily reports come from the rollups once built."""
+        build_daily_rollups(self.day)
+        Trip.objects.all().delete()
+
+        bus_report = generate_bus_performance_report(self.day)
+        self.assertEqual(bus_report['total_trips'], 2)
+        self.assertEqual(bus_report['average_trip_duration'], 40)
+        self.assertEqual(bus_report['most_active_buses'][0]['license_plate'], 'ROLL-001')
+
+        line_report = generate_line_performance_report(self.day)
+        self.assertEqual(line_report['line_stats'][0]['anomalies'], 1)
+
+    def test_admin_stats_read_rollups(self):
+        """Test that admin dashboards read the rollups."""
+        build_daily_rollups(self.day)
+        WaitingCountReport.objects.all().delete()
+
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+
+        response = client.get(reverse('admin-stats-ridership'), {'date_from': self.day.isoformat()})
+        daily = {row['trip_date']: row for row in response.data['daily']}
+        self.assertEqual(daily[self.day]['total_trips'], 2)
+        self.assertEqual(daily[self.today]['total_trips'], 1)
+
+        response = client.get(reverse('admin-stats-stops-busiest'), {'date_from': self.day.isoformat()})
+        self.assertEqual(response.data['stops'][0]['report_count'], 1)
+
+    def read_export(self, path):
+        """Read a gzip CSV export back into dict rows."""
+        with default_storage.open(path, 'rb') as fh:
+            return list(csv.DictReader(io.TextIOWrapper(gzip.GzipFile(fileobj=fh), encoding='utf-8')))
+
+    def test_export_trip_facts(self):
+        """Test that per-trip facts are streamed to a gzip CSV."""
+        path = export_trip_facts(self.day)
+
+        rows = self.read_export(path)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['bus_id'], str(self.bus.id))
+        self.assertEqual(float(rows[0]['distance']), 10.0)
+
+        # Exporting again replaces the file
+        self.assertEqual(export_trip_facts(self.day), path)
+
+    def test_export_hourly_facts_rolled_up_and_live(self):
+        """Test that hourly facts read the same from rollups and raw counts."""
+        live = self.read_export(export_hourly_facts(self.day))
+
+        build_daily_rollups(self.day)
+        PassengerCount.objects.all().delete()
+        rolled_up = self.read_export(export_hourly_facts(self.day))
+
+        self.assertEqual(live, rolled_up)
+        self.assertEqual(rolled_up[0]['total_passengers'], '30')
+
+    def test_daily_reports_chord_saves_reports(self):
+        """Test that the report chord saves all four reports."""
+        generate_daily_reports(self.day.isoformat())
+
+        path = f"reports/{self.day.isoformat()}_daily_report.json"
+        with default_storage.open(path) as fh:
+            report = json.loads(fh.read())
+        self.assertEqual(report['bus_report']['total_trips'], 2)
+        self.assertEqual(report['line_report']['line_stats'][0]['anomalies'], 1)
+
+    def test_backfill_command(self):
+        """Test that the backfill command rolls up each day of the range."""
+        out = io.StringIO()
+        call_command(
+            'backfill_analytics',
+            '--from', self.day.isoformat(),
+            '--to', self.today.isoformat(),
+            '--export',
+            stdout=out,
+        )
+
+        self.assertEqual(TripDailyRollup.objects.get().date, self.day)
+        self.assertTrue(default_storage.exists(f"exports/trips/{self.day.isoformat()}.csv.gz"))
+        self.assertIn('Backfilled', out.getvalue())
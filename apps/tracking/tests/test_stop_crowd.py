@@ -0,0 +1,113 @@
+"""
+Tests for the stop crowd estimator.
+"""
+import json
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.lines.models import Stop
+from apps.tracking.models import WaitingCountReport, WaitingPassengers
+from apps.tracking.services.crowd_service import StopCrowdService
+
+User = get_user_model()
+
+
+class StopCrowdServiceTests(TestCase):
+    """Test suite for StopCrowdService."""
+
+    def setUp(self):
+        """Set up stops and a reporter."""
+        self.user = User.objects.create_user(
+            email='crowd@test.com',
+            password='testpass123'
+        )
+        self.stop = Stop.objects.create(
+            name='Crowd Stop',
+            latitude=36.7538,
+            longitude=3.0588,
+            address='Test Address'
+        )
+        self.busy_stop = Stop.objects.create(
+            name='Busy Stop',
+            latitude=36.7548,
+            longitude=3.0598,
+            address='Test Address 2'
+        )
+
+    def test_database_fallback_weights_by_confidence(self):
+        """Test that reports are blended by confidence without Redis."""
+        WaitingCountReport.objects.create(
+            reporter=self.user, stop=self.stop, reported_count=10,
+            confidence_score=Decimal('1.00')
+        )
+        WaitingCountReport.objects.create(
+            reporter=self.user, stop=self.stop, reported_count=20,
+            confidence_score=Decimal('0.50')
+        )
+        WaitingPassengers.objects.create(stop=self.busy_stop, count=30)
+
+        with self.assertNumQueries(3):
+            crowd = StopCrowdService.get_all()
+
+        self.assertEqual(crowd[str(self.stop.id)]['count'], 13)
+        self.assertEqual(crowd[str(self.stop.id)]['level'], 'medium')
+        self.assertEqual(crowd[str(self.busy_stop.id)]['level'], 'high')
+
+    @patch('apps.tracking.services.crowd_service.get_redis_client')
+    def test_redis_estimates_decay(self, mock_get_client):
+        """Test that stored weights decay with age and stale entries are dropped."""
+        now = int(time.time())
+        half_life = StopCrowdService.HALF_LIFE_SECONDS
+        client = MagicMock()
+        client.hgetall.return_value = {
+            str(self.stop.id).encode(): json.dumps({'': [12, 3.0, now - half_life]}).encode(),
+            str(self.busy_stop.id).encode(): json.dumps({'': [40, 1.0, now - half_life * 10]}).encode(),
+        }
+        mock_get_client.return_value = client
+
+        crowd = StopCrowdService.get_all()
+
+        self.assertEqual(list(crowd), [str(self.stop.id)])
+        self.assertEqual(crowd[str(self.stop.id)]['count'], 12)
+        self.assertEqual(crowd[str(self.stop.id)]['confidence'], 0.5)
+
+        # The decayed stop is pruned unless it changed since it was read
+        prune = client.register_script.return_value
+        self.assertEqual(prune.call_args.kwargs['args'][0], str(self.busy_stop.id))
+
+    @patch('apps.tracking.services.crowd_service.get_redis_client')
+    def test_single_stop_reads_only_its_field(self, mock_get_client):
+        """Test that specific stops are fetched with HMGET instead of the whole hash."""
+        client = MagicMock()
+        client.hmget.return_value = [json.dumps({'': [7, 1.0, int(time.time())]}).encode()]
+        mock_get_client.return_value = client
+
+        crowd = StopCrowdService.get_stop_crowd(self.stop.id)
+
+        client.hgetall.assert_not_called()
+        client.hmget.assert_called_once_with(StopCrowdService.KEY, [str(self.stop.id)])
+        self.assertEqual(crowd['count'], 7)
+
+    @patch('apps.tracking.services.crowd_service.get_redis_client')
+    def test_updates_run_after_commit(self, mock_get_client):
+        """Test that observations and waiting-list deltas are sent on commit."""
+        client = MagicMock()
+        mock_get_client.return_value = client
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            StopCrowdService.record_observation(self.stop.id, 8, weight=0.7)
+            StopCrowdService.record_delta(self.stop.id, -1)
+
+        client.register_script.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+
+        script = client.register_script.return_value
+        self.assertEqual(script.call_count, 2)
+        self.assertEqual(script.call_args_list[0].kwargs['args'][5], 'observe')
+        self.assertEqual(script.call_args_list[1].kwargs['args'][5], 'adjust')
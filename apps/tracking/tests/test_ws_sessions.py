@@ -0,0 +1,104 @@
+"""
+Tests for resumable WebSocket tracking sessions.
+"""
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from apps.core.constants import CACHE_KEY_BUS_LOCATION
+from apps.tracking.consumers import TrackingConsumer
+from apps.tracking.ws_sessions import aget_replay_events
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def bus_location(bus_id, timestamp):
+    return {
+        'bus_id': bus_id,
+        'latitude': 36.75,
+        'longitude': 3.05,
+        'speed': 30.0,
+        'heading': 90.0,
+        'nearest_stop_id': None,
+        'distance_to_stop': None,
+        'timestamp': timestamp.isoformat(),
+    }
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TrackingSessionTest(SimpleTestCase):
+    """Test resuming tracking WebSocket sessions."""
+
+    def setUp(self):
+        cache.clear()
+
+    def communicator(self, session_id=None):
+        path = f'/ws/?session={session_id}' if session_id else '/ws/'
+        communicator = WebsocketCommunicator(TrackingConsumer.as_asgi(), path)
+        communicator.scope['user'] = AnonymousUser()
+        return communicator
+
+    def test_resume_restores_subscriptions_and_replays(self):
+        """Test that a reconnect restores groups and replays missed positions."""
+        async_to_sync(self._test_resume)()
+
+    async def _test_resume(self):
+        first = self.communicator()
+        await first.connect()
+        session_id = (await first.receive_json_from())['session_id']
+        await first.send_json_to({'type': 'subscribe_to_bus', 'bus_id': 'bus-1'})
+        await first.receive_json_from()
+        await first.disconnect()
+
+        # Position recorded while the client was away
+        await cache.aset(CACHE_KEY_BUS_LOCATION.format(bus_id='bus-1'), bus_location('bus-1', timezone.now()), 60)
+
+        second = self.communicator(session_id)
+        await second.connect()
+        hello = await second.receive_json_from()
+        self.assertTrue(hello['resumed'])
+        self.assertEqual(hello['session_id'], session_id)
+        self.assertEqual(hello['subscriptions'], ['bus_bus-1'])
+
+        replay = await second.receive_json_from()
+        self.assertEqual((replay['type'], replay['bus_id'], replay['replayed']), ('bus_location_update', 'bus-1', True))
+
+        # The restored group receives live updates without a new subscribe
+        await get_channel_layer().group_send('bus_bus-1', {
+            'type': 'bus_location_update',
+            'bus_id': 'bus-1',
+            'location': {},
+            'timestamp': timezone.now().isoformat(),
+        })
+        self.assertNotIn('replayed', await second.receive_json_from())
+        await second.disconnect()
+
+    def test_unknown_session_starts_fresh(self):
+        """Test that an unknown session ID gets a new session."""
+        async_to_sync(self._test_unknown_session)()
+
+    async def _test_unknown_session(self):
+        communicator = self.communicator('missing')
+        await communicator.connect()
+        hello = await communicator.receive_json_from()
+        self.assertFalse(hello['resumed'])
+        self.assertNotEqual(hello['session_id'], 'missing')
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    def test_replay_skips_positions_seen_before_disconnect(self):
+        """Test that only positions newer than the session are replayed."""
+        now = timezone.now()
+        cache.set(CACHE_KEY_BUS_LOCATION.format(bus_id='old'), bus_location('old', now - timedelta(minutes=1)))
+        cache.set(CACHE_KEY_BUS_LOCATION.format(bus_id='new'), bus_location('new', now + timedelta(seconds=1)))
+
+        events = async_to_sync(aget_replay_events)(['bus_old', 'bus_new'], now.isoformat())
+
+        self.assertEqual([event['bus_id'] for event in events], ['new'])
@@ -2,10 +2,11 @@
 Smart validation utilities for the enhanced waiting system.
 """
 import logging
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
-from django.db.models import Count, Avg
+from django.db.models import Count, Avg, Q
 from django.utils import timezone
 
 from apps.core.utils.geo import calculate_distance, is_location_in_algeria
@@ -23,6 +24,87 @@ class ValidationResult:
         self.reasons = reasons
 
 
+@dataclass
+class ReportValidationContext:
+    """
+    Everything needed to score one waiting count report.
+
+    Loaded with one conditional aggregate over ``WaitingCountReport`` plus the
+    reporter's reputation, so the scoring rules run in memory.
+    """
+    reporter_id: str
+    stop_id: str
+    bus_id: Optional[str]
+    now: datetime
+    reporter_reports_at_stop: int
+    reporter_reports_last_hour: int
+    reporter_reports_last_day: int
+    other_reports_recent: int
+    other_reports_recent_average: Optional[float]
+    other_reporters_at_stop: int
+    bus_reports_last_hour: int
+    historical_reports: int
+    historical_average: Optional[float]
+    reputation: Optional[ReputationScore]
+
+    # Windows used by the aggregate
+    STOP_COOLDOWN_MINUTES = 10
+    CROSS_VALIDATION_MINUTES = 30
+
+    @classmethod
+    def load(cls, reporter_id: str, stop_id: str, bus_id: Optional[str] = None) -> 'ReportValidationContext':
+        """
+        Load the validation context for a report.
+        
+        Args:
+            reporter_id: ID of the user reporting
+            stop_id: ID of the stop
+            bus_id: Optional specific bus ID
+            
+        Returns:
+            ReportValidationContext instance
+        """
+        now = timezone.now()
+        local_now = timezone.localtime(now)
+        cooldown_start = now - timedelta(minutes=cls.STOP_COOLDOWN_MINUTES)
+        cross_start = now - timedelta(minutes=cls.CROSS_VALIDATION_MINUTES)
+        hour_ago = now - timedelta(hours=1)
+        day_ago = now - timedelta(days=1)
+
+        by_reporter = Q(reporter_id=reporter_id)
+        at_stop = Q(stop_id=stop_id)
+        others_at_stop = at_stop & ~by_reporter
+        historical = at_stop & Q(
+            created_at__hour=local_now.hour,
+            created_at__week_day=(local_now.weekday() + 1) % 7 + 1,  # Django uses 1=Sunday
+            is_verified=True,
+            verification_status='correct',
+        )
+
+        stats = WaitingCountReport.objects.filter(
+            (by_reporter & Q(created_at__gte=day_ago)) | at_stop
+        ).aggregate(
+            reporter_reports_at_stop=Count('id', filter=by_reporter & at_stop & Q(created_at__gte=cooldown_start)),
+            reporter_reports_last_hour=Count('id', filter=by_reporter & Q(created_at__gte=hour_ago)),
+            reporter_reports_last_day=Count('id', filter=by_reporter & Q(created_at__gte=day_ago)),
+            other_reports_recent=Count('id', filter=others_at_stop & Q(created_at__gte=cross_start)),
+            other_reports_recent_average=Avg('reported_count', filter=others_at_stop & Q(created_at__gte=cross_start)),
+            other_reporters_at_stop=Count('id', filter=others_at_stop & Q(created_at__gte=cooldown_start)),
+            bus_reports_last_hour=Count('id', filter=at_stop & Q(bus_id=bus_id, created_at__gte=hour_ago)),
+            historical_reports=Count('id', filter=historical),
+            historical_average=Avg('reported_count', filter=historical),
+        )
+
+        return cls(
+            reporter_id=str(reporter_id),
+            stop_id=str(stop_id),
+            bus_id=str(bus_id) if bus_id else None,
+            now=now,
+            reputation=ReputationScore.objects.filter(user_id=reporter_id).first(),
+            **stats
+        )
+
+
 class ReportValidator:
     """
     Smart validator for waiting count reports with anti-gaming measures.
@@ -45,7 +127,8 @@ class ReportValidator:
         reporter_longitude: Optional[float] = None,
         stop_latitude: float = None,
         stop_longitude: float = None,
-        confidence_level: str = 'medium'
+        confidence_level: str = 'medium',
+        context: Optional[ReportValidationContext] = None
     ) -> ValidationResult:
         """
         Comprehensive validation of a waiting count report.
@@ -59,10 +142,14 @@ class ReportValidator:
             stop_latitude: Stop's latitude
             stop_longitude: Stop's longitude
             confidence_level: Reporter's confidence level
+            context: Preloaded validation context, loaded if omitted
             
         Returns:
             ValidationResult with validation outcome
         """
+        if context is None:
+            context = ReportValidationContext.load(reporter_id, stop_id)
+        
         reasons = []
         confidence = 0.5  # Start with neutral confidence
         
@@ -83,7 +170,7 @@ class ReportValidator:
             reasons.append("GPS location too far from stop")
         
         # 2. Rate Limiting Validation
-        rate_limit_score = cls._validate_rate_limits(reporter_id, stop_id)
+        rate_limit_score = cls._validate_rate_limits(context)
         
         if rate_limit_score < 0.3:
             confidence -= 0.4
@@ -106,7 +193,7 @@ class ReportValidator:
         
         # 4. Cross-Validation with Other Reports
         cross_validation_score = cls._cross_validate_with_recent_reports(
-            stop_id, reported_count
+            context, reported_count
         )
         
         if cross_validation_score > 0.7:
@@ -117,7 +204,7 @@ class ReportValidator:
             reasons.append("Inconsistent with other recent reports")
         
         # 5. Reporter Reputation Validation
-        reputation_score = cls._validate_reporter_reputation(reporter_id)
+        reputation_score = cls._validate_reporter_reputation(context)
         
         if reputation_score > 0.8:
             confidence += 0.2
@@ -131,7 +218,7 @@ class ReportValidator:
         
         # 6. Temporal Pattern Validation
         temporal_score = cls._validate_temporal_patterns(
-            stop_id, reported_count
+            context, reported_count
         )
         
         if temporal_score > 0.7:
@@ -196,7 +283,7 @@ class ReportValidator:
             return 0.5
     
     @classmethod
-    def _validate_rate_limits(cls, reporter_id: str, stop_id: str) -> float:
+    def _validate_rate_limits(cls, context: ReportValidationContext) -> float:
         """
         Validate that reporter isn't submitting too many reports.
         
@@ -204,32 +291,18 @@ class ReportValidator:
             Score between 0-1 (1 = normal frequency)
         """
         try:
-            now = timezone.now()
-            
             # Check reports in last 10 minutes at this stop
-            recent_reports_stop = WaitingCountReport.objects.filter(
-                reporter_id=reporter_id,
-                stop_id=stop_id,
-                created_at__gte=now - timedelta(minutes=cls.MIN_TIME_BETWEEN_REPORTS)
-            ).count()
-            
-            if recent_reports_stop > 0:
+            if context.reporter_reports_at_stop > 0:
                 return 0.0  # Definite violation
             
             # Check reports in last hour (all stops)
-            hourly_reports = WaitingCountReport.objects.filter(
-                reporter_id=reporter_id,
-                created_at__gte=now - timedelta(hours=1)
-            ).count()
+            hourly_reports = context.reporter_reports_last_hour
             
             if hourly_reports >= cls.MAX_REPORTS_PER_HOUR:
                 return 0.2  # Excessive hourly reporting
             
             # Check reports in last day (all stops)
-            daily_reports = WaitingCountReport.objects.filter(
-                reporter_id=reporter_id,
-                created_at__gte=now - timedelta(days=1)
-            ).count()
+            daily_reports = context.reporter_reports_last_day
             
             if daily_reports >= cls.MAX_REPORTS_PER_DAY:
                 return 0.3  # Excessive daily reporting
@@ -295,7 +368,7 @@ class ReportValidator:
     @classmethod
     def _cross_validate_with_recent_reports(
         cls,
-        stop_id: str,
+        context: ReportValidationContext,
         reported_count: int
     ) -> float:
         """
@@ -305,21 +378,11 @@ class ReportValidator:
             Score between 0-1 (1 = very consistent)
         """
         try:
-            # Get recent reports from other users (last 30 minutes)
-            recent_reports = WaitingCountReport.objects.filter(
-                stop_id=stop_id,
-                created_at__gte=timezone.now() - timedelta(minutes=30)
-            ).exclude(
-                reporter_id=stop_id  # Exclude same reporter
-            ).values_list('reported_count', flat=True)
-            
-            if not recent_reports:
+            # Recent reports from other users (last 30 minutes)
+            if not context.other_reports_recent:
                 return 0.7  # Neutral score if no other reports
             
-            # Calculate average and variation
-            avg_count = sum(recent_reports) / len(recent_reports)
-            max_count = max(recent_reports)
-            min_count = min(recent_reports)
+            avg_count = context.other_reports_recent_average
             
             # Calculate consistency score
             if avg_count == 0:
@@ -344,7 +407,7 @@ class ReportValidator:
             return 0.7
     
     @classmethod
-    def _validate_reporter_reputation(cls, reporter_id: str) -> float:
+    def _validate_reporter_reputation(cls, context: ReportValidationContext) -> float:
         """
         Validate based on reporter's reputation.
         
@@ -352,9 +415,7 @@ class ReportValidator:
             Score between 0-1 (1 = excellent reputation)
         """
         try:
-            reputation = ReputationScore.objects.filter(
-                user_id=reporter_id
-            ).first()
+            reputation = context.reputation
             
             if not reputation:
                 return 0.6  # Neutral score for new users
@@ -382,7 +443,7 @@ class ReportValidator:
     @classmethod
     def _validate_temporal_patterns(
         cls,
-        stop_id: str,
+        context: ReportValidationContext,
         reported_count: int
     ) -> float:
         """
@@ -392,24 +453,13 @@ class ReportValidator:
             Score between 0-1 (1 = fits patterns perfectly)
         """
         try:
-            now = timezone.now()
-            hour = now.hour
-            weekday = now.weekday()  # 0 = Monday
-            
-            # Get historical data for this time period
-            historical_reports = WaitingCountReport.objects.filter(
-                stop_id=stop_id,
-                created_at__hour=hour,
-                created_at__week_day=weekday + 2,  # Django uses 1=Sunday
-                is_verified=True,
-                verification_status='correct'
-            ).values_list('reported_count', flat=True)
-            
-            if not historical_reports:
+            hour = timezone.localtime(context.now).hour
+            
+            # Historical verified reports for this hour and weekday
+            if not context.historical_reports:
                 return 0.7  # Neutral score if no historical data
             
-            # Calculate expected range
-            avg_count = sum(historical_reports) / len(historical_reports)
+            avg_count = context.historical_average
             
             # Define expected ranges based on time of day
             if 6 <= hour <= 9 or 16 <= hour <= 19:  # Rush hours
@@ -0,0 +1,132 @@
+"""
+Resumable WebSocket sessions for the tracking consumer.
+
+A session keeps the groups a socket subscribed to and when it was last
+connected. A client reconnecting with its session ID gets the groups back
+without re-subscribing, plus the latest cached position of every bus it
+follows that moved while it was away.
+"""
+import secrets
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.core.constants import (
+    CACHE_KEY_BUS_LOCATION,
+    CACHE_KEY_LINE_BUSES,
+    CACHE_KEY_WS_SESSION,
+    CACHE_TIMEOUT_WS_SESSION,
+)
+
+# Groups restored on resume; the tracking and personal groups are joined on every connect
+RESUMABLE_GROUP_PREFIXES = ('bus_', 'line_', 'notifications_', 'general_updates', 'system_updates')
+
+
+def new_session_id() -> str:
+    """
+    Get a new unguessable session ID.
+    """
+    return secrets.token_urlsafe(18)
+
+
+def is_resumable_group(group: str) -> bool:
+    """
+    Check whether a group is kept in the session.
+    """
+    return group.startswith(RESUMABLE_GROUP_PREFIXES)
+
+
+async def aload_session(session_id: Optional[str], user_id: Optional[str]) -> Optional[Dict]:
+    """
+    Get a session if it exists and belongs to the connecting user.
+
+    Args:
+        session_id: Session ID sent by the client
+        user_id: ID of the connecting user, None when anonymous
+
+    Returns:
+        Dict with ``groups`` and ``last_seen``, or None
+    """
+    if not session_id:
+        return None
+
+    session = await cache.aget(CACHE_KEY_WS_SESSION.format(session_id=session_id))
+    if not session or session.get('user_id') != user_id:
+        return None
+    return session
+
+
+async def asave_session(session_id: str, user_id: Optional[str], groups: Iterable[str],
+                        last_seen: Optional[str] = None):
+    """
+    Store a session for CACHE_TIMEOUT_WS_SESSION seconds.
+
+    Args:
+        session_id: Session ID
+        user_id: ID of the user, None when anonymous
+        groups: Subscribed groups
+        last_seen: ISO time the socket was last known to be connected
+    """
+    await cache.aset(
+        CACHE_KEY_WS_SESSION.format(session_id=session_id),
+        {
+            'user_id': user_id,
+            'groups': sorted(group for group in groups if is_resumable_group(group)),
+            'last_seen': last_seen or timezone.now().isoformat(),
+        },
+        CACHE_TIMEOUT_WS_SESSION,
+    )
+
+
+async def aget_replay_events(groups: Iterable[str], since: Optional[str] = None) -> List[Dict]:
+    """
+    Get the latest location of each followed bus that changed after ``since``.
+
+    Buses are followed directly through ``bus_`` groups or through the
+    cached bus list of ``line_`` groups. Only cached state is read.
+
+    Args:
+        groups: Subscribed groups
+        since: ISO time; older locations are skipped
+
+    Returns:
+        ``bus_location_update`` events, oldest first
+    """
+    groups = list(groups)
+    bus_ids = {group[len('bus_'):] for group in groups if group.startswith('bus_')}
+    line_ids = [group[len('line_'):] for group in groups if group.startswith('line_')]
+
+    if line_ids:
+        lines = await cache.aget_many([CACHE_KEY_LINE_BUSES.format(line_id=line_id) for line_id in line_ids])
+        for buses in lines.values():
+            bus_ids.update(str(bus['bus_id']) for bus in buses or ())
+
+    if not bus_ids:
+        return []
+
+    locations = await cache.aget_many([CACHE_KEY_BUS_LOCATION.format(bus_id=bus_id) for bus_id in bus_ids])
+    since = datetime.fromisoformat(since) if since else None
+
+    events = []
+    for location in locations.values():
+        timestamp = datetime.fromisoformat(location['timestamp'])
+        if since is not None and timestamp <= since:
+            continue
+        events.append((timestamp, {
+            'type': 'bus_location_update',
+            'bus_id': location['bus_id'],
+            'location': {
+                'latitude': location['latitude'],
+                'longitude': location['longitude'],
+                'speed': location.get('speed'),
+                'heading': location.get('heading'),
+                'nearest_stop_id': location.get('nearest_stop_id'),
+                'distance_to_stop': location.get('distance_to_stop'),
+            },
+            'timestamp': location['timestamp'],
+            'replayed': True,
+        }))
+
+    return [event for _, event in sorted(events, key=lambda item: item[0])]
@@ -35,6 +35,20 @@ def setup_periodic_tasks(sender, **kwargs):
         name="clean-old-location-data-daily",
     )
 
+    # Roll up tracking analytics for closed days at 1 AM
+    sender.add_periodic_task(
+        crontab(hour=1, minute=0),
+        sender.signature("apps.tracking.tasks.rollup_daily_stats"),
+        name="rollup-tracking-stats-daily",
+    )
+
+    # Rebuild the currency leaderboards from the ledger at 2 AM
+    sender.add_periodic_task(
+        crontab(hour=2, minute=0),
+        sender.signature("apps.tracking.tasks.rebuild_leaderboards"),
+        name="rebuild-leaderboards-daily",
+    )
+
     # Process scheduled notifications every minute
     sender.add_periodic_task(
         60.0,
@@ -63,6 +77,13 @@ def setup_periodic_tasks(sender, **kwargs):
         name="cleanup-old-notifications-daily",
     )
 
+    # Roll up notification statistics every hour at :05
+    sender.add_periodic_task(
+        crontab(minute=5),
+        sender.signature("notifications.rollup_stats"),
+        name="rollup-notification-stats-hourly",
+    )
+
     # Auto-sync offline caches every 30 minutes
     sender.add_periodic_task(
         1800.0,
@@ -91,6 +112,13 @@ def setup_periodic_tasks(sender, **kwargs):
         name="update-cache-statistics-hourly",
     )
 
+    # Flush buffered offline events every minute
+    sender.add_periodic_task(
+        60.0,
+        sender.signature("offline_mode.flush_offline_logs"),
+        name="flush-offline-logs",
+    )
+
     # Clean up old logs weekly on Sunday at 5 AM
     sender.add_periodic_task(
         crontab(day_of_week=0, hour=5, minute=0),
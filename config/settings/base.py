@@ -165,7 +165,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "apps.accounts.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
@@ -353,6 +353,9 @@ BUS_LOCATION_UPDATE_INTERVAL = 15  # seconds
 BUS_LOCATION_HISTORY_RETENTION = 7  # days
 PASSENGER_COUNT_HISTORY_RETENTION = 30  # days
 DRIVER_APPROVAL_REQUIRED = True
+# Answer radius/nearest queries with PostGIS geography expressions and GiST
+# indexes instead of Python distance loops. Requires the postgis extension.
+USE_POSTGIS = env.bool("USE_POSTGIS", default=False)
 
 # Admin URL (used in URLs configuration)
 ADMIN_URL = "admin/"
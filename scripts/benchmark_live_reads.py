@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark the async live-tracking reads against their sync equivalents.
+
+Each endpoint pair is hit by a pool of concurrent clients against a running
+ASGI server (e.g. ``python run_asgi_server.py``) and the throughput and
+latency percentiles are printed side by side.
+
+Usage:
+    python scripts/benchmark_live_reads.py --token <access token> \\
+        --bus-id <bus id> --stop-id <stop id> [--concurrency 50] [--requests 2000]
+"""
+import argparse
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def endpoint_pairs(bus_id, stop_id):
+    """
+    Get (name, sync path, async path) for each benchmarked read.
+    """
+    pairs = [('active buses', '/api/v1/tracking/active-buses/', '/api/v1/tracking/live/active-buses/')]
+    if bus_id:
+        pairs.append((
+            'bus location',
+            f'/api/v1/tracking/locations/?bus_id={bus_id}&page_size=1',
+            f'/api/v1/tracking/live/buses/{bus_id}/location/',
+        ))
+    if stop_id:
+        pairs.append((
+            'stop arrivals',
+            f'/api/v1/tracking/routes/arrivals/?stop_id={stop_id}',
+            f'/api/v1/tracking/live/stops/{stop_id}/arrivals/',
+        ))
+    return pairs
+
+
+def fetch(url, headers):
+    """
+    Get a URL, returning (seconds taken, succeeded).
+    """
+    request = urllib.request.Request(url, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run(url, headers, concurrency, total):
+    """
+    Hit a URL ``total`` times from ``concurrency`` threads.
+
+    Returns:
+        Dict with requests/s, p50/p95/p99 latency in ms and the error count
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: fetch(url, headers), range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds * 1000 for seconds, _ in results)
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        'rps': total / elapsed,
+        'p50': cuts[49],
+        'p95': cuts[94],
+        'p99': cuts[98],
+        'errors': sum(1 for _, ok in results if not ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8007')
+    parser.add_argument('--token', help='JWT access token sent as a Bearer header')
+    parser.add_argument('--bus-id', help='Bus with a recent location')
+    parser.add_argument('--stop-id', help='Stop with cached arrival estimates')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=50, help='Untimed requests per endpoint')
+    args = parser.parse_args()
+
+    headers = {'Accept': 'application/json'}
+    if args.token:
+        headers['Authorization'] = f'Bearer {args.token}'
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent clients against {args.base_url}\n")
+    print(f"{'endpoint':<16}{'view':<7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+    for name, sync_path, async_path in endpoint_pairs(args.bus_id, args.stop_id):
+        for view, path in (('sync', sync_path), ('async', async_path)):
+            url = args.base_url.rstrip('/') + path
+            for _ in range(args.warmup):
+                fetch(url, headers)
+            result = run(url, headers, args.concurrency, args.requests)
+            print(
+                f"{name:<16}{view:<7}{result['rps']:>10.1f}{result['p50']:>10.1f}"
+                f"{result['p95']:>10.1f}{result['p99']:>10.1f}{result['errors']:>8}"
+            )
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
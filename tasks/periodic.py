@@ -2,9 +2,10 @@
 Periodic tasks for DZ Bus Tracker.
 """
 import logging
-from datetime import timedelta
+from collections import defaultdict
+from datetime import date, timedelta
 
-from celery import shared_task
+from celery import chord, group, shared_task
 from django.utils import timezone
 
 from tasks.base import RetryableTask
@@ -47,30 +48,29 @@ def cleanup_old_data():
 
 
 @shared_task(base=RetryableTask)
-def generate_daily_reports():
+def generate_daily_reports(report_date=None):
     """
     Generate daily reports for business analytics.
+
+    The four reports run in parallel as a chord whose callback saves them;
+    the fact exports for the day are queued alongside.
     """
     try:
-        # Define report date (yesterday)
-        report_date = timezone.now().date() - timedelta(days=1)
-
-        # Generate passenger report
-        passenger_report = generate_passenger_report(report_date)
-
-        # Generate bus performance report
-        bus_report = generate_bus_performance_report(report_date)
-
-        # Generate driver performance report
-        driver_report = generate_driver_performance_report(report_date)
+        # Define report date (yesterday by default)
+        if report_date is None:
+            report_date = timezone.localdate() - timedelta(days=1)
+        elif isinstance(report_date, str):
+            report_date = date.fromisoformat(report_date)
 
-        # Generate line performance report
-        line_report = generate_line_performance_report(report_date)
+        day = report_date.isoformat()
+        chord(
+            group(generate_report.s(name, day) for name in REPORT_GENERATORS),
+            save_daily_reports.s(day),
+        ).apply_async()
 
-        # Save reports
-        save_reports(report_date, passenger_report, bus_report, driver_report, line_report)
+        export_daily_facts.delay(day)
 
-        logger.info(f"Generated daily reports for {report_date}")
+        logger.info(f"Scheduled daily reports for {report_date}")
         return True
 
     except Exception as e:
@@ -78,26 +78,46 @@ def generate_daily_reports():
         return False
 
 
-def generate_passenger_report(report_date):
+@shared_task(base=RetryableTask)
+def generate_report(name, report_date):
     """
-    Generate passenger report for a specific date.
+    Generate one named daily report for an ISO date.
     """
-    try:
-        # Define date range
-        start_date = timezone.datetime.combine(report_date, timezone.time.min)
-        end_date = timezone.datetime.combine(report_date, timezone.time.max)
+    return REPORT_GENERATORS[name](date.fromisoformat(report_date))
 
-        # Get passenger counts
-        from apps.tracking.models import PassengerCount
-        passenger_counts = PassengerCount.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date,
-        )
 
-        # Calculate statistics
-        from django.db.models import Avg, Count, Max, Min, Sum
+@shared_task(base=RetryableTask)
+def save_daily_reports(reports, report_date):
+    """
+    Chord callback saving the reports in ``REPORT_GENERATORS`` order.
+    """
+    return save_reports(date.fromisoformat(report_date), *reports)
 
-        total_counts = passenger_counts.count()
+
+@shared_task(base=RetryableTask)
+def export_daily_facts(report_date, fmt="csv"):
+    """
+    Export the per-trip and per-hour facts of an ISO date.
+    """
+    from apps.tracking.exports import export_hourly_facts, export_trip_facts
+
+    day = date.fromisoformat(report_date)
+    return [
+        export_trip_facts(day, fmt=fmt),
+        export_hourly_facts(day, fmt=fmt),
+    ]
+
+
+def generate_passenger_report(report_date):
+    """
+    Generate passenger report for a specific date from the hourly rollups.
+    """
+    try:
+        from apps.lines.models import Line, Stop
+        from apps.tracking.rollups import get_passenger_rollups
+
+        rows = get_passenger_rollups(report_date, report_date)
+        total_counts = sum(row.record_count for row in rows)
 
         if total_counts == 0:
             return {
@@ -112,67 +132,46 @@ def generate_passenger_report(report_date):
                 "busiest_stops": [],
             }
 
-        stats = passenger_counts.aggregate(
-            avg_occupancy=Avg("occupancy_rate"),
-            max_occupancy=Max("occupancy_rate"),
-            min_occupancy=Min("occupancy_rate"),
-            total_passengers=Sum("count"),
-        )
-
-        # Find peak hour
-        from django.db.models.functions import TruncHour
-        hourly_counts = passenger_counts.annotate(
-            hour=TruncHour("created_at")
-        ).values(
-            "hour"
-        ).annotate(
-            total=Sum("count")
-        ).order_by("-total")
-
-        peak_hour = hourly_counts.first() if hourly_counts.exists() else None
-
-        # Find busiest lines
-        busiest_lines = passenger_counts.filter(
-            line__isnull=False
-        ).values(
-            "line_id", "line__code", "line__name"
-        ).annotate(
-            total=Sum("count")
-        ).order_by("-total")[:5]
-
-        # Find busiest stops
-        busiest_stops = passenger_counts.filter(
-            stop__isnull=False
-        ).values(
-            "stop_id", "stop__name"
-        ).annotate(
-            total=Sum("count")
-        ).order_by("-total")[:5]
+        hours = defaultdict(int)
+        lines = defaultdict(int)
+        stops = defaultdict(int)
+        for row in rows:
+            hours[row.bucket_start] += row.total_passengers
+            if row.line_id:
+                lines[row.line_id] += row.total_passengers
+            if row.stop_id:
+                stops[row.stop_id] += row.total_passengers
+
+        busiest_lines = sorted(lines.items(), key=lambda item: item[1], reverse=True)[:5]
+        busiest_stops = sorted(stops.items(), key=lambda item: item[1], reverse=True)[:5]
+        line_objects = Line.objects.in_bulk([line_id for line_id, _ in busiest_lines])
+        stop_objects = Stop.objects.in_bulk([stop_id for stop_id, _ in busiest_stops])
+        peak_hour = max(hours, key=hours.get)
 
         return {
             "date": report_date.isoformat(),
             "total_records": total_counts,
-            "average_occupancy": stats["avg_occupancy"] or 0,
-            "max_occupancy": stats["max_occupancy"] or 0,
-            "min_occupancy": stats["min_occupancy"] or 0,
-            "total_passengers": stats["total_passengers"] or 0,
-            "peak_hour": peak_hour["hour"].isoformat() if peak_hour else None,
+            "average_occupancy": float(sum(row.occupancy_sum for row in rows)) / total_counts,
+            "max_occupancy": float(max(row.occupancy_max for row in rows if row.occupancy_max is not None)),
+            "min_occupancy": float(min(row.occupancy_min for row in rows if row.occupancy_min is not None)),
+            "total_passengers": sum(row.total_passengers for row in rows),
+            "peak_hour": timezone.localtime(peak_hour).isoformat(),
             "busiest_lines": [
                 {
-                    "line_id": line["line_id"],
-                    "code": line["line__code"],
-                    "name": line["line__name"],
-                    "total_passengers": line["total"],
+                    "line_id": str(line_id),
+                    "code": line_objects[line_id].code if line_id in line_objects else None,
+                    "name": line_objects[line_id].name if line_id in line_objects else None,
+                    "total_passengers": total,
                 }
-                for line in busiest_lines
+                for line_id, total in busiest_lines
             ],
             "busiest_stops": [
                 {
-                    "stop_id": stop["stop_id"],
-                    "name": stop["stop__name"],
-                    "total_passengers": stop["total"],
+                    "stop_id": str(stop_id),
+                    "name": stop_objects[stop_id].name if stop_id in stop_objects else None,
+                    "total_passengers": total,
                 }
-                for stop in busiest_stops
+                for stop_id, total in busiest_stops
             ],
         }
 
@@ -183,26 +182,16 @@ def generate_passenger_report(report_date):
 
 def generate_bus_performance_report(report_date):
     """
-    Generate bus performance report for a specific date.
+    Generate bus performance report for a specific date from the trip rollups.
     """
     try:
-        # Define date range
-        start_date = timezone.datetime.combine(report_date, timezone.time.min)
-        end_date = timezone.datetime.combine(report_date, timezone.time.max)
-
-        # Get trips
-        from apps.tracking.models import Trip
-        trips = Trip.objects.filter(
-            start_time__gte=start_date,
-            start_time__lte=end_date,
-        )
+        from apps.buses.models import Bus
+        from apps.tracking.rollups import get_trip_rollups, total_trip_rollups
 
-        # Calculate statistics
-        from django.db.models import Avg, Count, Max, Min, Sum
+        rows = get_trip_rollups(report_date, report_date)
+        totals = total_trip_rollups(rows).get(None)
 
-        total_trips = trips.count()
-
-        if total_trips == 0:
+        if not totals or totals["trip_count"] == 0:
             return {
                 "date": report_date.isoformat(),
                 "total_trips": 0,
@@ -213,58 +202,30 @@ def generate_bus_performance_report(report_date):
                 "most_active_buses": [],
             }
 
-        stats = trips.aggregate(
-            total_distance=Sum("distance"),
-            avg_speed=Avg("average_speed"),
-            total_passengers=Sum("max_passengers"),
-        )
-
-        # Calculate average trip duration
-        completed_trips = trips.filter(
-            is_completed=True,
-            end_time__isnull=False,
-        )
-
-        avg_duration = None
-
-        if completed_trips.exists():
-            total_duration = timedelta()
-            count = 0
-
-            for trip in completed_trips:
-                if trip.end_time and trip.start_time:
-                    duration = trip.end_time - trip.start_time
-                    total_duration += duration
-                    count += 1
-
-            if count > 0:
-                avg_duration = total_duration.total_seconds() / count / 60  # minutes
-
-        # Find most active buses
-        most_active_buses = trips.values(
-            "bus_id", "bus__license_plate"
-        ).annotate(
-            trip_count=Count("id"),
-            total_distance=Sum("distance"),
-            total_passengers=Sum("max_passengers"),
-        ).order_by("-trip_count")[:10]
+        by_bus = total_trip_rollups(rows, key=lambda row: row.bus_id)
+        most_active_buses = sorted(
+            ((bus_id, bus) for bus_id, bus in by_bus.items() if bus["trip_count"]),
+            key=lambda item: item[1]["trip_count"],
+            reverse=True,
+        )[:10]
+        buses = Bus.objects.in_bulk([bus_id for bus_id, _ in most_active_buses])
 
         return {
             "date": report_date.isoformat(),
-            "total_trips": total_trips,
-            "total_distance": stats["total_distance"] or 0,
-            "average_speed": stats["avg_speed"] or 0,
-            "average_trip_duration": avg_duration or 0,
-            "total_passengers": stats["total_passengers"] or 0,
+            "total_trips": totals["trip_count"],
+            "total_distance": float(totals["total_distance"]),
+            "average_speed": totals["average_speed"] or 0,
+            "average_trip_duration": totals["average_duration_minutes"] or 0,
+            "total_passengers": totals["total_passengers"],
             "most_active_buses": [
                 {
-                    "bus_id": bus["bus_id"],
-                    "license_plate": bus["bus__license_plate"],
+                    "bus_id": str(bus_id),
+                    "license_plate": buses[bus_id].license_plate if bus_id in buses else None,
                     "trip_count": bus["trip_count"],
-                    "total_distance": bus["total_distance"] or 0,
-                    "total_passengers": bus["total_passengers"] or 0,
+                    "total_distance": float(bus["total_distance"]),
+                    "total_passengers": bus["total_passengers"],
                 }
-                for bus in most_active_buses
+                for bus_id, bus in most_active_buses
             ],
         }
 
@@ -275,26 +236,18 @@ def generate_bus_performance_report(report_date):
 
 def generate_driver_performance_report(report_date):
     """
-    Generate driver performance report for a specific date.
+    Generate driver performance report for a specific date from the trip rollups.
     """
     try:
-        # Define date range
-        start_date = timezone.datetime.combine(report_date, timezone.time.min)
-        end_date = timezone.datetime.combine(report_date, timezone.time.max)
-
-        # Get trips
-        from apps.tracking.models import Trip
-        trips = Trip.objects.filter(
-            start_time__gte=start_date,
-            start_time__lte=end_date,
-        )
+        from django.db.models import Avg, Count
 
-        # Calculate statistics
-        from django.db.models import Avg, Count, Max, Min, Sum
+        from apps.drivers.models import Driver, DriverRating
+        from apps.tracking.rollups import day_bounds, get_trip_rollups, total_trip_rollups
 
-        total_trips = trips.count()
+        rows = get_trip_rollups(report_date, report_date)
+        totals = total_trip_rollups(rows).get(None)
 
-        if total_trips == 0:
+        if not totals or totals["trip_count"] == 0:
             return {
                 "date": report_date.isoformat(),
                 "total_trips": 0,
@@ -303,71 +256,52 @@ def generate_driver_performance_report(report_date):
                 "top_drivers": [],
             }
 
-        stats = trips.aggregate(
-            total_distance=Sum("distance"),
-            total_drivers=Count("driver_id", distinct=True),
-        )
-
         # Get driver ratings for the day
-        from apps.drivers.models import DriverRating
+        start_date, end_date = day_bounds(report_date)
         ratings = DriverRating.objects.filter(
             created_at__gte=start_date,
-            created_at__lte=end_date,
+            created_at__lt=end_date,
         )
+        rating_stats = ratings.aggregate(avg=Avg("rating"), count=Count("id"))
+
+        by_driver = total_trip_rollups(rows, key=lambda row: row.driver_id)
+        top_drivers = sorted(
+            ((driver_id, driver) for driver_id, driver in by_driver.items() if driver["trip_count"]),
+            key=lambda item: item[1]["trip_count"],
+            reverse=True,
+        )[:10]
+        driver_ids = [driver_id for driver_id, _ in top_drivers]
+        drivers = Driver.objects.select_related("user").in_bulk(driver_ids)
+        driver_ratings = {
+            row["driver_id"]: row["avg"]
+            for row in ratings.filter(driver_id__in=driver_ids).values("driver_id").annotate(avg=Avg("rating")).order_by()
+        }
 
-        # Calculate average rating
-        avg_rating = ratings.aggregate(avg=Avg("rating"))["avg"] or 0
-
-        # Find top drivers
-        top_drivers = trips.values(
-            "driver_id",
-            "driver__user__first_name",
-            "driver__user__last_name",
-            "driver__user__email",
-        ).annotate(
-            trip_count=Count("id"),
-            total_distance=Sum("distance"),
-            total_passengers=Sum("max_passengers"),
-            avg_speed=Avg("average_speed"),
-        ).order_by("-trip_count")[:10]
-
-        # Get ratings for top drivers
-        driver_ids = [driver["driver_id"] for driver in top_drivers]
-        driver_ratings = {}
-
-        for rating in ratings.filter(driver_id__in=driver_ids):
-            driver_id = rating.driver_id
-            if driver_id not in driver_ratings:
-                driver_ratings[driver_id] = {
-                    "count": 0,
-                    "total": 0,
-                }
-
-            driver_ratings[driver_id]["count"] += 1
-            driver_ratings[driver_id]["total"] += rating.rating
+        def driver_name(driver_id):
+            driver = drivers.get(driver_id)
+            if driver is None:
+                return None
+            user = driver.user
+            return f"{user.first_name} {user.last_name}".strip() or user.email
 
         return {
             "date": report_date.isoformat(),
-            "total_trips": total_trips,
-            "total_drivers": stats["total_drivers"] or 0,
-            "total_distance": stats["total_distance"] or 0,
-            "average_rating": avg_rating,
-            "total_ratings": ratings.count(),
+            "total_trips": totals["trip_count"],
+            "total_drivers": len(totals["driver_ids"]),
+            "total_distance": float(totals["total_distance"]),
+            "average_rating": rating_stats["avg"] or 0,
+            "total_ratings": rating_stats["count"],
             "top_drivers": [
                 {
-                    "driver_id": driver["driver_id"],
-                    "name": f"{driver['driver__user__first_name']} {driver['driver__user__last_name']}".strip() or
-                            driver["driver__user__email"],
+                    "driver_id": str(driver_id),
+                    "name": driver_name(driver_id),
                     "trip_count": driver["trip_count"],
-                    "total_distance": driver["total_distance"] or 0,
-                    "total_passengers": driver["total_passengers"] or 0,
-                    "average_speed": driver["avg_speed"] or 0,
-                    "rating": (
-                            driver_ratings.get(driver["driver_id"], {}).get("total", 0) /
-                            driver_ratings.get(driver["driver_id"], {}).get("count", 1)
-                    ) if driver["driver_id"] in driver_ratings else None,
+                    "total_distance": float(driver["total_distance"]),
+                    "total_passengers": driver["total_passengers"],
+                    "average_speed": driver["average_speed"] or 0,
+                    "rating": driver_ratings.get(driver_id),
                 }
-                for driver in top_drivers
+                for driver_id, driver in top_drivers
             ],
         }
 
@@ -378,26 +312,23 @@ def generate_driver_performance_report(report_date):
 
 def generate_line_performance_report(report_date):
     """
-    Generate line performance report for a specific date.
+    Generate line performance report for a specific date from the trip rollups.
     """
     try:
-        # Define date range
-        start_date = timezone.datetime.combine(report_date, timezone.time.min)
-        end_date = timezone.datetime.combine(report_date, timezone.time.max)
-
-        # Get trips
-        from apps.tracking.models import Trip
-        trips = Trip.objects.filter(
-            start_time__gte=start_date,
-            start_time__lte=end_date,
-        )
+        from apps.lines.models import Line
+        from apps.tracking.rollups import get_trip_rollups, total_trip_rollups
 
-        # Calculate statistics
-        from django.db.models import Avg, Count, Max, Min, Sum
-
-        total_trips = trips.count()
+        by_line = total_trip_rollups(
+            get_trip_rollups(report_date, report_date),
+            key=lambda row: row.line_id,
+        )
+        line_stats = sorted(
+            ((line_id, line) for line_id, line in by_line.items() if line["trip_count"]),
+            key=lambda item: item[1]["trip_count"],
+            reverse=True,
+        )
 
-        if total_trips == 0:
+        if not line_stats:
             return {
                 "date": report_date.isoformat(),
                 "total_trips": 0,
@@ -405,55 +336,26 @@ def generate_line_performance_report(report_date):
                 "line_stats": [],
             }
 
-        # Get line stats
-        line_stats = trips.values(
-            "line_id",
-            "line__code",
-            "line__name",
-        ).annotate(
-            trip_count=Count("id"),
-            bus_count=Count("bus_id", distinct=True),
-            driver_count=Count("driver_id", distinct=True),
-            total_distance=Sum("distance"),
-            total_passengers=Sum("max_passengers"),
-            avg_speed=Avg("average_speed"),
-        ).order_by("-trip_count")
-
-        # Get anomalies by line
-        from apps.tracking.models import Anomaly
-        anomalies = Anomaly.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date,
-            trip__isnull=False,
-        )
-
-        line_anomalies = {}
-
-        for anomaly in anomalies:
-            line_id = anomaly.trip.line_id
-            if line_id not in line_anomalies:
-                line_anomalies[line_id] = 0
-
-            line_anomalies[line_id] += 1
+        lines = Line.objects.in_bulk([line_id for line_id, _ in line_stats])
 
         return {
             "date": report_date.isoformat(),
-            "total_trips": total_trips,
-            "total_lines": line_stats.count(),
+            "total_trips": sum(line["trip_count"] for _, line in line_stats),
+            "total_lines": len(line_stats),
             "line_stats": [
                 {
-                    "line_id": line["line_id"],
-                    "code": line["line__code"],
-                    "name": line["line__name"],
+                    "line_id": str(line_id),
+                    "code": lines[line_id].code if line_id in lines else None,
+                    "name": lines[line_id].name if line_id in lines else None,
                     "trip_count": line["trip_count"],
-                    "bus_count": line["bus_count"],
-                    "driver_count": line["driver_count"],
-                    "total_distance": line["total_distance"] or 0,
-                    "total_passengers": line["total_passengers"] or 0,
-                    "average_speed": line["avg_speed"] or 0,
-                    "anomalies": line_anomalies.get(line["line_id"], 0),
+                    "bus_count": len(line["bus_ids"]),
+                    "driver_count": len(line["driver_ids"]),
+                    "total_distance": float(line["total_distance"]),
+                    "total_passengers": line["total_passengers"],
+                    "average_speed": line["average_speed"] or 0,
+                    "anomalies": line["anomaly_count"],
                 }
-                for line in line_stats
+                for line_id, line in line_stats
             ],
         }
 
@@ -482,10 +384,12 @@ def save_reports(report_date, passenger_report, bus_report, driver_report, line_
         import json
 
         # Convert to JSON
-        report_json = json.dumps(combined_report, indent=2)
+        report_json = json.dumps(combined_report, separators=(",", ":"))
 
-        # Save to file in media directory
+        # Save to file in media directory, replacing an earlier run for the day
         file_path = f"reports/{report_date.strftime('%Y-%m-%d')}_daily_report.json"
+        if default_storage.exists(file_path):
+            default_storage.delete(file_path)
         default_storage.save(file_path, ContentFile(report_json.encode('utf-8')))
 
         logger.info(f"Saved daily reports to {file_path}")
@@ -493,4 +397,13 @@ def save_reports(report_date, passenger_report, bus_report, driver_report, line_
 
     except Exception as e:
         logger.error(f"Error saving reports: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+# Reports of the daily chord, in the order save_reports takes them
+REPORT_GENERATORS = {
+    "passenger": generate_passenger_report,
+    "bus": generate_bus_performance_report,
+    "driver": generate_driver_performance_report,
+    "line": generate_line_performance_report,
+}
@@ -125,18 +125,18 @@ def calculate_eta():
                 continue
 
             # Get line stops
-            from apps.lines.selectors import get_stops_by_line
-            stops = get_stops_by_line(bus_line.line_id)
+            from apps.lines.topology import get_line_topology
+            topology = get_line_topology(bus_line.line_id)
 
             # Calculate ETA for each stop
-            for stop in stops:
+            for stop_id, (stop_lat, stop_lon) in zip(topology.stop_ids, topology.coordinates):
                 from apps.core.utils.geo import calculate_eta
 
                 eta = calculate_eta(
                     float(location.latitude),
                     float(location.longitude),
-                    float(stop.latitude),
-                    float(stop.longitude),
+                    stop_lat,
+                    stop_lon,
                     float(location.speed) if location.speed else None,
                 )
 
@@ -144,7 +144,7 @@ def calculate_eta():
                     # Store ETA in cache
                     from django.core.cache import cache
 
-                    cache_key = f"eta:{bus_line.bus_id}:{stop.id}"
+                    cache_key = f"eta:{bus_line.bus_id}:{stop_id}"
                     cache.set(cache_key, eta.isoformat(), 300)  # 5 minutes
 
         logger.info(f"Calculated ETA for {bus_lines.count()} active buses")
@@ -3,16 +3,22 @@ Comprehensive JWT authentication and security testing for DZ Bus Tracker.
 Tests all authentication flows, JWT token handling, and security measures.
 """
 import pytest
+from asgiref.sync import async_to_sync
 from datetime import timedelta
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.test import APIClient
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.tokens import RefreshToken, AccessToken, UntypedToken
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 from django.contrib.auth import get_user_model
 from django.core import mail
 from unittest.mock import patch
 
+from apps.accounts.authentication import CachedJWTAuthentication, aget_token_user
 from apps.accounts.models import Profile
 from apps.drivers.models import Driver
 
@@ -295,6 +301,69 @@ class TestJWTAuthentication:
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@pytest.mark.django_db
+class TestCachedTokenUser:
+    """Test the token user cache shared by HTTP and WebSocket auth."""
+    
+    def setup_method(self):
+        """Set up a user and an access token."""
+        self.user = User.objects.create_user(
+            email='cached@example.com',
+            password='testpass123',
+            user_type='passenger'
+        )
+        self.token = AccessToken.for_user(self.user)
+    
+    def test_http_auth_reads_cached_user(self):
+        """Test that a repeated token is resolved without a query."""
+        with override_settings(CACHES=LOCMEM_CACHES):
+            auth = CachedJWTAuthentication()
+            assert auth.get_user(self.token) == self.user
+            
+            with CaptureQueriesContext(connection) as queries:
+                assert auth.get_user(self.token) == self.user
+            assert len(queries) == 0
+    
+    def test_websocket_auth_shares_cache(self):
+        """Test that the WebSocket path reuses the HTTP cache entry."""
+        with override_settings(CACHES=LOCMEM_CACHES):
+            CachedJWTAuthentication().get_user(self.token)
+            
+            with CaptureQueriesContext(connection) as queries:
+                user = async_to_sync(aget_token_user)(UntypedToken(str(self.token)))
+            assert user == self.user
+            assert len(queries) == 0
+    
+    def test_deactivation_revokes_cached_user(self):
+        """Test that deactivating a user stops both paths at once."""
+        with override_settings(CACHES=LOCMEM_CACHES):
+            auth = CachedJWTAuthentication()
+            auth.get_user(self.token)
+            
+            self.user.is_active = False
+            self.user.save()
+            
+            with pytest.raises(AuthenticationFailed):
+                auth.get_user(self.token)
+            assert async_to_sync(aget_token_user)(UntypedToken(str(self.token))) is None
+    
+    def test_me_reflects_update(self):
+        """Test that GET /me after a PATCH shows the new values, not the cached user."""
+        with override_settings(CACHES=LOCMEM_CACHES):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+            assert client.get('/api/v1/accounts/users/me/').status_code == status.HTTP_200_OK
+            
+            response = client.patch('/api/v1/accounts/users/me/', {'first_name': 'Renamed'}, format='json')
+            assert response.status_code == status.HTTP_200_OK
+            
+            response = client.get('/api/v1/accounts/users/me/')
+            assert response.data['first_name'] == 'Renamed'
+
+
 @pytest.mark.django_db
 class TestUserRegistrationLogin:
     """Test user registration and login flows."""